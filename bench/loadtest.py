@@ -0,0 +1,353 @@
+"""
+Load test: replays EA traffic against a locally started server.
+
+Seeds N receivers (tokens + subscription to farm_robot) into a fresh SQLite file
+(or a throwaway Postgres with --database-url ... --wipe), starts uvicorn on
+main:app with the SQL profiler header on, then for --duration seconds runs:
+
+  * M receiver EAs polling /signals/latest?since_id=... every --poll-interval
+    (optionally long-polling with --wait-sec) and /auth/verify every
+    --verify-every polls
+  * one publisher posting /signals/publish at --publish-rate per second, plus a
+    --burst of signals every --bar-sec (market open / bar close)
+
+Reports per-endpoint throughput, p50/p95/p99 latency, SQL statements per
+request (X-SQL-Profile) and publish-to-delivery lag, and writes everything as
+JSON (--out) tagged with the git commit so runs can be compared.
+
+    python bench/loadtest.py --users 2000 --pollers 100 --duration 60 --out run.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import secrets
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_TOKEN = "loadtest-admin"
+SENDER = "farm_robot"
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def summarize(values: List[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    def r(v):
+        return None if v is None else round(v * scale, 3)
+    return {
+        "count": len(values),
+        "mean": r(sum(values) / len(values)) if values else None,
+        "p50": r(percentile(values, 50)),
+        "p95": r(percentile(values, 95)),
+        "p99": r(percentile(values, 99)),
+        "max": r(max(values)) if values else None,
+    }
+
+
+def parse_profile(header: Optional[str]) -> Dict[str, float]:
+    out = {}
+    for part in (header or "").split(";"):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            try:
+                out[k.strip()] = float(v)
+            except ValueError:
+                pass
+    return out
+
+
+# ---------- Seeding ----------
+def seed(database_url: str, users: int, plan: str, wipe: bool) -> Dict[str, object]:
+    """Create the schema and bulk-insert farm_robot plus `users` receivers. Returns tokens."""
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import insert
+    from database import Base, engine
+    import models
+
+    if wipe:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    expires = now + timedelta(days=30)
+    sender_token = secrets.token_urlsafe(32)
+    receiver_tokens = [secrets.token_urlsafe(32) for _ in range(users)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": 1, "username": SENDER, "email": None, "plan": "gold", "is_active": True,
+             "created_at": now, "updated_at": now}
+        ] + [
+            {"id": i + 2, "username": f"ea{i}", "email": f"ea{i}@loadtest.local", "plan": plan,
+             "is_active": True, "created_at": now, "updated_at": now}
+            for i in range(users)
+        ])
+        conn.execute(insert(models.APIToken), [
+            {"token": sender_token, "user_id": 1, "plan": "gold", "is_active": True,
+             "created_at": now, "expires_at": expires}
+        ] + [
+            {"token": t, "user_id": i + 2, "plan": plan, "is_active": True,
+             "created_at": now, "expires_at": expires}
+            for i, t in enumerate(receiver_tokens)
+        ])
+        conn.execute(insert(models.Subscription), [
+            {"receiver_id": i + 2, "sender_id": 1} for i in range(users)
+        ])
+    engine.dispose()
+    return {"sender": sender_token, "receivers": receiver_tokens}
+
+
+# ---------- Server ----------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url: str, port: int, workers: int, workdir: str, extra_env: Dict[str, str]):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "ADMIN_TOKEN": ADMIN_TOKEN,
+        "SQL_PROFILE": "1",
+        "SQL_PROFILE_HEADER": "1",
+        "SQL_PROFILE_SLOW_MS": "1000000",  # keep the server log quiet
+        "SWEEPER_LOCK_DIR": workdir,
+        "SIGNAL_BUS_SOCKET_DIR": os.path.join(workdir, "bus"),
+    })
+    if workers > 1:
+        env.setdefault("SIGNAL_BUS", "unix")
+    env.update(extra_env)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            if requests.get(base + "/health", timeout=1).ok:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not come up")
+
+
+# ---------- Traffic ----------
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.statements: Dict[str, List[float]] = defaultdict(list)
+        self.db_ms: Dict[str, List[float]] = defaultdict(list)
+        self.status: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.lag: List[float] = []
+        self.published = 0
+        self.delivered = 0
+
+    def request(self, name: str, elapsed: float, status: int, headers) -> None:
+        prof = parse_profile(headers.get("X-SQL-Profile") if headers is not None else None)
+        with self.lock:
+            self.latency[name].append(elapsed)
+            self.status[name][str(status)] += 1
+            if "count" in prof:
+                self.statements[name].append(prof["count"])
+                self.db_ms[name].append(prof.get("db_ms", 0.0))
+
+
+def publisher(base: str, token: str, rec: Recorder, stop: threading.Event, rate: float, burst: int, bar_sec: float):
+    s = requests.Session()
+    h = {"Authorization": f"Bearer {token}"}
+    symbols = ["EURUSD", "GBPUSD", "USDJPY", "XAUUSD", "AUDUSD", "USDCAD", "NZDUSD", "USDCHF"]
+    next_bar = time.time() + bar_sec if burst else None
+    interval = 1.0 / rate if rate > 0 else None
+    next_tick = time.time()
+
+    def post(symbol: str):
+        body = {"symbol": symbol, "action": random.choice(["buy", "sell"]), "lot_size": 0.1,
+                "details": {"t": time.time()}}
+        t0 = time.perf_counter()
+        try:
+            r = s.post(base + "/signals/publish", json=body, headers=h, timeout=30)
+            rec.request("POST /signals/publish", time.perf_counter() - t0, r.status_code, r.headers)
+            if r.ok:
+                with rec.lock:
+                    rec.published += 1
+        except requests.RequestException:
+            rec.request("POST /signals/publish", time.perf_counter() - t0, 0, None)
+
+    while not stop.is_set():
+        now = time.time()
+        if next_bar is not None and now >= next_bar:
+            for i in range(burst):
+                post(symbols[i % len(symbols)])
+            next_bar += bar_sec
+        if interval is not None and now >= next_tick:
+            post(random.choice(symbols))
+            next_tick += interval
+        stop.wait(0.005)
+
+
+def poller(base: str, token: str, rec: Recorder, stop: threading.Event, poll_interval: float,
+           wait_sec: Optional[int], verify_every: int):
+    s = requests.Session()
+    h = {"Authorization": f"Bearer {token}"}
+    cursor = None
+    polls = 0
+    stop.wait(random.uniform(0, poll_interval))  # spread the herd
+    while not stop.is_set():
+        params = {"limit": 50}
+        if cursor is not None:
+            params["since_id"] = cursor
+        if wait_sec:
+            params["wait_sec"] = wait_sec
+        t0 = time.perf_counter()
+        try:
+            r = s.get(base + "/signals/latest", params=params, headers=h, timeout=(wait_sec or 0) + 30)
+            elapsed = time.perf_counter() - t0
+            rec.request("GET /signals/latest", elapsed, r.status_code, r.headers)
+            if r.ok:
+                items = r.json().get("items") or []
+                now = time.time()
+                if cursor is None:
+                    # First poll sets the cursor; history published before we started isn't "delivered"
+                    cursor = max([i["id"] for i in items], default=0)
+                elif items:
+                    cursor = max(cursor, max(i["id"] for i in items))
+                    with rec.lock:
+                        rec.delivered += len(items)
+                        for i in items:
+                            t = (i.get("details") or {}).get("t")
+                            if isinstance(t, (int, float)):
+                                rec.lag.append(now - t)
+        except requests.RequestException:
+            rec.request("GET /signals/latest", time.perf_counter() - t0, 0, None)
+        polls += 1
+        if verify_every and polls % verify_every == 0:
+            t0 = time.perf_counter()
+            try:
+                r = s.get(base + "/auth/verify", headers=h, timeout=30)
+                rec.request("GET /auth/verify", time.perf_counter() - t0, r.status_code, r.headers)
+            except requests.RequestException:
+                rec.request("GET /auth/verify", time.perf_counter() - t0, 0, None)
+        if not wait_sec:
+            stop.wait(poll_interval)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=1000, help="receivers to seed")
+    ap.add_argument("--pollers", type=int, default=50, help="concurrent receiver EAs (<= users)")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds of traffic")
+    ap.add_argument("--poll-interval", type=float, default=1.0)
+    ap.add_argument("--wait-sec", type=int, default=None, help="long-poll instead of fixed-interval polling")
+    ap.add_argument("--verify-every", type=int, default=10, help="call /auth/verify every N polls (0: never)")
+    ap.add_argument("--publish-rate", type=float, default=2.0, help="steady signals per second")
+    ap.add_argument("--burst", type=int, default=20, help="extra signals fired every --bar-sec")
+    ap.add_argument("--bar-sec", type=float, default=10.0)
+    ap.add_argument("--plan", default="gold", choices=["free", "silver", "gold"], help="receivers' plan")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    ap.add_argument("--database-url", default=None, help="throwaway DB (requires --wipe); default: temp SQLite")
+    ap.add_argument("--wipe", action="store_true", help="drop all tables in --database-url first")
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra server env")
+    ap.add_argument("--out", default=None, help="write results JSON here")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    if args.database_url:
+        if not args.wipe:
+            ap.error("--database-url is wiped before seeding; pass --wipe to confirm")
+        database_url = args.database_url
+    else:
+        database_url = f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+
+    print(f"seeding {args.users} users into {database_url}", file=sys.stderr)
+    tokens = seed(database_url, args.users, args.plan, wipe=bool(args.database_url))
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+    proc, base = start_server(database_url, free_port(), args.workers, workdir, extra_env)
+
+    rec = Recorder()
+    stop = threading.Event()
+    threads = [threading.Thread(
+        target=publisher, args=(base, tokens["sender"], rec, stop, args.publish_rate, args.burst, args.bar_sec),
+        daemon=True)]
+    for tok in random.sample(tokens["receivers"], min(args.pollers, len(tokens["receivers"]))):
+        threads.append(threading.Thread(
+            target=poller, args=(base, tok, rec, stop, args.poll_interval, args.wait_sec, args.verify_every),
+            daemon=True))
+    try:
+        print(f"running {len(threads) - 1} pollers + publisher for {args.duration:.0f}s", file=sys.stderr)
+        t_start = time.time()
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join((args.wait_sec or 0) + 35)
+        elapsed = time.time() - t_start
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    endpoints = {}
+    for name, lat in sorted(rec.latency.items()):
+        endpoints[name] = {
+            "requests": len(lat),
+            "throughput_rps": round(len(lat) / elapsed, 2),
+            "status": dict(rec.status[name]),
+            "latency_ms": summarize(lat),
+            "sql_statements_per_request": summarize(rec.statements[name], scale=1.0),
+            "sql_ms_per_request": summarize(rec.db_ms[name], scale=1.0),
+        }
+    result = {
+        "commit": git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "database": database_url.split("@")[-1],
+        "elapsed_sec": round(elapsed, 2),
+        "signals_published": rec.published,
+        "signals_delivered": rec.delivered,
+        "publish_to_delivery_lag_ms": summarize(rec.lag),
+        "endpoints": endpoints,
+    }
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""
+Micro-benchmarks for crud's hot functions on bulk-generated datasets.
+
+For each --scales factor a fresh database is generated at that fraction of the
+production-sized target (scale 1.0 = 100k users, 10M trade_signals, 50M
+signal_reads), then each function is timed over --iterations calls in a
+rolled-back transaction, so every call sees the same data:
+
+    verify_token (cold / cached), load_auth_context, count_reads_today,
+    get_signals_for_receiver_since (recent cursor: ring buffer; deep: SQL),
+    the same inside the inbox window and create_signal, in read and inbox mode,
+    record_signal_read, purge_expired_tokens, upsert_active_token
+
+The report gives latency and SQL statements per call at each scale, plus a
+growth exponent per function between the smallest and largest scale
+(log t2/t1 over log n2/n1): ~0 is flat, ~1 means the call is O(table size).
+Anything above --flag-exponent is flagged.
+
+    python bench/microbench.py --scales 0.001,0.01,0.1 --out micro.json
+    python bench/microbench.py --scales 0.1,1 --database-url postgresql+psycopg2://.../bench --wipe
+
+Data is loaded with the driver's bulk path (executemany on SQLite, COPY on
+Postgres), not the ORM.
+"""
+import os
+import io
+import sys
+import csv
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TARGET = {"users": 100_000, "signals": 10_000_000, "reads": 50_000_000}
+SENDERS = 10           # users 1..SENDERS publish; every receiver follows farm_robot (id 1) + one more
+EXPIRED_FRACTION = 0.05
+TODAY_READ_FRACTION = 0.05
+CHUNK = 20_000
+INBOX_DAYS = 1         # signal_inbox is filled for the newest day of signals (its retention window)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def token_for(uid: int) -> str:
+    return f"bench-token-{uid:08d}"
+
+
+def token_hash(uid: int) -> str:
+    return hashlib.sha256(token_for(uid).encode("utf-8")).hexdigest()
+
+
+# ---------- Bulk loading ----------
+def _sqlite_value(v):
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M:%S.%f")  # SQLAlchemy's SQLite DATETIME format
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, dict):
+        return json.dumps(v)
+    return v
+
+
+def _chunks(rows: Iterable[Sequence], n: int) -> Iterator[List[Sequence]]:
+    buf = []
+    for r in rows:
+        buf.append(r)
+        if len(buf) >= n:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def bulk_load(engine, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    n = 0
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        if engine.dialect.name == "postgresql":
+            for chunk in _chunks(rows, CHUNK):
+                buf = io.StringIO()
+                w = csv.writer(buf)
+                for r in chunk:
+                    w.writerow([json.dumps(v) if isinstance(v, dict) else ("" if v is None else v) for v in r])
+                buf.seek(0)
+                cur.copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+                n += len(chunk)
+        else:
+            sql = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({','.join('?' * len(columns))})"
+            for chunk in _chunks(rows, CHUNK):
+                cur.executemany(sql, [[_sqlite_value(v) for v in r] for r in chunk])
+                n += len(chunk)
+        raw.commit()
+    finally:
+        raw.close()
+    return n
+
+
+def generate(engine, scale: float, seed: int = 7) -> Dict[str, int]:
+    """Create the schema and fill it at `scale` x TARGET. Returns row counts."""
+    from models import Base  # importing models registers its tables on Base
+
+    rnd = random.Random(seed)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as c:
+            c.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    n_users = max(SENDERS + 10, int(TARGET["users"] * scale))
+    n_signals = max(100, int(TARGET["signals"] * scale))
+    n_reads = max(100, int(TARGET["reads"] * scale))
+    now = utc_now()
+    month = timedelta(days=30)
+    counts = {}
+
+    counts["users"] = bulk_load(engine, "users", ["id", "username", "email", "is_active", "plan", "created_at", "updated_at"], (
+        (uid, "farm_robot" if uid == 1 else f"u{uid}", f"u{uid}@bench.local", True,
+         "gold" if uid <= SENDERS else rnd.choice(("free", "silver", "gold")), now, now)
+        for uid in range(1, n_users + 1)
+    ))
+
+    def token_rows():
+        for uid in range(1, n_users + 1):
+            expired = uid > SENDERS and rnd.random() < EXPIRED_FRACTION
+            expires = now - timedelta(hours=1) if expired else now + month
+            yield (token_for(uid), uid, "silver", True, now - month, expires)
+    counts["api_tokens"] = bulk_load(engine, "api_tokens", ["token", "user_id", "plan", "is_active", "created_at", "expires_at"], token_rows())
+
+    def subscription_rows():
+        for uid in range(SENDERS + 1, n_users + 1):
+            yield (uid, 1)
+            yield (uid, rnd.randint(2, SENDERS))
+    counts["subscriptions"] = bulk_load(engine, "subscriptions", ["receiver_id", "sender_id"], subscription_rows())
+
+    # Signals: ids in time order over the last 30 days, spread over the senders
+    step = month / n_signals
+    start = now - month
+    actions = ("buy", "sell", "buy", "sell", "close", "adjust_sl")
+    counts["trade_signals"] = bulk_load(engine, "trade_signals", ["id", "user_id", "symbol", "action", "lot_size", "details", "created_at"], (
+        (sid, 1 if sid % 2 else rnd.randint(2, SENDERS), "EURUSD", rnd.choice(actions), 0.1, {}, start + step * sid)
+        for sid in range(1, n_signals + 1)
+    ))
+
+    # Reads: each receiver read a run of consecutive signals (unique per receiver/token)
+    receivers = n_users - SENDERS
+    per = max(1, n_reads // receivers)
+
+    def read_rows():
+        for uid in range(SENDERS + 1, n_users + 1):
+            th = token_hash(uid)
+            first = rnd.randint(1, max(1, n_signals - per))
+            today = rnd.random() < TODAY_READ_FRACTION
+            for sid in range(first, min(n_signals, first + per - 1) + 1):
+                read_at = now - timedelta(minutes=rnd.randint(1, 600)) if today else start + step * sid
+                yield (sid, uid, th, read_at)
+    counts["signal_reads"] = bulk_load(engine, "signal_reads", ["signal_id", "receiver_id", "token_hash", "read_at"], read_rows())
+
+    # Inbox mode: the fan-out a day of publishes would have written, in one INSERT ... SELECT
+    inbox_floor = max(1, n_signals - int(n_signals * INBOX_DAYS / 30))
+    with engine.begin() as c:
+        counts["signal_inbox"] = c.exec_driver_sql(
+            "INSERT INTO signal_inbox (receiver_id, signal_id) "
+            "SELECT s.receiver_id, t.id FROM subscriptions s JOIN trade_signals t ON t.user_id = s.sender_id "
+            f"WHERE t.id >= {inbox_floor}"
+        ).rowcount
+
+    import crud
+    from sqlalchemy.orm import Session
+    with Session(engine) as db:
+        counts["signal_read_counters"] = crud.reconcile_read_counters(db)
+        db.commit()
+    with engine.connect() as c:
+        if engine.dialect.name == "postgresql":
+            for t in ("users", "trade_signals"):
+                c.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), (SELECT max(id) FROM {t}))")
+        c.exec_driver_sql("ANALYZE")
+        c.commit()
+    counts["n_signals"] = n_signals
+    counts["inbox_floor"] = inbox_floor
+    counts["n_users"] = n_users
+    return counts
+
+
+# ---------- Timing ----------
+class StatementCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.n = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *a):
+        self.n += 1
+
+
+def time_calls(engine, counter: StatementCounter, fn: Callable, iterations: int, setup: Optional[Callable] = None):
+    """fn(db, i) in its own transaction, rolled back afterwards."""
+    from sqlalchemy.orm import Session
+    samples, stmts = [], []
+    for i in range(iterations):
+        db = Session(engine)
+        try:
+            if setup:
+                setup(db, i)
+            before = counter.n
+            t0 = time.perf_counter()
+            fn(db, i)
+            samples.append(time.perf_counter() - t0)
+            stmts.append(counter.n - before)
+        finally:
+            db.rollback()
+            db.close()
+    samples.sort()
+    return {
+        "calls": iterations,
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6, 1),
+        "statements": round(sum(stmts) / len(stmts), 2),
+    }
+
+
+def run_benchmarks(engine, sizes: Dict[str, int], iterations: int, seed: int = 11) -> Dict[str, dict]:
+    import singleflight
+
+    # Each case times one uncoalesced call: with coalescing on, consecutive iterations
+    # inside the singleflight window would share one result and time the cache
+    enabled = singleflight.ENABLED
+    singleflight.ENABLED = False
+    try:
+        return _run_benchmarks(engine, sizes, iterations, seed)
+    finally:
+        singleflight.ENABLED = enabled
+
+
+def _run_benchmarks(engine, sizes: Dict[str, int], iterations: int, seed: int) -> Dict[str, dict]:
+    import crud
+    import caches
+    import fanout
+    import singleflight
+    from signal_buffer import signal_buffer
+    from models import User
+
+    rnd = random.Random(seed)
+    counter = StatementCounter(engine)
+    n_users, n_signals = sizes["n_users"], sizes["n_signals"]
+    receivers = [rnd.randint(SENDERS + 1, n_users) for _ in range(iterations)]
+
+    def user(db, i) -> User:
+        # Also used as the (untimed) setup, so inside fn this is an identity-map hit
+        return db.get(User, receivers[i])
+
+    def clear_caches(db, i):
+        caches.token_cache.clear()
+        caches.subscription_cache.clear()
+
+    out = {}
+    out["verify_token_cold"] = time_calls(
+        engine, counter, lambda db, i: crud.verify_token(db, token_for(receivers[i])), iterations, clear_caches)
+    out["verify_token_cached"] = time_calls(
+        engine, counter, lambda db, i: crud.verify_token(db, token_for(receivers[i])), iterations,
+        lambda db, i: crud.verify_token(db, token_for(receivers[i])))
+    out["load_auth_context_cold"] = time_calls(
+        engine, counter, lambda db, i: crud.load_auth_context(db, token_for(receivers[i])), iterations, clear_caches)
+    out["count_reads_today"] = time_calls(
+        engine, counter, lambda db, i: crud.count_reads_today(db, user(db, i), token_hash(receivers[i])), iterations, user)
+    # Recent cursors are answered by the ring buffer, deep ones fall back to SQL. The
+    # buffer is only used with a cross-worker bus; in this single process the
+    # in-process bus does see every publish
+    from sqlalchemy.orm import Session
+    cross_worker = fanout.signal_bus.cross_worker
+    fanout.signal_bus.cross_worker = True
+    with Session(engine) as db:
+        signal_buffer.invalidate()
+        crud.warm_signal_buffer(db)
+    out["get_signals_since_recent"] = time_calls(
+        engine, counter, lambda db, i: crud.get_signals_for_receiver_since(
+            db, user(db, i), limit=50, since_id=n_signals - 20), iterations, user)
+    out["get_signals_since_deep"] = time_calls(
+        engine, counter, lambda db, i: crud.get_signals_for_receiver_since(
+            db, user(db, i), limit=50, since_id=n_signals // 2), iterations, user)
+    # The same deep query answered by coalescing (an identical one ran within the window)
+    singleflight.ENABLED = True
+    try:
+        out["get_signals_since_deep_coalesced"] = time_calls(
+            engine, counter, lambda db, i: crud.get_signals_for_receiver_since(
+                db, user(db, i), limit=50, since_id=n_signals // 2), iterations, user)
+    finally:
+        singleflight.ENABLED = False
+    # Fan-out-on-read vs fan-out-on-write (SIGNAL_DELIVERY_MODE) for a cursor inside the
+    # inbox window, and the publish cost each mode pays. At small scales that cursor is
+    # still within the ring buffer, which would answer both from memory: keep it out
+    fanout.signal_bus.cross_worker = False
+    window_since = (sizes["inbox_floor"] + n_signals) // 2
+    sender = 1 + rnd.randrange(SENDERS)
+    mode = crud.DELIVERY_MODE
+    try:
+        for m in ("read", "inbox"):
+            crud.DELIVERY_MODE = m
+            out[f"get_signals_window_{m}"] = time_calls(
+                engine, counter, lambda db, i: crud.get_signals_for_receiver_since(
+                    db, user(db, i), limit=50, since_id=window_since), iterations, user)
+            out[f"create_signal_{m}"] = time_calls(
+                engine, counter, lambda db, i: crud.create_signal(
+                    db, db.get(User, sender), "EURUSD", "buy", lot_size=0.1), iterations,
+                lambda db, i: db.get(User, sender))
+    finally:
+        crud.DELIVERY_MODE = mode
+        fanout.signal_bus.cross_worker = cross_worker
+    out["record_signal_read"] = time_calls(
+        engine, counter, lambda db, i: crud.record_signal_read(
+            db, n_signals - (i % 20), user(db, i), token_hash(receivers[i])), iterations, user)
+    out["purge_expired_tokens"] = time_calls(
+        engine, counter, lambda db, i: crud.purge_expired_tokens(db), max(3, iterations // 20))
+    out["upsert_active_token"] = time_calls(
+        engine, counter, lambda db, i: crud.upsert_active_token(db, user(db, i), plan="gold", rotate=True), iterations, user)
+    signal_buffer.invalidate()
+    return out
+
+
+def growth(results: List[dict], flag: float) -> Dict[str, dict]:
+    """Exponent of mean latency vs trade_signals size between the smallest and largest scale."""
+    if len(results) < 2:
+        return {}
+    lo, hi = results[0], results[-1]
+    n_ratio = hi["rows"]["trade_signals"] / lo["rows"]["trade_signals"]
+    out = {}
+    for name, r in hi["functions"].items():
+        t1, t2 = lo["functions"][name]["mean_us"], r["mean_us"]
+        k = math.log(t2 / t1) / math.log(n_ratio) if t1 > 0 and t2 > 0 and n_ratio > 1 else None
+        out[name] = {"exponent": None if k is None else round(k, 3), "flagged": k is not None and k > flag}
+    return out
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="0.001,0.01", help="comma-separated fractions of the 100k/10M/50M target")
+    ap.add_argument("--iterations", type=int, default=200)
+    ap.add_argument("--database-url", default=None, help="throwaway DB (requires --wipe); default: temp SQLite per scale")
+    ap.add_argument("--wipe", action="store_true", help="allow dropping all tables in --database-url")
+    ap.add_argument("--flag-exponent", type=float, default=0.3)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+    if args.database_url and not args.wipe:
+        ap.error("--database-url is wiped for every scale; pass --wipe to confirm")
+
+    workdir = tempfile.mkdtemp(prefix="microbench-")
+    os.environ.setdefault("DATABASE_URL", args.database_url or f"sqlite:///{os.path.join(workdir, 'import.db')}")
+    from sqlalchemy import create_engine
+
+    results = []
+    for scale in sorted(float(s) for s in args.scales.split(",")):
+        url = args.database_url or f"sqlite:///{os.path.join(workdir, f'bench-{scale}.db')}"
+        engine = create_engine(url)
+        t0 = time.perf_counter()
+        rows = generate(engine, scale)
+        gen_sec = time.perf_counter() - t0
+        print(f"scale {scale}: generated {rows} in {gen_sec:.1f}s", file=sys.stderr)
+        functions = run_benchmarks(engine, rows, args.iterations)
+        results.append({"scale": scale, "rows": rows, "generate_sec": round(gen_sec, 1), "functions": functions})
+        for name, r in functions.items():
+            print(f"  {name:28s} {r['mean_us']:>10.1f} us  {r['statements']:>5} stmts", file=sys.stderr)
+        engine.dispose()
+        if not args.database_url:
+            os.unlink(url[len("sqlite:///"):])
+
+    report = {
+        "commit": git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(),
+        "database": (args.database_url or "sqlite").split("@")[-1],
+        "iterations": args.iterations,
+        "results": results,
+        "growth": growth(results, args.flag_exponent),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# In-process caches shared by crud and main. Every uvicorn worker keeps its own
+# copy, so TTLs bound how long another worker's write can go unnoticed. Token
+# rotations/downgrades are also broadcast over a cross-worker fan-out bus
+# (SIGNAL_BUS=unix|postgres); with the default in-process bus another worker keeps
+# accepting a rotated token, at its old plan, for up to TOKEN_CACHE_TTL_SEC.
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU map whose entries also expire after `ttl` seconds.
+    Thread-safe (sync endpoints run in the threadpool) and keeps hit/miss counters.
+    ttl <= 0 disables the cache: get() always misses and set() stores nothing.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            deadline, value = item
+            if deadline <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(float(ttl), self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which predicate(key, value) is true; returns how many."""
+        with self._lock:
+            doomed = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in doomed:
+                del self._data[k]
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_sec": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+# ---------- Token verification ----------
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Detached copy of the User columns request handlers read after auth."""
+    id: int
+    username: str
+    email: Optional[str]
+    plan: str
+    is_active: bool
+
+
+@dataclass(frozen=True)
+class CachedToken:
+    user: UserSnapshot
+    plan: str
+    expires_at: Optional[datetime]  # naive UTC, same as the column
+
+
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_MAXSIZE", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL_SEC", "10")),
+)
+
+
+def invalidate_tokens(tokens) -> None:
+    for t in tokens:
+        token_cache.pop(t)
+
+
+def invalidate_user_tokens(user_id: int) -> int:
+    return token_cache.discard_where(lambda _k, v: v.user.id == user_id)
+
+
+# ---------- Subscriptions & sender names ----------
+# receiver_id -> frozenset(sender_ids)
+subscription_cache = TTLCache(
+    maxsize=int(os.getenv("SUBSCRIPTION_CACHE_MAXSIZE", "50000")),
+    ttl=float(os.getenv("SUBSCRIPTION_CACHE_TTL_SEC", "60")),
+)
+
+# lower(username) -> user id, or 0 for "no such user" (ids start at 1)
+sender_id_cache = TTLCache(maxsize=64, ttl=float(os.getenv("SUBSCRIPTION_CACHE_TTL_SEC", "60")))
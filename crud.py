@@ -1,21 +1,34 @@
 import secrets
 import hashlib
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Tuple, List, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import User, APIToken, TradeSignal, Subscription, SignalRead, TradeRecord
+from typing import Optional, Tuple, List, Dict, Any, FrozenSet
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, event, select, literal
+from models import User, APIToken, TradeSignal, Subscription, SignalRead, SignalReadCounter, SignalInbox, TradeRecord, WPCallback
 from sqlalchemy import text
 import os
 import logging
 from sqlalchemy import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import caches
+import fanout
+import payloads
+import metrics
+import wp_outbox
+import singleflight
+from notifier import signal_notifier
+from signal_buffer import SignalSnapshot, signal_buffer
+from caches import CachedToken, UserSnapshot
 # ---------- Plans & quotas ----------
+# rate_per_sec/burst: per-token request rate (see ratelimit.TokenBucketLimiter, opt-in);
+# EAs poll about once a second plus the odd verify/trade call, so even free has ~5x headroom
 PLAN_DEFAULTS = {
-    "free":   {"daily_quota": 1, "unlimited": False},
-    "silver": {"daily_quota": 3, "unlimited": False},
-    "gold":   {"daily_quota": None, "unlimited": True},
+    "free":   {"daily_quota": 1, "unlimited": False, "rate_per_sec": 5, "burst": 30},
+    "silver": {"daily_quota": 3, "unlimited": False, "rate_per_sec": 5, "burst": 30},
+    "gold":   {"daily_quota": None, "unlimited": True, "rate_per_sec": 10, "burst": 60},
 }
 
 # ---------- Helpers ----------
@@ -40,6 +53,37 @@ def plan_limits(plan: str) -> Dict[str, Any]:
 def hash_token_for_read(token: str) -> str:
     return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
+# ---------- Post-commit hooks ----------
+def on_commit(db: Session, fn) -> None:
+    """Run fn() once the session's current transaction commits; dropped on rollback."""
+    db.info.setdefault("after_commit", []).append(fn)
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for fn in session.info.pop("after_commit", []):
+        try:
+            fn()
+        except Exception:
+            logging.exception("after_commit hook failed")
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session: Session) -> None:
+    session.info.pop("after_commit", None)
+    session.info.pop("announce_signals", None)
+
+def _invalidate_user_tokens(db: Session, user_id: int) -> None:
+    # Drop now, and again after commit so a concurrent miss can't re-cache the old row;
+    # other workers hear about it over a cross-worker bus (else within TOKEN_CACHE_TTL_SEC)
+    caches.invalidate_user_tokens(user_id)
+    def committed():
+        caches.invalidate_user_tokens(user_id)
+        fanout.invalidate_user_tokens([user_id])
+    on_commit(db, committed)
+
+def _invalidate_tokens(db: Session, tokens: List[str]) -> None:
+    caches.invalidate_tokens(tokens)
+    on_commit(db, lambda: caches.invalidate_tokens(tokens))
+
 # ---------- Users & tokens ----------
 def get_user_by_identity(db: Session, user_id: Optional[int], username: Optional[str], email: Optional[str]) -> Optional[User]:
     q = db.query(User)
@@ -69,6 +113,8 @@ def ensure_user(db: Session, user_id: Optional[int], username: Optional[str], em
     )
     db.add(u)
     db.flush()
+    # A cached "no such sender" for this name is now wrong
+    _invalidate_sender_name(db, name)
     return u
 
 def generate_token() -> str:
@@ -83,6 +129,8 @@ def upsert_active_token(db: Session, user: User, plan: Optional[str] = None, rot
       * Mirror user.api_key for legacy display only (not used for auth).
     """
     plan_norm = normalize_plan(plan or user.plan)
+    # Plan, token and user.plan may all change below; cached verifications are stale
+    _invalidate_user_tokens(db, user.id)
     active = db.query(APIToken).filter(
         APIToken.user_id == user.id,
         APIToken.is_active == True
@@ -126,72 +174,162 @@ def upsert_active_token(db: Session, user: User, plan: Optional[str] = None, rot
         db.flush()
         return new_tok, rotated or True
 
-def verify_token(db: Session, api_key: str) -> Tuple[bool, Optional[User], Dict[str, Any]]:
+def _snapshot_user(user: User) -> UserSnapshot:
+    return UserSnapshot(
+        id=user.id, username=user.username, email=user.email,
+        plan=user.plan, is_active=bool(user.is_active),
+    )
+
+def verify_token(db: Session, api_key: str) -> Tuple[bool, Optional[UserSnapshot], Dict[str, Any]]:
+    """
+    Resolve a bearer token to its owner. Positive results are cached in-process
+    (caches.token_cache) until the TTL or the token's own expires_at, whichever is first;
+    rotation and purge invalidate them. The returned user is a detached UserSnapshot.
+    """
     now = utc_now()
-    tok = db.query(APIToken).filter(
-        APIToken.token == api_key,
-        APIToken.is_active == True,
-        (APIToken.expires_at == None) | (APIToken.expires_at > now)
-    ).first()
-    if tok and tok.user and tok.user.is_active:
-        limits = plan_limits(tok.plan)
+    cached = caches.token_cache.get(api_key)
+    if cached is None:
+        tok = db.query(APIToken).options(joinedload(APIToken.user)).filter(
+            APIToken.token == api_key,
+            APIToken.is_active == True,
+            (APIToken.expires_at == None) | (APIToken.expires_at > now)
+        ).first()
+        if tok and tok.user:
+            cached = CachedToken(user=_snapshot_user(tok.user), plan=tok.plan, expires_at=tok.expires_at)
+            ttl = (tok.expires_at - now).total_seconds() if tok.expires_at else None
+            caches.token_cache.set(api_key, cached, ttl=ttl)
+
+    if (cached and cached.user.is_active
+            and (cached.expires_at is None or cached.expires_at > now)):
+        limits = plan_limits(cached.plan)
         expires_iso = (
-            tok.expires_at.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-            if tok.expires_at else None
+            cached.expires_at.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
+            if cached.expires_at else None
         )
-        return True, tok.user, {"plan": tok.plan, **limits, "expires_at": expires_iso}
+        return True, cached.user, {"plan": cached.plan, **limits, "expires_at": expires_iso}
 
     return False, None, {"reason": "invalid_or_expired_token"}
 
 
 def purge_expired_tokens(db: Session) -> int:
     """
-    Delete all tokens whose expires_at <= now.
-    If a user ends up with no active token, downgrade to free and clear legacy api_key.
-    Returns the number of tokens deleted.
+    Delete all tokens whose expires_at <= now in one set-based DELETE ... RETURNING.
+    Users left without a live token are downgraded to free (legacy api_key cleared)
+    by a single UPDATE. Returns the number of tokens deleted.
+    Runs from the background sweeper (sweeper.PeriodicJob), never on the request path.
     """
     now = utc_now()
-    expired = db.query(APIToken).filter(APIToken.expires_at <= now).all()
-    if not expired:
+    tokens = APIToken.__table__
+    users = User.__table__
+    expired_q = tokens.c.expires_at <= now
+
+    if db.bind.dialect.delete_returning:
+        rows = db.execute(
+            tokens.delete().where(expired_q).returning(tokens.c.token, tokens.c.user_id)
+        ).all()
+    else:
+        rows = db.execute(select(tokens.c.token, tokens.c.user_id).where(expired_q)).all()
+        if rows:
+            db.execute(tokens.delete().where(expired_q))
+    if not rows:
         return 0
-    affected_user_ids = {t.user_id for t in expired}
-    for t in expired:
-        db.delete(t)
-    db.flush()
+    _invalidate_tokens(db, [r.token for r in rows])
 
-    # For any affected user without an active (non-expired) token, reset plan/api_key
-    for uid in affected_user_ids:
-        has_active = db.query(APIToken).filter(
-            APIToken.user_id == uid,
-            APIToken.is_active == True,
-            APIToken.expires_at > now
-        ).first()
-        if not has_active:
-            u = db.query(User).filter(User.id == uid).first()
-            if u:
-                u.plan = "free"
-                u.api_key = None
-                u.updated_at = now
-    return len(expired)
+    live = select(tokens.c.id).where(
+        tokens.c.user_id == users.c.id,
+        tokens.c.is_active == True,
+        (tokens.c.expires_at == None) | (tokens.c.expires_at > now),
+    )
+    db.execute(
+        users.update()
+        .where(users.c.id.in_({r.user_id for r in rows}), ~live.exists())
+        .values(plan="free", api_key=None, updated_at=now)
+    )
+    return len(rows)
+
+def _invalidate_sender_name(db: Session, username: str) -> None:
+    key = username.strip().lower()
+    caches.sender_id_cache.pop(key)
+    on_commit(db, lambda: caches.sender_id_cache.pop(key))
+
+def _invalidate_subscriptions(db: Session, receiver_id: int) -> None:
+    caches.subscription_cache.pop(receiver_id)
+    on_commit(db, lambda: caches.subscription_cache.pop(receiver_id))
+
+def resolve_sender_id(db: Session, username: Optional[str] = None) -> Optional[int]:
+    """
+    Id of the user named `username` (default DEFAULT_SIGNAL_SENDER / 'farm_robot'),
+    case-insensitive. Cached, including misses; ensure_user invalidates the name.
+    """
+    key = (username or os.getenv("DEFAULT_SIGNAL_SENDER", "farm_robot")).strip().lower()
+    cached = caches.sender_id_cache.get(key)
+    if cached is None:
+        row = db.query(User.id).filter(func.lower(User.username) == key).first()
+        cached = row[0] if row else 0
+        caches.sender_id_cache.set(key, cached)
+    return cached or None
+
+def add_subscription(db: Session, receiver_id: int, sender_id: int) -> bool:
+    """Subscribe receiver to sender if not already; returns True if a row was added."""
+    exists = db.query(Subscription.id).filter(
+        Subscription.receiver_id == receiver_id,
+        Subscription.sender_id == sender_id
+    ).first()
+    if exists:
+        return False
+    db.add(Subscription(receiver_id=receiver_id, sender_id=sender_id))
+    db.flush()
+    _invalidate_subscriptions(db, receiver_id)
+    if DELIVERY_MODE == "inbox":
+        _backfill_inbox(db, receiver_id, sender_id)
+    return True
 
 def ensure_subscription_to_sender(db: Session, receiver: User, sender_username: str = None) -> None:
     """
     Make sure `receiver` is subscribed to `sender_username` (default from env or 'farm_robot').
     No-op if sender missing or already subscribed or same user.
     """
-    sender_username = sender_username or os.getenv("DEFAULT_SIGNAL_SENDER", "farm_robot")
-    sender = db.query(User).filter(func.lower(User.username) == func.lower(sender_username)).first()
-    if not sender or sender.id == receiver.id:
+    sender_id = resolve_sender_id(db, sender_username)
+    if not sender_id or sender_id == receiver.id:
         return
-    exists = db.query(Subscription).filter(
-        Subscription.receiver_id == receiver.id,
-        Subscription.sender_id == sender.id
-    ).first()
-    if not exists:
-        db.add(Subscription(receiver_id=receiver.id, sender_id=sender.id))
-        db.flush()
+    add_subscription(db, receiver.id, sender_id)
+
+# ---------- Activations ----------
+def active_users_page(db: Session, after_id: int = 0, limit: int = 500) -> Tuple[List[User], Optional[int]]:
+    """One keyset page of active users by id. Returns (users, next_cursor or None)."""
+    rows = (
+        db.query(User)
+        .filter(User.is_active == True, User.id > after_id)
+        .order_by(User.id)
+        .limit(limit + 1)
+        .all()
+    )
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+def iter_active_users(db: Session, after_id: int = 0, batch: int = 1000):
+    """
+    Active users ordered by id as lightweight rows, fetched through a server-side
+    cursor `batch` rows at a time, so a full export runs in constant memory.
+    """
+    stmt = (
+        select(User.id, User.username, User.email, User.plan, User.api_key, User.is_active)
+        .where(User.is_active == True, User.id > after_id)
+        .order_by(User.id)
+        .execution_options(yield_per=batch)
+    )
+    yield from db.execute(stmt)
 
 # ---------- Signals ----------
+# How polls that miss the ring buffer find a receiver's signals:
+#   read  (default) fan-out-on-read: trade_signals WHERE user_id IN (senders) ORDER BY id
+#   inbox           fan-out-on-write: publishing also writes one SignalInbox row per
+#                   subscriber and the poll is a PK range scan on (receiver_id, signal_id).
+#                   Publish cost grows with the sender's subscriber count.
+# Switching back to inbox after running in read mode leaves a gap: empty signal_inbox first.
+DELIVERY_MODE = "inbox" if os.getenv("SIGNAL_DELIVERY_MODE", "read").strip().lower() == "inbox" else "read"
+
 def create_signal(
     db: Session, sender: User, symbol: str, action: str,
     sl_pips=None, tp_pips=None, lot_size=None, details=None
@@ -204,23 +342,188 @@ def create_signal(
     )
     db.add(sig)
     db.flush()
+    if DELIVERY_MODE == "inbox":
+        _fan_out_to_inbox(db, sender.id, [sig.id])
+    _announce_on_commit(db, [SignalSnapshot.from_row(sig)])
     return sig
 
-def get_latest_signals_for_receiver(db: Session, receiver: User, limit: int = 20) -> List[TradeSignal]:
+def create_signals(db: Session, sender: User, items: List[Dict[str, Any]]) -> List[SignalSnapshot]:
+    """
+    Insert many signals for one sender with a single multi-row INSERT ... RETURNING
+    (ids come back in input order). Announced together after commit, like create_signal.
+    items: dicts with create_signal's keyword arguments.
+    """
+    if not items:
+        return []
+    now = utc_now()
+    rows = [
+        {
+            "user_id": sender.id, "symbol": it["symbol"], "action": it["action"],
+            "sl_pips": it.get("sl_pips"), "tp_pips": it.get("tp_pips"),
+            "lot_size": (float(it["lot_size"]) if it.get("lot_size") is not None else None),
+            "details": it.get("details") or {}, "created_at": now,
+        }
+        for it in items
+    ]
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        # insertmanyvalues: batched multi-row INSERT ... RETURNING matched back to input order
+        ids = db.execute(
+            insert(TradeSignal).returning(TradeSignal.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    elif dialect == "sqlite":
+        # SQLAlchemy has no ordering sentinel for SQLite and would go row by row; one
+        # VALUES statement assigns rowids in row order (writers are serialized)
+        ids = sorted(db.execute(insert(TradeSignal).values(rows).returning(TradeSignal.id)).scalars().all())
+    else:
+        # No ordered RETURNING for executemany (e.g. MySQL): ORM flush, one INSERT per row
+        objs = [TradeSignal(**r) for r in rows]
+        db.add_all(objs)
+        db.flush()
+        ids = [o.id for o in objs]
+    if DELIVERY_MODE == "inbox":
+        _fan_out_to_inbox(db, sender.id, ids)
+    snaps = [SignalSnapshot(id=i, **r) for i, r in zip(ids, rows)]
+    _announce_on_commit(db, snaps)
+    return snaps
+
+def _inbox_insert(db: Session, select_stmt):
+    tbl = SignalInbox.__table__
+    dialect = db.bind.dialect.name
+    stmt = (pg_insert if dialect == "postgresql" else sqlite_insert if dialect == "sqlite" else insert)(tbl)
+    stmt = stmt.from_select(["receiver_id", "signal_id"], select_stmt)
+    if dialect in ("postgresql", "sqlite"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=["receiver_id", "signal_id"])
+    return db.execute(stmt)
+
+def _fan_out_to_inbox(db: Session, sender_id: int, signal_ids: List[int]) -> None:
+    """One INSERT ... SELECT from subscriptions: an inbox row per (subscriber, new signal)."""
+    _inbox_insert(db, select(Subscription.receiver_id, TradeSignal.id)
+                  .join(TradeSignal, TradeSignal.user_id == Subscription.sender_id)
+                  .where(Subscription.sender_id == sender_id, TradeSignal.id.in_(signal_ids)))
+
+def _backfill_inbox(db: Session, receiver_id: int, sender_id: int) -> None:
+    # A new subscription gets the sender's signals the inbox still covers, so deep
+    # cursors see the same history as in read mode
+    floor = inbox_floor(db)
+    if floor is None:
+        return
+    _inbox_insert(db, select(literal(receiver_id, SignalInbox.receiver_id.type), TradeSignal.id)
+                  .where(TradeSignal.user_id == sender_id, TradeSignal.id >= floor))
+
+def inbox_floor(db: Session) -> Optional[int]:
+    """
+    Oldest signal id in signal_inbox (None if empty). Every signal from there on has
+    been fanned out, so cursors at or past floor - 1 can be answered from the inbox.
+    """
+    return db.query(func.min(SignalInbox.signal_id)).scalar()
+
+def _announce_on_commit(db: Session, snaps: List[SignalSnapshot]) -> None:
+    """
+    Queue freshly flushed signals for publication once the transaction commits:
+    they go into this worker's ring buffer, then fanout.announce wakes local waiters
+    and sends one bus message for however many signals the transaction published.
+    """
+    pending = db.info.get("announce_signals")
+    if pending is None:
+        pending = db.info["announce_signals"] = []
+        on_commit(db, lambda: _publish_committed(db.info.pop("announce_signals", [])))
+    pending.extend(snaps)
+
+def _publish_committed(snaps: List[SignalSnapshot]) -> None:
+    signal_buffer.add_many(snaps)
+    payloads.warm(snaps)  # encode once, before any waiter is woken
+    metrics.signals_published.inc(len(snaps))
+    fanout.announce([(s.user_id, s.id) for s in snaps])
+
+def latest_signal_ids(db: Session) -> Dict[int, int]:
+    """Newest signal id per sender, used to seed the in-process notifier."""
+    rows = db.query(TradeSignal.user_id, func.max(TradeSignal.id)).group_by(TradeSignal.user_id).all()
+    return {uid: mid for uid, mid in rows}
+
+def latest_signal_id(db: Session, sender_ids: FrozenSet[int]) -> int:
+    """Newest signal id from any of sender_ids (0 if none)."""
+    if not sender_ids:
+        return 0
+    return db.query(func.max(TradeSignal.id)).filter(TradeSignal.user_id.in_(list(sender_ids))).scalar() or 0
+
+def get_sender_ids_for_receiver(db: Session, receiver: User) -> FrozenSet[int]:
+    """Senders the receiver subscribes to; cached per receiver (caches.subscription_cache)."""
+    sender_ids = caches.subscription_cache.get(receiver.id)
+    if sender_ids is None:
+        sender_ids = frozenset(
+            sid for (sid,) in db.query(Subscription.sender_id).filter(Subscription.receiver_id == receiver.id)
+        )
+        caches.subscription_cache.set(receiver.id, sender_ids)
+    return sender_ids
+
+def warm_signal_buffer(db: Session) -> None:
+    """Load the newest SIGNAL_BUFFER_PER_SENDER signals of every sender into the ring buffer."""
+    rows_by_sender = {}
+    for sender_id in latest_signal_ids(db):
+        rows = (db.query(TradeSignal)
+                  .filter(TradeSignal.user_id == sender_id)
+                  .order_by(TradeSignal.id.desc())
+                  .limit(signal_buffer.capacity).all())
+        rows_by_sender[sender_id] = list(reversed(rows))
+    signal_buffer.warm(rows_by_sender)
+
+def _sync_signal_buffer(db: Session, sender_ids: FrozenSet[int]) -> bool:
+    """
+    Bring the ring buffer up to date for sender_ids; False if it can't be trusted.
+    With the in-process bus other workers' publishes never reach it, so only SQL is
+    complete. Otherwise: check the id range that arrived since the last check
+    against the DB (a signal another worker committed may not have been announced
+    yet; one primary-key range scan per new batch of ids, not per poll), then fetch
+    whatever the buffer is missing.
+    """
+    if not fanout.signal_bus.cross_worker:
+        return False
+    if not signal_buffer.warmed:
+        warm_signal_buffer(db)
+    gap = signal_buffer.unsettled()
+    if gap is not None:
+        settled, top = gap
+        signal_buffer.note_remote(
+            db.query(TradeSignal.user_id, TradeSignal.id)
+              .filter(TradeSignal.id > settled, TradeSignal.id <= top).all()
+        )
+        signal_buffer.settle(top)
+    missing = signal_buffer.missing_ids(sender_ids)
+    if missing:
+        signal_buffer.fill(db.query(TradeSignal).filter(TradeSignal.id.in_(missing)).all(), missing)
+    return True
+
+def get_latest_signals_for_receiver(db: Session, receiver: User, limit: int = 20) -> List[SignalSnapshot]:
     # If subscriptions exist, only from those senders; else return empty
-    subs = db.query(Subscription).filter(Subscription.receiver_id == receiver.id).all()
-    if not subs:
-        default_sender_name = os.getenv("DEFAULT_SIGNAL_SENDER", "farm_robot")
-        default_sender = db.query(User).filter(func.lower(User.username) == func.lower(default_sender_name)).first()
-        if not default_sender:
+    sender_ids = get_sender_ids_for_receiver(db, receiver)
+    if not sender_ids:
+        default_sender_id = resolve_sender_id(db)
+        if not default_sender_id:
             return []
-        sender_ids = [default_sender.id]
-    else:
-        sender_ids = [s.sender_id for s in subs]
+        sender_ids = frozenset((default_sender_id,))
+    if _sync_signal_buffer(db, sender_ids):
+        hit = signal_buffer.latest(sender_ids, limit)
+        if hit is not None:
+            return hit
     q = db.query(TradeSignal).filter(
-        TradeSignal.user_id.in_(sender_ids)
+        TradeSignal.user_id.in_(list(sender_ids))
     ).order_by(TradeSignal.id.desc()).limit(limit)
-    return list(reversed(q.all()))  # ascending delivery
+    return [SignalSnapshot.from_row(r) for r in reversed(q.all())]  # ascending delivery
+
+def replica_if_caught_up(db: Session, read_db: Optional[Session], need_id: int) -> Session:
+    """
+    read_db if the replica has applied trade_signals up to need_id (one max(id)
+    lookup there), else the primary session db. No replica configured: db.
+    """
+    if read_db is None or read_db.get_bind() is db.get_bind():
+        return db
+    applied = read_db.query(func.max(TradeSignal.id)).scalar() or 0
+    if applied >= need_id:
+        return read_db
+    read_db.rollback()
+    metrics.replica_fallbacks.inc(1, "lag")
+    return db
 
 def get_signals_for_receiver_since(
     db: Session,
@@ -228,13 +531,73 @@ def get_signals_for_receiver_since(
     limit: int = 20,
     since_id: Optional[int] = None,
     min_created_at: Optional[datetime] = None,
-) -> List[TradeSignal]:
-    subs = db.query(Subscription).filter(Subscription.receiver_id == receiver.id).all()
-    if not subs:
+    sender_ids: Optional[FrozenSet[int]] = None,
+    read_db: Optional[Session] = None,
+    watermark: Optional[int] = None,
+) -> List[SignalSnapshot]:
+    """
+    Signals from the receiver's senders after since_id / newer than min_created_at,
+    ascending. Served from the in-memory ring buffer when it provably covers the
+    range (only with a cross-worker fan-out bus); SQL otherwise (e.g. a since_id older than the buffer), from signal_inbox
+    in inbox mode when the cursor is within what the inbox still holds.
+    The SQL runs on read_db (a replica session) unless it is behind since_id or the
+    newest signal known from those senders; then on db. watermark is that newest id
+    if the caller already read it (e.g. from the DB for an ETag), else the notifier's.
+    """
+    if sender_ids is None:
+        sender_ids = get_sender_ids_for_receiver(db, receiver)
+    if not sender_ids:
         return []
-    sender_ids = [s.sender_id for s in subs]
 
-    q = db.query(TradeSignal).filter(TradeSignal.user_id.in_(sender_ids))
+    if _sync_signal_buffer(db, sender_ids):
+        hit = signal_buffer.query(sender_ids, since_id, min_created_at, limit)
+        if hit is not None:
+            return hit
+
+    if watermark is None:
+        watermark = signal_notifier.latest_id(sender_ids)
+    db = replica_if_caught_up(db, read_db, max(since_id or 0, watermark))
+
+    if DELIVERY_MODE == "inbox" and since_id:
+        floor = inbox_floor(db)
+        if floor is not None and since_id >= floor - 1:
+            q = (db.query(TradeSignal)
+                   .join(SignalInbox, SignalInbox.signal_id == TradeSignal.id)
+                   .filter(SignalInbox.receiver_id == receiver.id, SignalInbox.signal_id > since_id))
+            if min_created_at is not None:
+                q = q.filter(TradeSignal.created_at >= min_created_at)
+            q = q.order_by(SignalInbox.signal_id.asc()).limit(limit)
+            return [SignalSnapshot.from_row(r) for r in q.all()]
+
+    if not singleflight.ENABLED:
+        return _signals_since_query(db, sender_ids, limit, since_id, min_created_at)
+
+    # Receivers with the same senders and cursor share one query (singleflight). The
+    # age cut-off is rounded down so their keys match, then applied exactly per caller;
+    # the watermark in the key keeps a result from outliving a newer publish. When rows
+    # between the rounded and the exact cut-off filled the shared page, the filtered
+    # page may be missing newer rows: that caller runs its own exact query.
+    bucket = None
+    if min_created_at is not None:
+        step = singleflight.AGE_BUCKET_SEC
+        bucket = datetime.fromtimestamp(
+            min_created_at.replace(tzinfo=timezone.utc).timestamp() // step * step, timezone.utc
+        ).replace(tzinfo=None)
+    key = (sender_ids, since_id or 0, limit, bucket, watermark)
+    items, _ = singleflight.signal_queries.do(
+        key, lambda: _signals_since_query(db, sender_ids, limit, since_id, bucket)
+    )
+    if min_created_at is not None:
+        exact = [s for s in items if s.created_at >= min_created_at]
+        if len(exact) < limit <= len(items):
+            return _signals_since_query(db, sender_ids, limit, since_id, min_created_at)
+        items = exact
+    return list(items)
+
+def _signals_since_query(
+    db: Session, sender_ids: FrozenSet[int], limit: int, since_id: Optional[int], min_created_at: Optional[datetime]
+) -> List[SignalSnapshot]:
+    q = db.query(TradeSignal).filter(TradeSignal.user_id.in_(list(sender_ids)))
     if since_id is not None and since_id > 0:
         q = q.filter(TradeSignal.id > since_id)
     if min_created_at is not None:
@@ -242,56 +605,253 @@ def get_signals_for_receiver_since(
 
     # Ascending so clients can process in order
     q = q.order_by(TradeSignal.id.asc()).limit(limit)
-    return q.all()
+    return [SignalSnapshot.from_row(r) for r in q.all()]
 
 def count_reads_today(db: Session, receiver: User, token_hash: Optional[str] = None) -> int:
-    sod = start_of_utc_day()
-    q = (db.query(SignalRead)
-           .join(TradeSignal, TradeSignal.id == SignalRead.signal_id)
-           .filter(
-                SignalRead.receiver_id == receiver.id,
-                SignalRead.read_at >= sod,
-                TradeSignal.action.in_(("buy", "sell"))
-           ))
+    """
+    Today's quota usage from the materialized counters: a primary-key lookup when
+    token_hash is given, otherwise the sum over the receiver's tokens.
+    """
+    q = db.query(func.coalesce(func.sum(SignalReadCounter.reads), 0)).filter(
+        SignalReadCounter.receiver_id == receiver.id,
+        SignalReadCounter.day == start_of_utc_day().date(),
+    )
     if token_hash:
-        q = q.filter(SignalRead.token_hash == token_hash)
-    return q.count()
+        q = q.filter(SignalReadCounter.token_hash == token_hash)
+    return int(q.scalar() or 0)
 
-def record_signal_read(db: Session, signal_id: int, receiver: User, token_hash: str) -> None:
+def _bump_read_counter(db: Session, receiver_id: int, token_hash: Optional[str], read_at: datetime, n: int = 1) -> None:
+    tbl = SignalReadCounter.__table__
+    key = {"receiver_id": receiver_id, "token_hash": token_hash or "", "day": read_at.date()}
+    dialect = db.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        ins = (pg_insert if dialect == "postgresql" else sqlite_insert)(tbl).values(**key, reads=n)
+        db.execute(ins.on_conflict_do_update(
+            index_elements=["receiver_id", "token_hash", "day"],
+            set_={"reads": tbl.c.reads + ins.excluded.reads},
+        ))
+        return
+    res = db.execute(
+        tbl.update()
+        .where(tbl.c.receiver_id == key["receiver_id"], tbl.c.token_hash == key["token_hash"], tbl.c.day == key["day"])
+        .values(reads=tbl.c.reads + n)
+    )
+    if not res.rowcount:
+        db.execute(insert(tbl).values(**key, reads=n))
+
+def record_signal_reads(db: Session, signal_ids: List[int], receiver: User, token_hash: str) -> int:
     """
-    Idempotent 'read' accounting for quota. Never raises on duplicate.
-    Works across Postgres/MySQL/SQLite (uses ON CONFLICT only when available).
-    """
-    values = {
-        "signal_id": signal_id,
-        "receiver_id": receiver.id,
-        "token_hash": token_hash,
-        "read_at": utc_now(),  # Python UTC timestamp (DB-agnostic)
-    }
+    Batch 'read' accounting for one poll: a single multi-row
+    INSERT ... ON CONFLICT DO NOTHING (Postgres/SQLite), so duplicates are skipped
+    without disturbing anything else in the session. Other dialects insert row by
+    row inside SAVEPOINTs. Bumps today's SignalReadCounter by the number of new
+    rows and returns it. Callers only pass BUY/SELL signal ids.
+    """
+    ids = list(dict.fromkeys(signal_ids))
+    if not ids:
+        return 0
+    now = utc_now()  # Python UTC timestamp (DB-agnostic)
+    rows = [
+        {"signal_id": sid, "receiver_id": receiver.id, "token_hash": token_hash, "read_at": now}
+        for sid in ids
+    ]
     tbl = SignalRead.__table__
+    dialect = db.bind.dialect.name
 
-    # Prefer native Postgres ON CONFLICT when available
-    try:
-        if db.bind.dialect.name == "postgresql":
-            stmt = pg_insert(tbl).values(**values).on_conflict_do_nothing(
-                index_elements=["signal_id", "receiver_id", "token_hash"]
-            )
-            db.execute(stmt)
-            return
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (pg_insert if dialect == "postgresql" else sqlite_insert)(tbl).values(rows).on_conflict_do_nothing(
+            index_elements=["signal_id", "receiver_id", "token_hash"]
+        )
+        inserted = max(db.execute(stmt).rowcount or 0, 0)
+    else:
+        inserted = 0
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(tbl).values(**row))
+                inserted += 1
+            except IntegrityError:
+                pass  # duplicate; only this savepoint is rolled back
 
-        # Generic path: try once, ignore duplicate via IntegrityError
-        stmt = insert(tbl).values(**values)
-        try:
-            db.execute(stmt)
-        except IntegrityError:
-            db.rollback()  # duplicate; ignore
+    if inserted:
+        _bump_read_counter(db, receiver.id, token_hash, now, inserted)
+    return inserted
+
+def record_signal_read(db: Session, signal_id: int, receiver: User, token_hash: str) -> None:
+    """
+    Idempotent 'read' accounting for quota. Never raises on duplicate.
+    Single-row form of record_signal_reads.
+    """
+    try:
+        record_signal_reads(db, [signal_id], receiver, token_hash)
     except Exception:
         logging.exception("record_signal_read failed")
         # Let caller decide to rollback/continue
 
+def reconcile_read_counters(db: Session, day: Optional[datetime] = None) -> int:
+    """
+    Rebuild one UTC day's SignalReadCounter rows (default: today) from signal_reads,
+    e.g. after a crash between a read insert and its counter bump. Counters older
+    than yesterday are dropped since the quota only looks at today.
+    Returns the number of counter rows written.
+    """
+    sod = start_of_utc_day(day)
+    counters = SignalReadCounter.__table__
+    db.execute(counters.delete().where(counters.c.day < (sod - timedelta(days=1)).date()))
+    db.execute(counters.delete().where(counters.c.day == sod.date()))
+
+    token_key = func.coalesce(SignalRead.token_hash, "")
+    rebuilt = (
+        select(SignalRead.receiver_id, token_key, literal(sod.date(), counters.c.day.type), func.count())
+        .join(TradeSignal, TradeSignal.id == SignalRead.signal_id)
+        .where(
+            SignalRead.read_at >= sod,
+            SignalRead.read_at < sod + timedelta(days=1),
+            TradeSignal.action.in_(("buy", "sell")),
+        )
+        .group_by(SignalRead.receiver_id, token_key)
+    )
+    res = db.execute(counters.insert().from_select(["receiver_id", "token_hash", "day", "reads"], rebuilt))
+    return max(res.rowcount or 0, 0)
+
+# ---------- Auth context ----------
+@dataclass(frozen=True)
+class AuthContext:
+    """What an endpoint needs to know about a bearer-token caller, resolved once per request."""
+    token: str
+    token_hash: str
+    user: UserSnapshot
+    plan: str
+    daily_quota: Optional[int]
+    unlimited: bool
+    expires_at: Optional[datetime]  # naive UTC
+    sender_ids: FrozenSet[int]      # subscriptions (receivers)
+    used_today: int                 # quota consumed today by this token
+
+    @property
+    def remaining_today(self) -> Optional[int]:
+        """None for unlimited plans."""
+        if self.unlimited or self.daily_quota is None:
+            return None
+        return max(0, int(self.daily_quota) - self.used_today)
+
+def _parse_id_list(value) -> FrozenSet[int]:
+    # array_agg (Postgres) gives a list, group_concat (SQLite/MySQL) a comma string
+    if value is None:
+        return frozenset()
+    if isinstance(value, (list, tuple)):
+        return frozenset(int(v) for v in value if v is not None)
+    return frozenset(int(v) for v in str(value).split(",") if v)
+
+def load_auth_context(db: Session, token: str, refill_cache: bool = True) -> Optional[AuthContext]:
+    """
+    Resolve a bearer token to an AuthContext, or None if it is unknown, inactive,
+    expired or belongs to an inactive user.
+
+    With the token and subscription caches warm this costs at most the
+    signal_read_counters primary-key lookup (nothing for unlimited plans). Otherwise
+    a single statement fetches the token, its user, the user's subscription sender
+    ids and today's used count (correlated scalar subqueries, which Postgres and
+    SQLite both plan as index lookups), and refills both caches unless refill_cache
+    is False (lookups on a replica, which may still show a revoked token).
+    """
+    now = utc_now()
+    token_hash = hash_token_for_read(token)
+    today = start_of_utc_day(now).date()
+
+    cached = caches.token_cache.get(token)
+    sender_ids = caches.subscription_cache.get(cached.user.id) if cached else None
+    if cached is not None and sender_ids is not None:
+        used = 0 if plan_limits(cached.plan)["unlimited"] else count_reads_today(db, cached.user, token_hash)
+    else:
+        counters = SignalReadCounter.__table__
+        agg = func.array_agg if db.bind.dialect.name == "postgresql" else func.group_concat
+        senders_q = (select(agg(Subscription.sender_id))
+                     .where(Subscription.receiver_id == User.id)
+                     .scalar_subquery())
+        used_q = (select(counters.c.reads)
+                  .where(counters.c.receiver_id == User.id,
+                         counters.c.token_hash == token_hash,
+                         counters.c.day == today)
+                  .scalar_subquery())
+        row = db.execute(
+            select(
+                APIToken.plan, APIToken.expires_at,
+                User.id.label("user_id"), User.username, User.email,
+                User.plan.label("user_plan"), User.is_active,
+                senders_q.label("sender_ids"), used_q.label("used"),
+            )
+            .join_from(APIToken, User, APIToken.user_id == User.id)
+            .where(
+                APIToken.token == token,
+                APIToken.is_active == True,
+                (APIToken.expires_at == None) | (APIToken.expires_at > now),
+            )
+        ).first()
+        if row is None:
+            return None
+        cached = CachedToken(
+            user=UserSnapshot(id=row.user_id, username=row.username, email=row.email,
+                              plan=row.user_plan, is_active=bool(row.is_active)),
+            plan=row.plan,
+            expires_at=row.expires_at,
+        )
+        sender_ids = _parse_id_list(row.sender_ids)
+        if refill_cache:
+            caches.token_cache.set(token, cached, ttl=(row.expires_at - now).total_seconds() if row.expires_at else None)
+            caches.subscription_cache.set(row.user_id, sender_ids)
+        used = int(row.used or 0)
+
+    if not cached.user.is_active or (cached.expires_at is not None and cached.expires_at <= now):
+        return None
+    limits = plan_limits(cached.plan)
+    return AuthContext(
+        token=token,
+        token_hash=token_hash,
+        user=cached.user,
+        plan=cached.plan,
+        daily_quota=limits["daily_quota"],
+        unlimited=bool(limits["unlimited"]),
+        expires_at=cached.expires_at,
+        sender_ids=sender_ids,
+        used_today=used,
+    )
+
+# ---------- WordPress callbacks ----------
+def enqueue_wp_callback(db: Session, user: User, token: APIToken) -> Optional[WPCallback]:
+    """
+    Queue the WP notification for the user's current token in the caller's
+    transaction (outbox); wp_outbox delivers it after commit. Earlier undelivered
+    rows for the user are superseded, since each payload carries the full state.
+    No-op when WP_CALLBACK_URL/WP_CALLBACK_KEY are not configured.
+    """
+    if not os.getenv("WP_CALLBACK_URL") or not os.getenv("WP_CALLBACK_KEY"):
+        return None
+    db.query(WPCallback).filter(
+        WPCallback.user_id == user.id, WPCallback.status == "pending"
+    ).update({WPCallback.status: "superseded"}, synchronize_session=False)
+    cb = WPCallback(
+        user_id=user.id,
+        payload={"username": user.username, "email": user.email, "plan": token.plan, "api_key": token.token},
+        next_attempt_at=utc_now(),
+        created_at=utc_now(),
+    )
+    db.add(cb)
+    db.flush()
+    on_commit(db, wp_outbox.kick)
+    return cb
+
 # ---------- Trades ----------
+def trade_record_row(receiver: User, symbol: str, action: str, details=None) -> Dict[str, Any]:
+    return {"user_id": receiver.id, "action": action, "symbol": symbol, "details": details or {}, "created_at": utc_now()}
+
 def record_trade(db: Session, receiver: User, symbol: str, action: str, details=None) -> TradeRecord:
-    tr = TradeRecord(user_id=receiver.id, action=action, symbol=symbol, details=details or {}, created_at=utc_now())
+    tr = TradeRecord(**trade_record_row(receiver, symbol, action, details))
     db.add(tr)
     db.flush()
     return tr
+
+def insert_trade_records(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Group insert for the write-behind buffer (rows from trade_record_row)."""
+    if rows:
+        db.execute(insert(TradeRecord), rows)
@@ -0,0 +1,358 @@
+import os
+import json
+import glob
+import socket
+import select
+import logging
+import secrets
+import tempfile
+import threading
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import caches
+from notifier import signal_notifier
+from signal_buffer import signal_buffer
+
+log = logging.getLogger("fanout")
+
+Pairs = List[Tuple[int, int]]  # (sender_id, signal_id)
+
+PG_CHANNEL = "trade_signals"
+PG_PAYLOAD_MAX = 7000  # NOTIFY payloads must stay under 8000 bytes
+
+
+class SignalBus:
+    """
+    Cross-worker fan-out of committed signal ids.
+    publish() sends to every other worker; start(on_message) delivers what the
+    others published. Each process tags its messages with `origin` and ignores
+    its own, since local waiters are woken directly by announce().
+    invalidate_users() rides the same transport: other workers drop the users'
+    cached tokens (on_invalidate).
+    """
+
+    name = "base"
+    cross_worker = True  # every worker's publishes reach every other worker
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._on_message: Optional[Callable[[Pairs], None]] = None
+        self._on_reset: Optional[Callable[[], None]] = None
+        self._on_invalidate: Optional[Callable[[List[int]], None]] = None
+
+    def start(
+        self,
+        on_message: Callable[[Pairs], None],
+        on_reset: Optional[Callable[[], None]] = None,
+        on_invalidate: Optional[Callable[[List[int]], None]] = None,
+    ) -> None:
+        """on_reset is called when messages may have been lost (e.g. after a reconnect)."""
+        self._on_message = on_message
+        self._on_reset = on_reset
+        self._on_invalidate = on_invalidate
+
+    def stop(self) -> None:
+        self._on_message = None
+        self._on_reset = None
+        self._on_invalidate = None
+
+    def publish(self, pairs: Pairs) -> None:
+        self._transmit(self._encode(pairs))
+
+    def invalidate_users(self, user_ids: Iterable[int]) -> None:
+        self._transmit(json.dumps({"o": self.origin, "u": [int(u) for u in user_ids]}, separators=(",", ":")))
+
+    def _transmit(self, raw: str) -> None:
+        raise NotImplementedError
+
+    def _encode(self, pairs: Pairs) -> str:
+        return json.dumps({"o": self.origin, "s": [[int(s), int(i)] for s, i in pairs]}, separators=(",", ":"))
+
+    def _deliver(self, raw) -> None:
+        try:
+            msg = json.loads(raw)
+            if msg.get("o") == self.origin:
+                return
+            if msg.get("u"):
+                if self._on_invalidate:
+                    self._on_invalidate([int(u) for u in msg["u"]])
+            elif self._on_message:
+                self._on_message([(int(s), int(i)) for s, i in msg.get("s") or []])
+        except Exception:
+            log.exception("%s bus: bad message dropped", self.name)
+
+
+class MemoryBus(SignalBus):
+    """Single-process bus: fans out between bus instances living in this process (tests)."""
+
+    name = "memory"
+    cross_worker = False  # other uvicorn processes are invisible
+    _members: List["MemoryBus"] = []
+    _lock = threading.Lock()
+
+    def start(self, on_message, on_reset=None, on_invalidate=None):
+        super().start(on_message, on_reset, on_invalidate)
+        with self._lock:
+            if self not in MemoryBus._members:
+                MemoryBus._members.append(self)
+
+    def stop(self):
+        with self._lock:
+            if self in MemoryBus._members:
+                MemoryBus._members.remove(self)
+        super().stop()
+
+    def _transmit(self, raw):
+        with self._lock:
+            members = list(MemoryBus._members)
+        for m in members:
+            m._deliver(raw)
+
+
+class UnixSocketBus(SignalBus):
+    """
+    Single-host bus: every worker binds a datagram socket in SIGNAL_BUS_SOCKET_DIR
+    and publish() sends one datagram to each peer socket found there.
+    """
+
+    name = "unix"
+
+    def __init__(self, directory: Optional[str] = None):
+        super().__init__()
+        self.directory = directory or os.getenv(
+            "SIGNAL_BUS_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "trade_signal_bus")
+        )
+        self.path = os.path.join(self.directory, f"{self.origin}.sock")
+        self._sock: Optional[socket.socket] = None
+        self._send = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_message, on_reset=None, on_invalidate=None):
+        super().start(on_message, on_reset, on_invalidate)
+        os.makedirs(self.directory, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="bus-unix", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._sock], [], [], 1.0)
+            if ready:
+                self._deliver(self._sock.recv(65536))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(2.0)
+            self._thread = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        super().stop()
+
+    def _transmit(self, raw):
+        raw = raw.encode("utf-8")
+        for peer in glob.glob(os.path.join(self.directory, "*.sock")):
+            if peer == self.path:
+                continue
+            try:
+                self._send.sendto(raw, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker died without cleaning up; drop its socket
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except OSError:
+                log.warning("unix bus: send to %s failed", peer)
+
+
+class PostgresBus(SignalBus):
+    """
+    Production bus: LISTEN/NOTIFY on the primary database (channel trade_signals).
+    Both directions use the bus's own driver connections, opened outside the pool:
+    publish() runs in a session's after-commit hook while that session still holds
+    its pooled connection, so waiting on the pool there could deadlock under load.
+    """
+
+    name = "postgres"
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._notify_conn = None
+        self._notify_lock = threading.Lock()
+
+    def _connect(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        conn = self.engine.dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        return conn
+
+    def start(self, on_message, on_reset=None, on_invalidate=None):
+        super().start(on_message, on_reset, on_invalidate)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="bus-postgres", daemon=True)
+        self._thread.start()
+
+    def _listen_once(self, reconnect: bool):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {PG_CHANNEL}")
+            if reconnect and self._on_reset:
+                self._on_reset()  # NOTIFYs sent while we were disconnected are gone
+            while not self._stop.is_set():
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        self._deliver(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _loop(self):
+        reconnect = False
+        while not self._stop.is_set():
+            try:
+                self._listen_once(reconnect)
+            except Exception:
+                log.exception("postgres bus: listener failed; reconnecting")
+                reconnect = True
+                self._stop.wait(1.0)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(3.0)
+            self._thread = None
+        with self._notify_lock:
+            self._close_notify()
+        super().stop()
+
+    def publish(self, pairs):
+        messages, chunk = [], []
+        for pair in pairs:
+            chunk.append(pair)
+            if len(self._encode(chunk)) > PG_PAYLOAD_MAX:
+                messages.append(chunk[:-1])
+                chunk = [pair]
+        if chunk:
+            messages.append(chunk)
+        self._notify([self._encode(m) for m in messages])
+
+    def invalidate_users(self, user_ids):
+        user_ids = list(user_ids)
+        for i in range(0, len(user_ids), 500):  # ~10 bytes an id, well under PG_PAYLOAD_MAX
+            super().invalidate_users(user_ids[i:i + 500])
+
+    def _transmit(self, raw):
+        self._notify([raw])
+
+    def _notify(self, payloads: List[str]) -> None:
+        # One long-lived notify connection, reopened (and the send retried once) after
+        # an error; a retry may repeat a message, which receivers tolerate
+        with self._notify_lock:
+            for attempt in range(2):
+                try:
+                    if self._notify_conn is None:
+                        self._notify_conn = self._connect()
+                    with self._notify_conn.cursor() as cur:
+                        for payload in payloads:
+                            cur.execute("SELECT pg_notify(%s, %s)", (PG_CHANNEL, payload))
+                    return
+                except Exception:
+                    self._close_notify()
+                    if attempt:
+                        raise
+
+    def _close_notify(self) -> None:
+        if self._notify_conn is not None:
+            try:
+                self._notify_conn.close()
+            except Exception:
+                pass
+            self._notify_conn = None
+
+
+def make_bus(kind: Optional[str] = None) -> SignalBus:
+    kind = (kind or os.getenv("SIGNAL_BUS", "memory")).strip().lower()
+    if kind == "postgres":
+        from database import engine
+        return PostgresBus(engine)
+    if kind == "unix":
+        return UnixSocketBus()
+    return MemoryBus()
+
+
+signal_bus: SignalBus = make_bus()
+
+
+def announce(pairs: Iterable[Tuple[int, int]]) -> None:
+    """
+    Called once per committed transaction that published signals: wakes this
+    worker's waiters directly and tells every other worker through the bus.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return
+    signal_notifier.publish_many(pairs)
+    try:
+        signal_bus.publish(pairs)
+    except Exception:
+        log.exception("%s bus publish failed", signal_bus.name)
+
+
+def invalidate_user_tokens(user_ids: Iterable[int]) -> None:
+    """After a commit that changed users' tokens: other workers drop their cached verifications."""
+    user_ids = list(user_ids)
+    if not user_ids or not signal_bus.cross_worker:
+        return
+    try:
+        signal_bus.invalidate_users(user_ids)
+    except Exception:
+        log.exception("%s bus: token invalidation failed", signal_bus.name)
+
+
+def _on_remote(pairs: Pairs) -> None:
+    # Record first so a woken waiter finds the ids in the ring buffer's missing set
+    signal_buffer.note_remote(pairs)
+    signal_notifier.publish_many(pairs)
+
+
+def _on_invalidate(user_ids: List[int]) -> None:
+    for user_id in user_ids:
+        caches.invalidate_user_tokens(user_id)
+
+
+def _on_reset() -> None:
+    # After a lost-message window the buffer re-warms from SQL on next use, watermarks
+    # are re-read so nothing published meanwhile looks "not modified", and cached
+    # tokens are re-verified in case a rotation's invalidation was among the lost
+    signal_buffer.invalidate()
+    caches.token_cache.clear()
+    import crud  # crud imports this module
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        signal_notifier.publish_many(crud.latest_signal_ids(db).items())
+    except Exception:
+        log.exception("re-reading signal watermarks failed")
+    finally:
+        db.close()
+
+
+def start() -> None:
+    signal_bus.start(_on_remote, on_reset=_on_reset, on_invalidate=_on_invalidate)
+
+
+def stop() -> None:
+    signal_bus.stop()
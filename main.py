@@ -2,21 +2,37 @@ import json
 import hmac
 import hashlib
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
-from fastapi import FastAPI, Depends, HTTPException, Header, Request, Query, Body 
+from typing import Optional, Dict, Any, List, FrozenSet
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Query, Body, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import SessionLocal, ReadSessionLocal, engine, read_engine, Base
 import models
 import crud
+import caches
+from sweeper import PeriodicJob
+from notifier import signal_notifier
+import fanout
+import wp_outbox
+import retention
+from signal_buffer import SignalSnapshot, signal_buffer
+import payloads
+import metrics
+import sqlprofile
+import ratelimit
+import singleflight
+from payloads import RawJSONResponse
+from trade_buffer import trade_buffer, WRITE_BEHIND as TRADE_WRITE_BEHIND
 from datetime import timedelta  
-import os, logging, requests
+import os, logging
 from pydantic import BaseModel, Field, ConfigDict
 
 from schemas import (
     TradeSignalCreate, TradeSignalOut, LatestSignalOut,
     TradeRecordCreate, TradeRecordOut,
-    PlanChangeIn, PlanChangeOut, ActivationsList,
+    PlanChangeIn, PlanChangeOut, ActivationsList, UserOut,
     AdminIssueTokenRequest, AdminIssueTokenResponse
 )
 
@@ -34,6 +50,13 @@ app.add_middleware(
     allow_headers=["*"],
     max_age=3600,
 )
+app.add_middleware(metrics.MetricsMiddleware)
+# Opt-in SQL profiling (SQL_PROFILE=1; SQL_PROFILE_HEADER=1 adds X-SQL-Profile)
+if sqlprofile.ENABLED:
+    sqlprofile.install(engine)
+    if read_engine is not engine:
+        sqlprofile.install(read_engine)
+    app.add_middleware(sqlprofile.SQLProfileMiddleware)
 
 
 def get_db():
@@ -42,37 +65,185 @@ def get_db():
         yield db
     finally:
         db.close()
+        _release_admission(db)
+
+
+def get_read_db():
+    """
+    Session on the read replica (READ_DATABASE_URL), or the primary if none is set.
+    Read-only lookups that tolerate replica lag; writes and read-your-writes stay on get_db.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Expired-token purge runs here, not in request handlers (see sweeper.PeriodicJob)
+token_sweeper = PeriodicJob(
+    "purge_expired_tokens",
+    interval=float(os.getenv("TOKEN_SWEEP_INTERVAL_SEC", "60")),
+    fn=crud.purge_expired_tokens,
+)
+# Rebuilds today's quota counters from signal_reads (crash recovery); boot-only unless an interval is set
+read_counter_reconciler = PeriodicJob(
+    "reconcile_read_counters",
+    interval=float(os.getenv("READ_COUNTER_RECONCILE_SEC", "0")),
+    fn=crud.reconcile_read_counters,
+)
 
 
 @app.on_event("startup")
 def startup():
     Base.metadata.create_all(bind=engine)
-    # Best-effort purge at boot
+    # Other workers' publishes reach our long-polls/streams through the bus; start it
+    # before warming so nothing published in between is missed
+    fanout.start()
+    db = SessionLocal()
     try:
-        db = SessionLocal()
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
-        logging.exception("startup purge_expired_tokens failed")
+        signal_notifier.seed(crud.latest_signal_ids(db))
+        if fanout.signal_bus.cross_worker:
+            crud.warm_signal_buffer(db)
     finally:
         db.close()
+    # Sweep once at boot, then periodically in the background
+    token_sweeper.run_once()
+    token_sweeper.start()
+    read_counter_reconciler.run_once()
+    read_counter_reconciler.start()
+    if TRADE_WRITE_BEHIND:
+        trade_buffer.start()
+    # Deliver WP callbacks left pending by a previous run
+    wp_outbox.job.start()
+    wp_outbox.kick()
+    # Archive and delete reads/signals past retention (first tick after the interval)
+    retention.job.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    fanout.stop()
+    token_sweeper.stop()
+    read_counter_reconciler.stop()
+    retention.job.stop()
+    wp_outbox.job.stop()
+    wp_outbox.dispatcher.close()
+    # Graceful restart: commit every acknowledged trade record before exiting
+    trade_buffer.stop()
 
 
 @app.get("/health")
 def health():
-    return {"ok": True, "time": datetime.now(timezone.utc).isoformat()}
+    return {
+        "ok": True,
+        "time": datetime.now(timezone.utc).isoformat(),
+        # hit/miss counters so we can confirm token auth stays off the DB
+        "token_cache": caches.token_cache.stats(),
+        "signal_buffer": signal_buffer.stats(),
+        "subscription_cache": caches.subscription_cache.stats(),
+        "signal_json_cache": payloads.signal_json_cache.stats(),
+        "signal_query_coalescing": singleflight.signal_queries.stats(),
+        "trade_buffer": trade_buffer.stats() if TRADE_WRITE_BEHIND else None,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Prometheus text exposition format (this worker only)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 # ---------------- Auth helpers ----------------
 def _coerce_plan(p: Optional[str]) -> str:
     return crud.normalize_plan(p)
 
-def _user_can_send(user: models.User) -> bool:
+def _user_can_send(user) -> bool:
     return (user.username or "").strip().lower() == "farm_robot"
 
 
+def _bearer_token(authorization: Optional[str]) -> str:
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Missing Authorization")
+    return authorization.split(" ", 1)[1].strip()
+
+
+def _admit(db: Session, lane: str = "poll") -> None:
+    """
+    503 + Retry-After instead of queueing for a DB connection when the pool is under
+    pressure. An admitted poll's slot is tied to `db` and released with it.
+    """
+    if not ratelimit.ADMISSION_CONTROL:
+        return
+    slot, reason = ratelimit.admission.admit(lane)
+    if reason:
+        metrics.admission_rejections.inc(1, reason)
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly",
+                            headers={"Retry-After": str(ratelimit.admission.retry_after)})
+    if slot:
+        db.info["admission_slot"] = True
+
+def _release_admission(db: Session) -> None:
+    # Session closed, or parked without a connection: the slot is free again
+    if db.info.pop("admission_slot", False):
+        ratelimit.admission.release()
+
+
+def _rate_limit(ctx: crud.AuthContext) -> None:
+    """429 + Retry-After once the token has used up its plan's request rate."""
+    if not ratelimit.RATE_LIMIT:
+        return
+    wait = ratelimit.limiter.acquire(ctx.token_hash, ctx.plan)
+    if wait:
+        metrics.rate_limited.inc(1, ctx.plan)
+        raise HTTPException(status_code=429, detail="Rate limit exceeded",
+                            headers={"Retry-After": ratelimit.retry_after(wait)})
+
+
+def _replica_auth_context(read_db: Session, db: Session, token: str) -> Optional[crud.AuthContext]:
+    """
+    load_auth_context on the replica, without refilling the caches from it. A miss
+    is retried on the primary: the token may have been issued moments ago.
+    """
+    if read_db.get_bind() is db.get_bind():
+        return crud.load_auth_context(db, token)
+    ctx = crud.load_auth_context(read_db, token, refill_cache=False)
+    read_db.rollback()
+    if ctx is None:
+        metrics.replica_fallbacks.inc(1, "token_miss")
+        ctx = crud.load_auth_context(db, token)
+    return ctx
+
+
+def require_auth(detail: str = "Invalid token", lane: str = "poll", replica: bool = False):
+    """
+    Dependency factory for bearer-token endpoints: resolves the caller to a
+    crud.AuthContext (token, user, plan limits, subscriptions, today's usage)
+    in at most one statement, or 401s with `detail`.
+    lane="poll" requests are subject to admission control and the per-token rate
+    limit; lane="publish" (signal publishing) skips both.
+    replica=True looks the token up on the read replica (endpoints that only report
+    on it); the default primary lookup sees today's quota usage exactly.
+    """
+    def dependency(
+        authorization: Optional[str] = Header(None, alias="Authorization"),
+        db: Session = Depends(get_db),
+        read_db: Session = Depends(get_read_db),
+    ) -> crud.AuthContext:
+        token = _bearer_token(authorization)
+        _admit(db, lane)
+        if replica:
+            ctx = _replica_auth_context(read_db, db, token)
+        else:
+            ctx = crud.load_auth_context(db, token)
+        if ctx is None:
+            raise HTTPException(status_code=401, detail=detail)
+        if lane != "publish":
+            _rate_limit(ctx)
+        return ctx
+    return dependency
+
+
 def _require_admin_bearer(authorization: Optional[str]) -> None:
     # Accept any of the envs for backwards compatibility
     admin = os.getenv("ADMIN_TOKEN") or os.getenv("ADMIN_SECRET") or os.getenv("ADMIN_KEY")
@@ -98,84 +269,29 @@ def _verify_webhook(header_sig: Optional[str], payload: bytes) -> None:
         raise HTTPException(status_code=401, detail="Bad signature")
 
 
-def notify_wordpress(user, token):
-    url = os.getenv("WP_CALLBACK_URL")
-    key = os.getenv("WP_CALLBACK_KEY")
-    if not url or not key:
-        return
-    try:
-        requests.post(
-            url,
-            json={"username": user.username, "email": user.email, "plan": token.plan, "api_key": token.token},
-            headers={"X-Callback-Key": key},
-            timeout=3,  # short to avoid tying up request threads
-        )
-    except Exception as e:
-        logging.warning("WP callback failed: %s", e)
-
-
 # ---------------- Public: verify token ----------------
 @app.get("/auth/verify")
-def verify_token(
-    authorization: str | None = Header(None, alias="Authorization"),
-    db: Session = Depends(get_db),
-):
-    # opportunistic purge to keep the table clean
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
-
-    try:
-        if not authorization or not authorization.lower().startswith("bearer "):
-            raise HTTPException(status_code=401, detail="Missing Authorization")
-
-        token = authorization.split(" ", 1)[1].strip()
-        ok, user, meta = crud.verify_token(db, token)
-
-        if not ok or not user:
-            raise HTTPException(status_code=401, detail="Invalid or inactive token")
-
-        # Normalize output
-        plan = (meta.get("plan") or "free")
-        daily_quota = meta.get("daily_quota", None)
-        unlimited = bool(meta.get("unlimited"))
-
-        # Compute remaining_today WITHOUT consuming quota
-        remaining_today = None
-        if not unlimited and daily_quota is not None:
-            token_hash = crud.hash_token_for_read(token)
-            used = crud.count_reads_today(db, user, token_hash=token_hash)
-            remaining_today = max(0, int(daily_quota) - used)
-
-        # include expiry (from crud meta) and current server time
-        expires_at = meta.get("expires_at")
-        server_time = datetime.now(timezone.utc).isoformat()
-
-        return {
-            "ok": True,
-            "username": user.username,
-            "plan": plan,
-            "daily_quota": daily_quota,
-            "unlimited": unlimited,
-            "remaining_today": remaining_today,  # None for unlimited
-            "expires_at": expires_at,            # ISO string or None
-            "server_time": server_time,          # ISO string
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.exception("verify_token crashed")
-        raise HTTPException(status_code=500, detail=f"verify_token crash: {e.__class__.__name__}: {e}")
+def verify_token(ctx: crud.AuthContext = Depends(require_auth("Invalid or inactive token", replica=True))):
+    return {
+        "ok": True,
+        "username": ctx.user.username,
+        "plan": ctx.plan or "free",
+        "daily_quota": ctx.daily_quota,
+        "unlimited": ctx.unlimited,
+        "remaining_today": ctx.remaining_today,  # None for unlimited; computed, not consumed
+        "expires_at": (
+            ctx.expires_at.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
+            if ctx.expires_at else None
+        ),                                        # ISO string or None
+        "server_time": datetime.now(timezone.utc).isoformat(),
+    }
 
 # ---------------- EA-friendly: validate (email + api_key) ----------------
 @app.post("/validate")
 async def validate_credentials(
     body: Dict[str, Any] = Body(default={}),
     db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
 ):
     """
     Credential check used by both EAs.
@@ -186,14 +302,6 @@ async def validate_credentials(
     NOTE: Returns 200 with {"ok": false, ...} on failures by default (non-breaking).
           To return HTTP 401 instead, set env VALIDATE_STRICT_401=1.
     """
-    # Best-effort purge (non-fatal)
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
-
     email_in = (body or {}).get("email") or ""
     api_key  = (body or {}).get("api_key") or ""
 
@@ -208,46 +316,31 @@ async def validate_credentials(
             raise HTTPException(status_code=401, detail="api_key required")
         return {"ok": False, "error": "api_key required"}
 
-    # Look up live token to enforce expiry and capture expiry time
-    now = crud.utc_now()
-    tok = db.query(models.APIToken).filter(
-        models.APIToken.token == api_key,
-        models.APIToken.is_active == True,
-        models.APIToken.expires_at > now
-    ).first()
-
-    if not tok or not tok.user or not tok.user.is_active:
+    # Live token, user, plan limits and today's usage in one lookup.
+    # Tokens without an expiry have never been accepted here.
+    _admit(db)
+    ctx = await run_in_threadpool(_replica_auth_context, read_db, db, api_key)
+    if not ctx or ctx.expires_at is None:
         if os.getenv("VALIDATE_STRICT_401"):
             raise HTTPException(status_code=401, detail="invalid_or_expired_token")
         return {"ok": False, "error": "invalid_or_expired_token"}
+    _rate_limit(ctx)
 
     # If email supplied, bind token to that email
-    user_email_norm = (tok.user.email or "").strip().lower()
+    user_email_norm = (ctx.user.email or "").strip().lower()
     if email_norm and user_email_norm and email_norm != user_email_norm:
         if os.getenv("VALIDATE_STRICT_401"):
             raise HTTPException(status_code=401, detail="email_mismatch")
         return {"ok": False, "error": "email_mismatch"}
 
-    limits = crud.plan_limits(tok.plan)
-    plan = tok.plan
-    daily_quota = limits.get("daily_quota")
-    unlimited   = bool(limits.get("unlimited"))
-
-    # Remaining today (computed, not consumed)
-    remaining_today = None
-    if not unlimited and daily_quota is not None:
-        token_hash = crud.hash_token_for_read(api_key)
-        used = crud.count_reads_today(db, tok.user, token_hash=token_hash)
-        remaining_today = max(0, int(daily_quota) - used)
-
     return {
         "ok": True,
-        "username": tok.user.username,
-        "plan": plan,
-        "daily_quota": daily_quota,
-        "unlimited": unlimited,
-        "remaining_today": remaining_today,
-        "expires_at": tok.expires_at.isoformat() if tok.expires_at else None,
+        "username": ctx.user.username,
+        "plan": ctx.plan,
+        "daily_quota": ctx.daily_quota,
+        "unlimited": ctx.unlimited,
+        "remaining_today": ctx.remaining_today,  # computed, not consumed
+        "expires_at": ctx.expires_at.isoformat(),
         "server_time": datetime.now(timezone.utc).isoformat(),
     }
 
@@ -258,13 +351,6 @@ async def webhook_payment_approved(request: Request, db: Session = Depends(get_d
     raw = await request.body()
     _verify_webhook(request.headers.get("x-webhook-signature"), raw)
 
-    # Also purge expired tokens before touching state
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
 
     try:
         # tolerant parsing (JSON/form/query)
@@ -316,10 +402,10 @@ async def webhook_payment_approved(request: Request, db: Session = Depends(get_d
         tok, rotated = crud.upsert_active_token(db, user, plan=plan, rotate=need_rotate)
         limits = crud.plan_limits(tok.plan)
 
-        db.commit()  # persist rotation and plan update
+        # WP is notified from the outbox once this commits
+        crud.enqueue_wp_callback(db, user, tok)
 
-        # notify WP (optional; non-blocking with short timeout)
-        notify_wordpress(user, tok)
+        db.commit()  # persist rotation, plan update and callback
 
         return {
             "ok": True,
@@ -346,13 +432,6 @@ def admin_change_plan(
     db: Session = Depends(get_db),
 ):
     _require_admin_bearer(authorization)
-    # purge first
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
 
     try:
         user = crud.ensure_user(db, payload.user_id, payload.username, payload.email)
@@ -360,11 +439,10 @@ def admin_change_plan(
         plan = _coerce_plan(payload.plan)
         token_obj, rotated = crud.upsert_active_token(db, user, plan=plan, rotate=bool(payload.rotate))
         limits = crud.plan_limits(token_obj.plan)
+        crud.enqueue_wp_callback(db, user, token_obj)
 
         db.commit()
 
-        notify_wordpress(user, token_obj)
-
         return {"ok": True, "user": user, "plan": token_obj.plan, "rotated": rotated, "api_key": token_obj.token, **limits}
     except:
         db.rollback()
@@ -379,24 +457,16 @@ def admin_issue_token(
     db: Session = Depends(get_db),
 ):
     _require_admin_bearer(authorization)
-    # purge first
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
 
     try:
         user = crud.ensure_user(db, payload.user_id, payload.username, payload.email)
         crud.ensure_subscription_to_sender(db, user, os.getenv("DEFAULT_SIGNAL_SENDER", "farm_robot"))
         plan = _coerce_plan(payload.plan)
         tok, rotated = crud.upsert_active_token(db, user, plan=plan, rotate=bool(payload.rotate))
+        crud.enqueue_wp_callback(db, user, tok)
 
         db.commit()
 
-        notify_wordpress(user, tok)
-
         return {"username": user.username, "email": user.email, "plan": tok.plan, "api_key": tok.token, "rotated": rotated}
     except:
         db.rollback()
@@ -407,23 +477,10 @@ def admin_issue_token(
 @app.post("/signals/publish", response_model=TradeSignalOut)
 def publish_signal(
     payload: TradeSignalCreate,
-    authorization: Optional[str] = Header(None, alias="Authorization"),
+    ctx: crud.AuthContext = Depends(require_auth(lane="publish")),
     db: Session = Depends(get_db),
 ):
-    # purge
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
-
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing Authorization")
-    token = authorization.split(" ", 1)[1].strip()
-    ok, sender, _ = crud.verify_token(db, token)
-    if not ok or not sender:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    sender = ctx.user
     # Only farm_robot is allowed to publish signals
     if not _user_can_send(sender):
         raise HTTPException(status_code=403, detail="Not allowed to publish signals")
@@ -441,165 +498,417 @@ def publish_signal(
 @app.post("/signals")
 def publish_signal_compat(
     payload: TradeSignalCreate,
-    authorization: Optional[str] = Header(None, alias="Authorization"),
+    ctx: crud.AuthContext = Depends(require_auth(lane="publish")),
     db: Session = Depends(get_db),
 ):
-    return publish_signal(payload, authorization, db)
+    return publish_signal(payload, ctx, db)
 
-# ---------------- Signals: fetch latest for receiver (quota enforced) ----------------
-@app.get("/signals/latest", response_model=LatestSignalOut)
-def latest_signals(
-    authorization: Optional[str] = Header(None, alias="Authorization"),
-    limit: int = Query(10, ge=1, le=50),
-    since_id: Optional[int] = Query(None, ge=0),
-    max_age_sec: Optional[int] = Query(None, ge=1, le=86400),
+SIGNAL_BATCH_MAX = int(os.getenv("SIGNAL_BATCH_MAX", "500"))
+
+@app.post("/signals/publish/batch", response_model=List[TradeSignalOut])
+def publish_signals_batch(
+    payload: List[TradeSignalCreate],
+    ctx: crud.AuthContext = Depends(require_auth(lane="publish")),
     db: Session = Depends(get_db),
 ):
-    
+    """
+    Publish several signals at once (e.g. every symbol at a bar close): one auth,
+    one INSERT, one commit and one fan-out notification. Returns them in input order.
+    """
+    if not _user_can_send(ctx.user):
+        raise HTTPException(status_code=403, detail="Not allowed to publish signals")
+    if len(payload) > SIGNAL_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Too many signals (max {SIGNAL_BATCH_MAX})")
 
-    # purge
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
+    sigs = crud.create_signals(db, ctx.user, [p.model_dump() for p in payload])
+    db.commit()
+    return RawJSONResponse(payloads.json_array(sigs))
 
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing Authorization")
-    token = authorization.split(" ", 1)[1].strip()
-    ok, receiver, meta = crud.verify_token(db, token)
-    if not ok or not receiver:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Enforce quotas
-    unlimited = bool(meta.get("unlimited"))
-    daily_quota = meta.get("daily_quota")
-    token_hash = crud.hash_token_for_read(token)
-
-    if not unlimited:
-        token_hash = crud.hash_token_for_read(token)
-        try:
-            used = crud.count_reads_today(db, receiver, token_hash=token_hash)
-        except Exception:
-            logging.exception("count_reads_today failed; assuming used=0")
-            used = 0
-        remaining = max(0, int(daily_quota) - used) if daily_quota is not None else 0
+# ---------------- Signals: fetch latest for receiver (quota enforced) ----------------
+LONG_POLL_MAX_SEC = 60
+
+def _deliver_signals(
+    db: Session,
+    ctx: crud.AuthContext,
+    sender_ids: FrozenSet[int],
+    limit: int,
+    since_id: Optional[int],
+    min_created_at: Optional[datetime] = None,
+    read_db: Optional[Session] = None,
+    watermark: Optional[int] = None,
+) -> Optional[List[SignalSnapshot]]:
+    """
+    Quota check, signal query and read accounting for one delivery to a receiver.
+    Returns None when today's quota is exhausted (as of ctx). Items are detached
+    snapshots (serialize with payloads.*); the commit releases the connection.
+    A signal query the ring buffer can't answer runs on read_db (replica) when given
+    and caught up; quota accounting always goes to the primary. watermark: see
+    crud.get_signals_for_receiver_since.
+    """
+    cap = limit
+    if not ctx.unlimited:
+        remaining = ctx.remaining_today or 0
         if remaining <= 0:
-            return {"items": []}
-        limit = min(limit, remaining)
-    min_created_at = None
-    if max_age_sec is not None:
-        min_created_at = crud.utc_now() - timedelta(seconds=int(max_age_sec))
+            db.rollback()
+            metrics.quota_rejections.inc()
+            return None
+        cap = min(limit, remaining)
 
+    # Queried with the requested limit and trimmed to this receiver's remaining quota
+    # here, so receivers on different plans can share one coalesced query
     signals = crud.get_signals_for_receiver_since(
-        db, receiver,
+        db, ctx.user,
         limit=limit,
         since_id=since_id,
         min_created_at=min_created_at,
+        sender_ids=sender_ids,
+        read_db=read_db,
+        watermark=watermark,
     )
+    if read_db is not None:
+        read_db.rollback()  # release the replica connection
+    items = list(signals)[:cap]
+    metrics.signals_delivered.inc(len(items))
 
     # Only BUY/SELL consume quota; CLOSE/ADJUST/HOLD do not.
-    # Also guard with freshness (default 120s if client didn't send max_age_sec).
-    age_cutoff = crud.utc_now() - timedelta(seconds=int(max_age_sec or 120))
+    # Also guard with freshness (120s regardless of the client's max_age_sec).
     now = crud.utc_now()
     try:
-        for s in signals:
-            if s.action in ("buy", "sell") and (s.created_at is None or (now - s.created_at).total_seconds() <= 120):
-                crud.record_signal_read(db, s.id, receiver, token_hash)
+        fresh_ids = [
+            s.id for s in items
+            if s.action in ("buy", "sell") and (s.created_at is None or (now - s.created_at).total_seconds() <= 120)
+        ]
+        crud.record_signal_reads(db, fresh_ids, ctx.user, ctx.token_hash)
         db.commit()
     except Exception:
         db.rollback()
         logging.exception("record_signal_read failed; returning signals anyway")
-    return {"items": signals}
+    return items
+
+def _receiver_poll(
+    db: Session,
+    ctx: Optional[crud.AuthContext],
+    limit: int,
+    since_id: Optional[int],
+    max_age_sec: Optional[int],
+    read_db: Optional[Session] = None,
+    watermark: Optional[int] = None,
+):
+    """
+    Shared body of /signals/latest and /signals. Returns (items, sender_ids, watermark):
+      * sender_ids is empty when waiting could not produce anything (no subscriptions,
+        quota exhausted)
+      * watermark is the newest signal id from those senders known before querying
+        (the caller's _signals_watermark if given, else this worker's notifier);
+        long-polls wait for anything newer. Coalesced queries are keyed on it, so
+        an answer is never older than the watermark its ETag was built from.
+    A ctx of None (token went invalid between passes of a long-poll) yields nothing.
+    """
+    if ctx is None:
+        return [], frozenset(), 0
+    min_created_at = None
+    if max_age_sec is not None:
+        min_created_at = crud.utc_now() - timedelta(seconds=int(max_age_sec))
+
+    sender_ids = ctx.sender_ids
+    if watermark is None:
+        watermark = signal_notifier.latest_id(sender_ids)
+    items = _deliver_signals(db, ctx, sender_ids, limit, since_id, min_created_at, read_db, watermark)
+    if items is None:
+        return [], frozenset(), 0
+    return items, sender_ids, watermark
+
+def _signals_watermark(db: Session, sender_ids: FrozenSet[int]) -> int:
+    """
+    Newest signal id from sender_ids. The notifier knows it without touching the DB
+    when the fan-out bus carries every worker's publishes; with the in-process bus
+    other workers' publishes are invisible, so ask the DB (one indexed max(id)).
+    """
+    if fanout.signal_bus.cross_worker:
+        return signal_notifier.latest_id(sender_ids)
+    return crud.latest_signal_id(db, sender_ids)
+
+def _signals_etag(ctx: crud.AuthContext, watermark: int, since_id, limit, max_age_sec) -> str:
+    """
+    Weak validator for a receiver poll: changes when the query (cursor, limit, age),
+    the sender set, the newest signal id from those senders, quota exhaustion or the
+    UTC day changes. The query is part of it so that the next page of a truncated
+    answer (since_id moved, nothing new published) is never "not modified".
+    """
+    key = f"{since_id or 0}:{limit}:{max_age_sec or 0}:" + ",".join(map(str, sorted(ctx.sender_ids)))
+    digest = hashlib.sha1(key.encode("ascii")).hexdigest()[:12]
+    quota = "x" if ctx.remaining_today == 0 else "q"
+    return f'W/"{digest}.{watermark}.{quota}.{crud.utc_now():%Y%m%d}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or etag[2:] in tags  # weak comparison
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+def _wake_senders(ctx: crud.AuthContext) -> FrozenSet[int]:
+    """Senders whose next publish can change this receiver's answer (none once the quota is used up)."""
+    return frozenset() if ctx.remaining_today == 0 else ctx.sender_ids
+
+async def _park(db: Session, sender_ids: FrozenSet[int], after_id: int, wait_sec: int) -> bool:
+    """
+    Wait up to wait_sec for a signal newer than after_id from sender_ids (with no
+    senders, just sleep it out). True when the caller should query once more: woken,
+    or timed out with the in-process bus, where another worker's publish can't wake us.
+    `db` holds no connection by now, so its admission slot is given back first (the
+    query after waking goes ahead without one).
+    """
+    _release_admission(db)
+    woke = await signal_notifier.wait(sender_ids, after_id, timeout=wait_sec)
+    return woke or (bool(sender_ids) and not fanout.signal_bus.cross_worker)
+
+def _conditional_poll(db: Session, ctx, limit, since_id, max_age_sec, read_db: Optional[Session] = None):
+    """_receiver_poll plus the ETag for its answer (watermark read before querying)."""
+    watermark = _signals_watermark(db, ctx.sender_ids)
+    etag = _signals_etag(ctx, watermark, since_id, limit, max_age_sec)
+    return _receiver_poll(db, ctx, limit, since_id, max_age_sec, read_db, watermark) + (etag,)
+
+@app.get("/signals/latest", response_model=LatestSignalOut)
+async def latest_signals(
+    ctx: crud.AuthContext = Depends(require_auth()),
+    limit: int = Query(10, ge=1, le=50),
+    since_id: Optional[int] = Query(None, ge=0),
+    max_age_sec: Optional[int] = Query(None, ge=1, le=86400),
+    wait_sec: Optional[int] = Query(None, ge=1, le=LONG_POLL_MAX_SEC),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    """
+    Optional long-poll: with wait_sec, an empty result parks the request (on the event
+    loop, with the DB connection released) until one of the receiver's senders
+    publishes something new or wait_sec elapses, then queries once more (after a
+    timeout only with the in-process bus, which doesn't see other workers). With the
+    quota used up or no subscriptions it still waits out wait_sec, so such clients
+    don't poll in a tight loop.
+
+    Conditional: responses carry an ETag; If-None-Match with the current one is
+    answered 304 without querying signals or recording reads (after waiting up
+    to wait_sec for something new, if given).
+    """
+    watermark = await run_in_threadpool(_signals_watermark, db, ctx.sender_ids)
+    etag = _signals_etag(ctx, watermark, since_id, limit, max_age_sec)
+    if _etag_matches(if_none_match, etag):
+        if not wait_sec:
+            return _not_modified(etag)
+        # The watermark query (and auth's quota lookup) left a transaction open; end
+        # it so the parked request doesn't hold a pooled connection
+        await run_in_threadpool(db.rollback)
+        if not await _park(db, _wake_senders(ctx), watermark, wait_sec):
+            return _not_modified(etag)
+        ctx = await run_in_threadpool(crud.load_auth_context, db, ctx.token)
+        if ctx is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        wait_sec = None  # already waited
+        watermark = await run_in_threadpool(_signals_watermark, db, ctx.sender_ids)
+        etag = _signals_etag(ctx, watermark, since_id, limit, max_age_sec)
+        if _etag_matches(if_none_match, etag):
+            await run_in_threadpool(db.rollback)
+            return _not_modified(etag)  # re-checked after a timeout: still nothing new
+        items, sender_ids, watermark = await run_in_threadpool(
+            _receiver_poll, db, ctx, limit, since_id, max_age_sec, read_db, watermark
+        )
+    else:
+        items, sender_ids, watermark = await run_in_threadpool(
+            _receiver_poll, db, ctx, limit, since_id, max_age_sec, read_db, watermark
+        )
+    if not items and wait_sec:
+        # sender_ids is empty when nothing can arrive (quota used up, no subscriptions)
+        if await _park(db, sender_ids, max(since_id or 0, watermark), wait_sec):
+            # Usage and subscriptions may have moved while parked: reload the context
+            ctx = await run_in_threadpool(crud.load_auth_context, db, ctx.token)
+            if ctx is None:
+                items = []
+            else:
+                items, _, _, etag = await run_in_threadpool(
+                    _conditional_poll, db, ctx, limit, since_id, max_age_sec, read_db
+                )
+    return RawJSONResponse(
+        payloads.latest_json(items), headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+    )
 
 @app.get("/signals", response_model=List[TradeSignalOut])
 def latest_signals_array(
-    authorization: Optional[str] = Header(None, alias="Authorization"),
+    ctx: crud.AuthContext = Depends(require_auth()),
     limit: int = Query(10, ge=1, le=50),
     since_id: Optional[int] = Query(None, ge=0),
     max_age_sec: Optional[int] = Query(None, ge=1, le=86400),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
 ):
-    # purge (non-fatal)
+    watermark = _signals_watermark(db, ctx.sender_ids)
+    etag = _signals_etag(ctx, watermark, since_id, limit, max_age_sec)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    items, _, _ = _receiver_poll(db, ctx, limit, since_id, max_age_sec, read_db, watermark)
+    # array route returns a top-level list (empty when quota is exhausted)
+    return RawJSONResponse(
+        payloads.json_array(items), headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+    )
+
+
+# ---------------- Signals: push streams (WebSocket / SSE) ----------------
+STREAM_BATCH = 50
+STREAM_KEEPALIVE_SEC = float(os.getenv("STREAM_KEEPALIVE_SEC", "25"))
+
+def _stream_token(authorization: Optional[str], token: Optional[str]) -> str:
+    # Browsers' EventSource/WebSocket can't set headers, so ?token= is accepted too
+    if token and token.strip():
+        return token.strip()
+    return _bearer_token(authorization)
+
+def _open_stream(token: str):
+    """Authenticate once and resolve the subscription set. Returns (sender_ids, watermark)."""
+    db = SessionLocal()
     try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
+        ctx = crud.load_auth_context(db, token)
+        if ctx is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return ctx.sender_ids, _signals_watermark(db, ctx.sender_ids)
+    finally:
+        db.close()
 
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing Authorization")
-    token = authorization.split(" ", 1)[1].strip()
-
-    ok, receiver, meta = crud.verify_token(db, token)
-    if not ok or not receiver:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    unlimited = bool(meta.get("unlimited"))
-    daily_quota = meta.get("daily_quota")
-    token_hash = crud.hash_token_for_read(token)
-
-    # Quota check
-    if not unlimited:
-        try:
-            used = crud.count_reads_today(db, receiver, token_hash=token_hash)
-        except Exception:
-            logging.exception("count_reads_today failed; assuming used=0")
-            used = 0
-        remaining = max(0, int(daily_quota) - used) if daily_quota is not None else 0
-        if remaining <= 0:
-            return []  # array route returns a plain list when exhausted
-        limit = min(limit, remaining)
+def _stream_batch(token: str, sender_ids: FrozenSet[int], cursor: int):
+    """
+    One delivery to a stream subscriber in a short-lived session. The token is
+    re-checked (a cache hit in steady state) so rotation or expiry ends the stream.
+    Returns (items, cursor); items is None once the token is no longer valid.
+    """
+    db = SessionLocal()
+    try:
+        ctx = crud.load_auth_context(db, token)
+        if ctx is None:
+            return None, cursor
+        items = _deliver_signals(db, ctx, sender_ids, STREAM_BATCH, cursor)
+        if items is None:
+            # Quota exhausted: as with polling nothing is delivered, so skip what exists
+            return [], max(cursor, _signals_watermark(db, sender_ids))
+        if items:
+            cursor = items[-1].id
+        return items, cursor
+    finally:
+        db.close()
 
-    min_created_at = None
-    if max_age_sec is not None:
-        min_created_at = crud.utc_now() - timedelta(seconds=int(max_age_sec))
+def _stream_token_valid(token: str) -> bool:
+    # Cached verify_token: no DB round trip unless the entry expired or was invalidated
+    db = SessionLocal()
+    try:
+        ok, _, _ = crud.verify_token(db, token)
+        return ok
+    finally:
+        db.close()
 
-    signals = crud.get_signals_for_receiver_since(
-        db, receiver,
-        limit=limit,
-        since_id=since_id,
-        min_created_at=min_created_at,
+async def _signal_stream(token: str, sender_ids: FrozenSet[int], cursor: int):
+    """
+    Yields batches of signal snapshots after `cursor`: drains the backlog first, then
+    parks on the notifier (no thread, no DB connection) until a sender publishes.
+    Yields [] every STREAM_KEEPALIVE_SEC while idle, re-checking the token then; ends
+    when the token stops being valid. With the in-process bus other workers'
+    publishes never wake the notifier, so every idle tick also queries from `cursor`.
+    """
+    ticked = False
+    while True:
+        items, cursor = await run_in_threadpool(_stream_batch, token, sender_ids, cursor)
+        if items is None:
+            return
+        if items:
+            yield items
+            if len(items) >= STREAM_BATCH:
+                continue
+        elif ticked:
+            yield []
+        ticked = False
+        while not await signal_notifier.wait(sender_ids, cursor, timeout=STREAM_KEEPALIVE_SEC):
+            if not fanout.signal_bus.cross_worker:
+                ticked = True
+                break
+            if not await run_in_threadpool(_stream_token_valid, token):
+                return
+            yield []
+
+@app.get("/signals/stream")
+async def stream_signals_sse(
+    authorization: Optional[str] = Header(None, alias="Authorization"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    token: Optional[str] = Query(None),
+    since_id: Optional[int] = Query(None, ge=0),
+):
+    """
+    Server-Sent Events: one `signal` event per TradeSignal (id: = signal id, so
+    EventSource reconnects resume via Last-Event-ID), `: ping` comments while idle.
+    Without since_id only signals published after connecting are sent.
+    """
+    tok = _stream_token(authorization, token)
+    sender_ids, watermark = await run_in_threadpool(_open_stream, tok)
+    if last_event_id and last_event_id.strip().isdigit():
+        since_id = int(last_event_id)
+    cursor = since_id if since_id is not None else watermark
+
+    async def events():
+        async for batch in _signal_stream(tok, sender_ids, cursor):
+            if not batch:
+                yield b": ping\n\n"
+            for item in batch:
+                yield b"id: %d\nevent: signal\ndata: %b\n\n" % (item.id, payloads.signal_json(item))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    # Consume quota only for fresh BUY/SELL (≤120s by default)
-    now = crud.utc_now()
+@app.websocket("/signals/ws")
+async def stream_signals_ws(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    since_id: Optional[int] = Query(None, ge=0),
+):
+    """
+    WebSocket push: each message is a LatestSignalOut JSON object ({"items": [...]});
+    an empty items list is a keepalive. Closes with 1008 on a bad or expired token.
+    """
     try:
-        for s in signals:
-            if s.action in ("buy", "sell") and (s.created_at is None or (now - s.created_at).total_seconds() <= 120):
-                crud.record_signal_read(db, s.id, receiver, token_hash)
-        db.commit()
-    except Exception:
-        db.rollback()
-        logging.exception("record_signal_read failed; returning signals anyway")
-
-    return signals  # array route returns a top-level list
+        tok = _stream_token(websocket.headers.get("authorization"), token)
+        sender_ids, watermark = await run_in_threadpool(_open_stream, tok)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    cursor = since_id if since_id is not None else watermark
+    try:
+        async for batch in _signal_stream(tok, sender_ids, cursor):
+            await websocket.send_text(payloads.latest_json(batch).decode("utf-8"))
+        await websocket.close(code=1008)
+    except WebSocketDisconnect:
+        pass
 
 
 # ---------------- Trades: record (optional) ----------------
+def _enqueue_trade(row: Dict[str, Any]) -> None:
+    # Write-behind mode: acknowledged once queued; a full queue pushes back on the EA
+    if not trade_buffer.submit(row):
+        raise HTTPException(status_code=503, detail="Trade queue full", headers={"Retry-After": "1"})
+
 @app.post("/trades/record", response_model=TradeRecordOut)
 def record_trade(
     payload: TradeRecordCreate,
-    authorization: Optional[str] = Header(None, alias="Authorization"),
+    ctx: crud.AuthContext = Depends(require_auth()),
     db: Session = Depends(get_db),
 ):
-    # purge
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
-
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing Authorization")
-    token = authorization.split(" ", 1)[1].strip()
-    ok, receiver, _ = crud.verify_token(db, token)
-    if not ok or not receiver:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    tr = crud.record_trade(db, receiver, payload.symbol, payload.action, payload.details)
+    if TRADE_WRITE_BEHIND:
+        row = crud.trade_record_row(ctx.user, payload.symbol, payload.action, payload.details)
+        _enqueue_trade(row)
+        return {k: row[k] for k in ("symbol", "action", "details", "created_at")}
+    tr = crud.record_trade(db, ctx.user, payload.symbol, payload.action, payload.details)
     db.commit()
     return tr
 
@@ -607,24 +916,10 @@ def record_trade(
 @app.post("/trades")
 async def record_trade_compat(
     request: Request,
-    authorization: Optional[str] = Header(None, alias="Authorization"),
+    ctx: crud.AuthContext = Depends(require_auth()),
     db: Session = Depends(get_db),
 ):
-    # Purge (non-fatal)
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
-
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing Authorization")
-
-    token = authorization.split(" ", 1)[1].strip()
-    ok, user, _ = crud.verify_token(db, token)
-    if not ok or not user:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    user = ctx.user
 
     try:
         data = await request.json()
@@ -641,6 +936,9 @@ async def record_trade_compat(
     action = (data.get("side") or data.get("action") or "record").strip().lower()
     details = data  # store full payload for auditing
 
+    if TRADE_WRITE_BEHIND:
+        _enqueue_trade(crud.trade_record_row(user, symbol, action, details))
+        return {"ok": True, "id": None, "queued": True}
     tr = crud.record_trade(db, user, symbol, action, details)
     db.commit()
     return {"ok": True, "id": tr.id}
@@ -654,27 +952,14 @@ def admin_subscribe(
     db: Session = Depends(get_db),
 ):
     _require_admin_bearer(authorization)
-    # purge
-    try:
-        purged = crud.purge_expired_tokens(db)
-        if purged:
-            db.commit()
-    except Exception:
-        db.rollback()
 
     try:
         r = db.query(models.User).filter(models.User.id == receiver_id).first()
         s = db.query(models.User).filter(models.User.id == sender_id).first()
         if not r or not s:
             raise HTTPException(status_code=404, detail="User not found")
-        # upsert
-        exists = db.query(models.Subscription).filter(
-            models.Subscription.receiver_id == r.id,
-            models.Subscription.sender_id == s.id
-        ).first()
-        if not exists:
-            db.add(models.Subscription(receiver_id=r.id, sender_id=s.id))
-            db.flush()
+        # upsert (drops the receiver's cached sender set)
+        crud.add_subscription(db, r.id, s.id)
 
         db.commit()
         return {"ok": True, "receiver_id": r.id, "sender_id": s.id}
@@ -684,7 +969,34 @@ def admin_subscribe(
 
 
 # ---------------- Activations list ----------------
+ACTIVATIONS_PAGE_MAX = 1000
+
 @app.get("/activations", response_model=ActivationsList)
-def activations(db: Session = Depends(get_db)):
-    users = db.query(models.User).filter(models.User.is_active == True).all()
-    return {"items": users}
+def activations(
+    limit: Optional[int] = Query(None, ge=1, le=ACTIVATIONS_PAGE_MAX),
+    cursor: Optional[int] = Query(None, ge=0),
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Active users, three ways:
+      * no parameters: everything in one ActivationsList (legacy)
+      * ?limit=N[&cursor=C]: one keyset page by id; follow next_cursor until it is null
+      * ?format=ndjson[&cursor=C]: the whole export streamed as one UserOut per line
+    """
+    if format == "ndjson":
+        return StreamingResponse(_activations_ndjson(cursor or 0), media_type="application/x-ndjson")
+    if limit is None and cursor is None:
+        users = db.query(models.User).filter(models.User.is_active == True).all()
+        return {"items": users}
+    users, next_cursor = crud.active_users_page(db, after_id=cursor or 0, limit=limit or ACTIVATIONS_PAGE_MAX)
+    return {"items": users, "next_cursor": next_cursor}
+
+def _activations_ndjson(after_id: int):
+    # Own session: the response body outlives the request's get_read_db dependency
+    db = ReadSessionLocal()
+    try:
+        for row in crud.iter_active_users(db, after_id=after_id):
+            yield UserOut.model_validate(row).model_dump_json().encode("utf-8") + b"\n"
+    finally:
+        db.close()
@@ -0,0 +1,208 @@
+import time
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Minimal in-process metrics rendered in the Prometheus text exposition format
+# (no client library). Every uvicorn worker keeps its own registry, so scrape
+# each worker (or run one) rather than expecting totals across processes.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: LabelValues, extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from fn() -> {label values: value}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn: Callable[[], Dict[LabelValues, float]], labels=()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def _samples(self):
+        try:
+            values = self.fn()
+        except Exception:
+            return []
+        return [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            v[0][i] += 1
+            v[1] += value
+            v[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        out = []
+        for k, (counts, total, n) in items:
+            cumulative = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                out.append(f"{self.name}_bucket{self._labels(k, [('le', _fmt(le))])} {cumulative}")
+            out.append(f"{self.name}_sum{self._labels(k)} {_fmt(total)}")
+            out.append(f"{self.name}_count{self._labels(k)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template, method and status.", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to response start by route template and method.", ("method", "route")))
+pool_checkout_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)))
+signals_published = registry.register(Counter(
+    "signals_published_total", "Signals committed by this worker."))
+signals_delivered = registry.register(Counter(
+    "signals_delivered_total", "Signals returned to receivers (polls and streams)."))
+quota_rejections = registry.register(Counter(
+    "quota_rejections_total", "Receiver deliveries refused because the daily quota was used up."))
+rate_limited = registry.register(Counter(
+    "rate_limited_total", "Requests refused with 429 by the per-token rate limiter.", ("plan",)))
+admission_rejections = registry.register(Counter(
+    "admission_rejections_total", "Requests shed with 503 before checking out a DB connection.", ("reason",)))
+replica_fallbacks = registry.register(Counter(
+    "replica_fallbacks_total", "Replica reads redone on the primary (replica behind, or token not found there).",
+    ("reason",)))
+job_duration = registry.register(Histogram(
+    "periodic_job_duration_seconds", "Run time of background jobs (token purge, reconciliation, ...).",
+    ("job",), buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)))
+
+
+def register_pool(engine) -> None:
+    """Scrape-time gauges for engine.pool (QueuePool-style pools only)."""
+    pool = engine.pool
+
+    def stat(name: str) -> Callable[[], Dict[LabelValues, float]]:
+        def read():
+            fn = getattr(pool, name, None)
+            return {(): fn()} if callable(fn) else {}
+        return read
+
+    registry.register(Gauge("db_pool_size", "Configured pool size.", stat("size")))
+    registry.register(Gauge("db_pool_checked_out", "Connections currently checked out.", stat("checkedout")))
+    registry.register(Gauge("db_pool_overflow", "Connections open beyond pool_size (negative: unopened slots).", stat("overflow")))
+    registry.register(Gauge("db_pool_checked_in", "Idle connections in the pool.", stat("checkedin")))
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing each HTTP request until its response starts
+    (so streaming endpoints measure time to first byte, not stream length).
+    Requests are labelled with the matched route template, never the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status: Optional[int] = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                self._record(scope, status, time.perf_counter() - t0)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if status is None:
+                self._record(scope, 500, time.perf_counter() - t0)
+            raise
+
+    @staticmethod
+    def _record(scope, status: int, elapsed: float) -> None:
+        route = scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        method = scope.get("method", "")
+        http_requests.inc(1, method, path, str(status))
+        http_latency.observe(elapsed, method, path)
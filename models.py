@@ -1,6 +1,6 @@
 from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, Boolean, DateTime, ForeignKey, JSON, UniqueConstraint, Index, Float
+    Column, Integer, String, Boolean, Date, DateTime, ForeignKey, JSON, UniqueConstraint, Index, Float
 )
 
 from sqlalchemy.orm import relationship
@@ -42,9 +42,9 @@ class APIToken(Base):
     expires_at = Column(DateTime, nullable=True, index=True)
     user = relationship("User", back_populates="tokens")
 
+    # expires_at is indexed by index=True above (ix_api_tokens_expires_at)
     __table_args__ = (
         Index("ix_api_tokens_user_active", "user_id", "is_active"),
-        Index("ix_api_tokens_expires_at", "expires_at"),
     )
 
 class TradeSignal(Base):
@@ -76,6 +76,49 @@ class SignalRead(Base):
 
     __table_args__ = (UniqueConstraint("signal_id", "receiver_id", "token_hash", name="uq_signal_read_dedupe"),)
 
+class SignalReadCounter(Base):
+    """
+    Materialized per-token daily quota usage: one row per (receiver, token_hash, UTC day),
+    bumped by crud.record_signal_read whenever it inserts a new SignalRead.
+    Rebuildable from signal_reads via crud.reconcile_read_counters.
+    """
+    __tablename__ = "signal_read_counters"
+    receiver_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    token_hash = Column(String(128), primary_key=True)  # "" when the read had no token hash
+    day = Column(Date, primary_key=True)                # UTC day of read_at
+    reads = Column(Integer, nullable=False, default=0)
+
+class SignalInbox(Base):
+    """
+    Fan-out-on-write delivery (SIGNAL_DELIVERY_MODE=inbox): one row per subscriber of a
+    published signal, so a receiver's catch-up poll is a primary-key range scan on
+    (receiver_id, signal_id). Derived from subscriptions + trade_signals; pruned by retention.
+    """
+    __tablename__ = "signal_inbox"
+    receiver_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    signal_id = Column(Integer, ForeignKey("trade_signals.id"), primary_key=True, index=True)
+
+class WPCallback(Base):
+    """
+    Outbox of WordPress callbacks (token issued/rotated, plan changed). Written in the
+    same transaction as the token change and delivered by wp_outbox's dispatcher.
+    status: pending -> sent | failed (out of attempts) | superseded (a newer row for
+    the same user replaced it before delivery).
+    """
+    __tablename__ = "wp_callback_outbox"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(16), default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_status = Column(Integer, nullable=True)       # HTTP status of the last attempt
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_wp_callback_due", "status", "next_attempt_at"),)
+
 class TradeRecord(Base):
     __tablename__ = "trade_records"
     id = Column(Integer, primary_key=True)
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+class _Waiter:
+    __slots__ = ("sender_ids", "after_id", "loop", "future")
+
+    def __init__(self, sender_ids: frozenset, after_id: int, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        self.sender_ids = sender_ids
+        self.after_id = after_id
+        self.loop = loop
+        self.future = future
+
+    def wake(self) -> None:
+        def _set() -> None:
+            if not self.future.done():
+                self.future.set_result(True)
+        try:
+            self.loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            pass  # loop already closed
+
+
+class SignalNotifier:
+    """
+    In-process publish notification for long-polls and streams.
+
+    Tracks the newest committed signal id per sender ("watermark") and wakes
+    asyncio waiters parked on a set of senders. publish() is called from
+    crud's after-commit hook, i.e. from threadpool threads, so wakeups are
+    handed to each waiter's loop with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: Dict[int, int] = {}
+        self._waiters: Set[_Waiter] = set()
+
+    def seed(self, latest: Dict[int, int]) -> None:
+        """Prime watermarks (e.g. from the DB at startup) without waking anyone."""
+        with self._lock:
+            for sender_id, signal_id in latest.items():
+                if signal_id > self._latest.get(sender_id, 0):
+                    self._latest[sender_id] = signal_id
+
+    def publish_many(self, pairs: Iterable[Tuple[int, int]]) -> None:
+        """pairs: (sender_id, signal_id) of freshly committed signals."""
+        woken = []
+        with self._lock:
+            for sender_id, signal_id in pairs:
+                if signal_id > self._latest.get(sender_id, 0):
+                    self._latest[sender_id] = signal_id
+                for w in self._waiters:
+                    if sender_id in w.sender_ids and signal_id > w.after_id:
+                        woken.append(w)
+            for w in woken:
+                self._waiters.discard(w)
+        for w in woken:
+            w.wake()
+
+    def publish(self, sender_id: int, signal_id: int) -> None:
+        self.publish_many([(sender_id, signal_id)])
+
+    def latest_id(self, sender_ids: Iterable[int]) -> int:
+        with self._lock:
+            return max((self._latest.get(s, 0) for s in sender_ids), default=0)
+
+    async def wait(self, sender_ids: Iterable[int], after_id: int, timeout: Optional[float]) -> bool:
+        """
+        Park until a signal newer than after_id is committed by one of sender_ids.
+        Returns True on wakeup, False on timeout. Holds no thread and no DB connection.
+        """
+        senders = frozenset(sender_ids)
+        if not senders:
+            # Nothing can ever wake us; behave like a plain timeout
+            if timeout:
+                await asyncio.sleep(timeout)
+            return False
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(senders, int(after_id or 0), loop, loop.create_future())
+        with self._lock:
+            if max((self._latest.get(s, 0) for s in senders), default=0) > waiter.after_id:
+                return True
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"senders": len(self._latest), "waiters": len(self._waiters)}
+
+
+signal_notifier = SignalNotifier()
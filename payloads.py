@@ -0,0 +1,62 @@
+import os
+import json
+from typing import Any, Iterable
+
+from fastapi.responses import Response
+
+from caches import TTLCache
+from schemas import TradeSignalOut
+
+# Signals never change after publish, so each one is validated and encoded once
+# (at publish, or on first read for rows that came from another worker / SQL) and
+# receivers' responses are stitched together from the cached bytes.
+
+# signal id -> TradeSignalOut JSON bytes
+signal_json_cache = TTLCache(
+    maxsize=int(os.getenv("SIGNAL_JSON_CACHE_MAXSIZE", "20000")),
+    ttl=float(os.getenv("SIGNAL_JSON_CACHE_TTL_SEC", "86400")),
+)
+
+
+def _encode(sig: Any) -> bytes:
+    # Same steps as FastAPI's response_model path + JSONResponse.render, so the
+    # bytes are identical to what the endpoints produced before
+    return json.dumps(
+        TradeSignalOut.model_validate(sig).model_dump(mode="json"),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def signal_json(sig: Any) -> bytes:
+    """JSON for one signal (anything TradeSignalOut accepts from attributes)."""
+    raw = signal_json_cache.get(sig.id)
+    if raw is None:
+        raw = _encode(sig)
+        signal_json_cache.set(sig.id, raw)
+    return raw
+
+
+def warm(sigs: Iterable[Any]) -> None:
+    for s in sigs:
+        signal_json(s)
+
+
+def json_array(sigs: Iterable[Any]) -> bytes:
+    """List[TradeSignalOut] body."""
+    return b"[" + b",".join(signal_json(s) for s in sigs) + b"]"
+
+
+def latest_json(sigs: Iterable[Any]) -> bytes:
+    """LatestSignalOut body: {"items": [...]}."""
+    return b'{"items":' + json_array(sigs) + b"}"
+
+
+class RawJSONResponse(Response):
+    """application/json response whose content is already-encoded bytes."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content
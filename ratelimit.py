@@ -0,0 +1,136 @@
+import os
+import math
+import time
+import threading
+from typing import Optional, Tuple
+
+from caches import TTLCache
+from crud import PLAN_DEFAULTS, normalize_plan
+from database import engine
+
+# Two cheap checks in front of the DB pool, both per uvicorn worker (N workers
+# admit N times as much):
+#
+# * TokenBucketLimiter: requests per second per API token (keyed by token hash),
+#   with rate and burst taken from the plan in crud.PLAN_DEFAULTS. Over the limit
+#   => 429 + Retry-After. Checked after auth, which the token cache usually
+#   answers without a connection.
+# * AdmissionControl: load shedding for the "poll" lane (everything but publishing)
+#   before it asks the pool for a connection. An admitted poll takes one of the
+#   pool's connections minus ADMISSION_RESERVED as a slot (atomically, so a burst
+#   can't overshoot) and gives it back when its session closes or it parks; once
+#   the slots are taken, or a checkout recently waited longer than
+#   ADMISSION_WAIT_BUDGET_MS, polls are turned away with 503 + Retry-After. The
+#   "publish" lane is always admitted and so always finds a reserved connection.
+#
+#   RATE_LIMIT=0                      1 enables the token bucket (existing EAs have never seen 429)
+#   RATE_LIMIT_IDLE_SEC=600           forget buckets idle this long (they are full again by then)
+#   ADMISSION_CONTROL=0               1 enables load shedding
+#   ADMISSION_RESERVED=2              connections polls may not take
+#   ADMISSION_WAIT_BUDGET_MS=100      checkout wait that counts as "pool under pressure"
+#   ADMISSION_WINDOW_SEC=1            how long a slow last checkout keeps shedding on
+
+_ON = ("1", "true", "yes", "on")
+
+
+class TokenBucketLimiter:
+    """
+    One bucket per token hash, refilled continuously at the plan's rate_per_sec up to
+    its burst. A plan change (upgrade/downgrade) applies from the next request.
+    """
+
+    def __init__(self, idle_sec: float = float(os.getenv("RATE_LIMIT_IDLE_SEC", "600")), maxsize: int = 100_000):
+        # bucket: [tokens, last refill (monotonic)]
+        self._buckets = TTLCache(maxsize=maxsize, ttl=idle_sec)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def limits(plan: Optional[str]):
+        info = PLAN_DEFAULTS[normalize_plan(plan)]
+        return float(info["rate_per_sec"]), float(info["burst"])
+
+    def acquire(self, key: str, plan: Optional[str]) -> float:
+        """Take one token. Returns 0 if allowed, else seconds until one is available."""
+        rate, burst = self.limits(plan)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [burst, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                wait = 0.0
+            else:
+                bucket[0] = tokens
+                wait = (1 - tokens) / rate
+            self._buckets.set(key, bucket)
+        return wait
+
+
+class AdmissionControl:
+    """
+    Decides from the pool's own counters whether a request may go on to check out a
+    connection. Needs a database.TimedQueuePool (other pools are never shed).
+    """
+
+    def __init__(
+        self,
+        pool,
+        reserved: int = int(os.getenv("ADMISSION_RESERVED", "2")),
+        wait_budget: float = float(os.getenv("ADMISSION_WAIT_BUDGET_MS", "100")) / 1000,
+        window: float = float(os.getenv("ADMISSION_WINDOW_SEC", "1")),
+    ):
+        self.pool = pool
+        self.reserved = max(0, reserved)
+        self.wait_budget = wait_budget
+        self.window = window
+        self._lock = threading.Lock()
+        self.polls = 0  # admitted poll-lane requests holding a slot
+
+    def capacity(self) -> Optional[int]:
+        size = getattr(self.pool, "size", None)
+        if not callable(size):
+            return None
+        return size() + max(0, getattr(self.pool, "_max_overflow", 0))
+
+    def admit(self, lane: str) -> Tuple[bool, Optional[str]]:
+        """
+        (slot, reason): reason is None to admit, otherwise why the request is shed.
+        slot is True when a poll slot was taken; hand it back with release().
+        """
+        if lane == "publish":
+            return False, None
+        capacity = self.capacity()
+        if capacity is None:
+            return False, None
+        limit = max(1, capacity - self.reserved)
+        with self._lock:
+            # Other unlaned requests (admin, streams) use connections too: count those
+            if self.polls >= limit or self.pool.checkedout() >= limit:
+                return False, "saturated"
+            last_wait, last_at = getattr(self.pool, "last_wait", (0.0, 0.0))
+            if last_wait > self.wait_budget and time.monotonic() - last_at < self.window:
+                return False, "slow_checkout"
+            self.polls += 1
+        return True, None
+
+    def release(self) -> None:
+        with self._lock:
+            self.polls = max(0, self.polls - 1)
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.window))
+
+
+RATE_LIMIT = os.getenv("RATE_LIMIT", "0").strip().lower() in _ON
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "0").strip().lower() in _ON
+
+limiter = TokenBucketLimiter()
+admission = AdmissionControl(engine.pool)
+
+
+def retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
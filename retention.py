@@ -0,0 +1,252 @@
+import os
+import gzip
+import json
+import time
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import Table, func, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import SignalInbox, SignalRead, SignalReadCounter, TradeSignal
+from sweeper import PeriodicJob
+
+log = logging.getLogger("retention")
+
+# Keeps the hot tables bounded. signal_reads only feeds today's quota (and the
+# counter reconciler), trade_signals only feeds polls and streams, so old rows are
+# appended to gzip'd NDJSON files and deleted in short primary-key-ordered chunks,
+# each in its own transaction, while the job's worker_lock keeps other workers out.
+#
+# Rows are archived before their delete commits; a crash in between archives the
+# chunk again on the next run, so archives are at-least-once (dedupe on "id").
+#
+# Deleting is irreversible, so nothing runs unless enabled: set an interval and an
+# absolute RETENTION_ARCHIVE_DIR (or "none" to delete without archiving); a run
+# without either refuses to delete anything.
+#
+#   RETENTION_INTERVAL_SEC=0          how often to run (0 = never)
+#   SIGNAL_READS_RETAIN_DAYS=2        UTC days of signal_reads kept (today counts as 1)
+#   TRADE_SIGNALS_RETAIN_DAYS=0       UTC days of trade_signals kept (0 = keep forever)
+#   SIGNAL_INBOX_RETAIN_DAYS=7        UTC days of signal_inbox kept (deleted, not archived)
+#   RETENTION_ARCHIVE_DIR=            absolute dir for <table>-YYYYMMDD.ndjson.gz, or "none"
+#   RETENTION_BATCH=5000              rows per delete transaction
+#   RETENTION_MAX_BATCHES=200         chunks per run; the job re-kicks itself if more remain
+#   RETENTION_PAUSE_SEC=0.05          sleep between chunks to leave room for live traffic
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _cutoff(days: int, now: Optional[datetime] = None) -> datetime:
+    """Start of the oldest UTC day that is kept."""
+    today = (now or _utc_now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=max(days, 1) - 1)
+
+
+def _json_default(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    raise TypeError(f"not JSON serializable: {type(v).__name__}")
+
+
+class Archiver:
+    """
+    Appends rows to <dir>/<table>-YYYYMMDD.ndjson.gz, one gzip member per call.
+    directory "none" writes nothing; anything else must be an absolute path
+    (configured is False otherwise, and retention won't run).
+    """
+
+    def __init__(self, directory: Optional[str]):
+        directory = (directory or "").strip()
+        self.configured = directory.lower() == "none" or os.path.isabs(directory)
+        self.directory = directory if os.path.isabs(directory) else None
+
+    def write(self, table: str, rows: Sequence[Dict], ts_column: str) -> None:
+        if not self.directory or not rows:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        by_day: Dict[str, List[Dict]] = {}
+        for r in rows:
+            by_day.setdefault(r[ts_column].strftime("%Y%m%d"), []).append(r)
+        for day, day_rows in by_day.items():
+            path = os.path.join(self.directory, f"{table}-{day}.ndjson.gz")
+            data = b"".join(
+                json.dumps(r, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+                for r in day_rows
+            )
+            with open(path, "ab") as fh:
+                with gzip.GzipFile(fileobj=fh, mode="wb") as gz:
+                    gz.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+
+class RetentionPolicy:
+    """
+    run(db) is the PeriodicJob body. `db` only holds the worker lock; every chunk is
+    read, archived and deleted in its own session so no transaction stays open long.
+    """
+
+    def __init__(
+        self,
+        reads_days: int = int(os.getenv("SIGNAL_READS_RETAIN_DAYS", "2")),
+        signals_days: int = int(os.getenv("TRADE_SIGNALS_RETAIN_DAYS", "0")),
+        inbox_days: int = int(os.getenv("SIGNAL_INBOX_RETAIN_DAYS", "7")),
+        archive_dir: Optional[str] = os.getenv("RETENTION_ARCHIVE_DIR", ""),
+        batch: int = int(os.getenv("RETENTION_BATCH", "5000")),
+        max_batches: int = int(os.getenv("RETENTION_MAX_BATCHES", "200")),
+        pause: float = float(os.getenv("RETENTION_PAUSE_SEC", "0.05")),
+    ):
+        # Quota and the counter reconciler read today's rows; never keep less than that
+        self.reads_days = max(1, reads_days)
+        self.signals_days = signals_days
+        self.inbox_days = max(1, inbox_days)
+        self.archiver = Archiver(archive_dir)
+        self.batch = max(1, batch)
+        self.max_batches = max(1, max_batches)
+        self.pause = pause
+        self.more = False  # set when a run stopped at max_batches with rows left
+        self._budget = 0
+
+    def run(self, db: Session) -> int:
+        self.more = False
+        if not self.archiver.configured:
+            log.error("retention: RETENTION_ARCHIVE_DIR must be an absolute path or \"none\"; nothing deleted")
+            return 0
+        now = _utc_now()
+        self._budget = self.max_batches
+        n = self._prune_counters(now)
+        n += self._sweep(SignalRead.__table__, "read_at", _cutoff(self.reads_days, now))
+        n += self._prune_inbox(_cutoff(self.inbox_days, now))
+        if self.signals_days > 0:
+            n += self._sweep(TradeSignal.__table__, "created_at", _cutoff(self.signals_days, now), dependents=True)
+        if self.more:
+            log.info("retention: stopped after %d chunks with rows left; continuing", self.max_batches)
+        return n
+
+    def _prune_counters(self, now: datetime) -> int:
+        # Counters are rebuildable and only today's are read; drop anything older than yesterday
+        counters = SignalReadCounter.__table__
+        with SessionLocal() as s:
+            res = s.execute(counters.delete().where(counters.c.day < (_cutoff(2, now)).date()))
+            s.commit()
+        return max(res.rowcount or 0, 0)
+
+    def _sweep(self, table: Table, ts_column: str, cutoff: datetime, dependents: bool = False) -> int:
+        """
+        Walk `table` in id order from the oldest row, archiving and deleting chunks
+        until a row at/after `cutoff` is reached. ids grow with the timestamp (both are
+        assigned at insert), so this is a primary-key range scan and needs no index on
+        the timestamp column.
+        """
+        ts = table.c[ts_column]
+        total = 0
+        while self._budget > 0:
+            with SessionLocal() as s:
+                rows = [
+                    dict(r._mapping)
+                    for r in s.execute(select(table).order_by(table.c.id).limit(self.batch))
+                ]
+                old = rows
+                # Stop at the first row that is still within retention
+                for i, r in enumerate(rows):
+                    if r[ts_column] >= cutoff:
+                        old = rows[:i]
+                        break
+                if not old:
+                    return total
+                ids = [r["id"] for r in old]
+                if dependents:
+                    total += self._delete_dependents(s, ids)
+                self.archiver.write(table.name, old, ts_column)
+                s.execute(table.delete().where(table.c.id.in_(ids), ts < cutoff))
+                s.commit()
+            total += len(ids)
+            self._budget -= 1
+            if len(old) < self.batch:
+                return total
+            if self.pause > 0:
+                time.sleep(self.pause)
+        self.more = True
+        return total
+
+    def _delete_dependents(self, s: Session, signal_ids: List[int]) -> int:
+        # signal_reads and signal_inbox have foreign keys to trade_signals: a signal read
+        # today but published before the cutoff takes its reads with it (counters are
+        # unaffected), and any inbox rows a longer inbox retention still holds
+        inbox = SignalInbox.__table__
+        res = s.execute(inbox.delete().where(inbox.c.signal_id.in_(signal_ids)))
+        n = max(res.rowcount or 0, 0)
+        reads = SignalRead.__table__
+        rows = [dict(r._mapping) for r in s.execute(select(reads).where(reads.c.signal_id.in_(signal_ids)))]
+        if not rows:
+            return n
+        self.archiver.write(reads.name, rows, "read_at")
+        s.execute(reads.delete().where(reads.c.id.in_([r["id"] for r in rows])))
+        return n + len(rows)
+
+    def _prune_inbox(self, cutoff: datetime) -> int:
+        """
+        Delete inbox rows for signals published before `cutoff`, in chunks of about
+        `batch` rows along the signal_id index (a chunk ends on a signal boundary).
+        """
+        inbox = SignalInbox.__table__
+        with SessionLocal() as s:
+            boundary = _first_signal_id_at(s, cutoff)
+        total = 0
+        while self._budget > 0:
+            with SessionLocal() as s:
+                last = s.execute(
+                    select(inbox.c.signal_id).where(inbox.c.signal_id < boundary)
+                    .order_by(inbox.c.signal_id).offset(self.batch - 1).limit(1)
+                ).scalar()
+                upto = boundary if last is None else min(last + 1, boundary)
+                res = s.execute(inbox.delete().where(inbox.c.signal_id < upto))
+                s.commit()
+            total += max(res.rowcount or 0, 0)
+            self._budget -= 1
+            if upto >= boundary:
+                return total
+            if self.pause > 0:
+                time.sleep(self.pause)
+        self.more = True
+        return total
+
+
+def _first_signal_id_at(s: Session, cutoff: datetime) -> int:
+    """
+    Smallest trade_signals id created at/after `cutoff` (max id + 1 if none). ids grow
+    with created_at, so this is a binary search over primary-key lookups.
+    """
+    tbl = TradeSignal.__table__
+    lo, hi = s.execute(select(func.min(tbl.c.id), func.max(tbl.c.id))).one()
+    if lo is None:
+        return 0
+    hi += 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        row = s.execute(
+            select(tbl.c.id, tbl.c.created_at).where(tbl.c.id >= mid).order_by(tbl.c.id).limit(1)
+        ).one()
+        if row.created_at >= cutoff:
+            hi = row.id if row.id < hi else mid
+        else:
+            lo = row.id + 1
+    return lo
+
+
+policy = RetentionPolicy()
+
+
+def _run(db: Session) -> int:
+    n = policy.run(db)
+    if policy.more:
+        job.kick()  # backlog left (e.g. first run on a large table): continue right away
+    return n
+
+
+job = PeriodicJob("retention", interval=float(os.getenv("RETENTION_INTERVAL_SEC", "0")), fn=_run)
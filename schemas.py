@@ -36,7 +36,7 @@ class TradeRecordCreate(BaseModel):
 
 
 class TradeRecordOut(BaseModel):
-    id: int
+    id: Optional[int] = None  # None when accepted by the write-behind buffer
     symbol: str
     action: str
     details: Optional[Any] = None
@@ -77,6 +77,8 @@ class VerifyOut(BaseModel):
 
 class ActivationsList(BaseModel):
     items: List[UserOut] = Field(default_factory=list)
+    # Keyset paging (?limit=): pass as ?cursor= for the next page; None on the last page
+    next_cursor: Optional[int] = None
 
 # ---- Admin issue token (kept from existing server behaviour) ----
 class AdminIssueTokenRequest(BaseModel):
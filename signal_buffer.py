@@ -0,0 +1,259 @@
+import os
+import heapq
+import bisect
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+@dataclass(frozen=True)
+class SignalSnapshot:
+    """Detached, read-only copy of a TradeSignal row (what receivers get served)."""
+    id: int
+    user_id: int
+    symbol: str
+    action: str
+    sl_pips: Optional[int]
+    tp_pips: Optional[int]
+    lot_size: Optional[float]
+    details: Any
+    created_at: datetime
+
+    @classmethod
+    def from_row(cls, row) -> "SignalSnapshot":
+        return cls(
+            id=row.id, user_id=row.user_id, symbol=row.symbol, action=row.action,
+            sl_pips=row.sl_pips, tp_pips=row.tp_pips, lot_size=row.lot_size,
+            details=row.details, created_at=row.created_at,
+        )
+
+
+class _SenderRing:
+    __slots__ = ("items", "ids", "floor_id", "floor_created_at", "missing")
+
+    def __init__(self, floor_id: int = 0, floor_created_at: Optional[datetime] = None):
+        self.items: List[SignalSnapshot] = []  # ascending by id
+        self.ids: List[int] = []
+        # Everything of this sender with id > floor_id is in `items` (or in `missing`).
+        # floor_id == 0 means the ring holds the sender's complete history.
+        self.floor_id = floor_id
+        self.floor_created_at = floor_created_at
+        self.missing: Set[int] = set()
+
+    def covers(self, since_id: Optional[int], min_created_at: Optional[datetime]) -> bool:
+        if self.floor_id == 0:
+            return True
+        if since_id is not None and since_id >= self.floor_id:
+            return True
+        return (min_created_at is not None and self.floor_created_at is not None
+                and self.floor_created_at < min_created_at)
+
+
+class SignalRingBuffer:
+    """
+    Per-sender bounded buffer of the most recent signals, so receiver polls for
+    fresh signals are answered from memory.
+
+    * add_many(): rows this worker committed (from crud's after-commit hook)
+    * note_remote(): ids other workers committed (from the fan-out bus); they are
+      recorded as missing and fetched by id (fill) before the ring is trusted
+    * unsettled()/settle(): ids are one global sequence, so a gap below the newest
+      id seen may be a signal another worker committed whose bus message is still
+      in flight. Until the caller has checked that range against the DB (and noted
+      what it found), query()/latest() don't answer.
+    * query()/latest(): return None whenever the ring can't prove it holds the full
+      answer (cursor older than the ring, missing ids, unknown sender), and the
+      caller falls back to SQL.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.RLock()
+        self._rings: Dict[int, _SenderRing] = {}
+        self._warmed = False
+        # Every id <= _settled_id is accounted for (seen, or checked against the DB);
+        # _seen holds ids above it, so a contiguous run settles without any query
+        self._settled_id = 0
+        self._seen: Set[int] = set()
+        self.hits = 0
+        self.misses = 0
+
+    # ---- filling ----
+    def warm(self, rows_by_sender: Dict[int, List[Any]]) -> None:
+        """Load the newest `capacity` rows per sender (ascending) at startup."""
+        with self._lock:
+            self._settle(max((r[-1].id for r in rows_by_sender.values() if r), default=0))
+            for sender_id, rows in rows_by_sender.items():
+                snaps = [r if isinstance(r, SignalSnapshot) else SignalSnapshot.from_row(r) for r in rows]
+                ring = self._rings.get(sender_id)
+                if ring is None:
+                    if len(snaps) < self.capacity:
+                        ring = _SenderRing()
+                    else:
+                        # Older history exists; treat the oldest loaded row as the boundary
+                        ring = _SenderRing(snaps[0].id - 1, snaps[0].created_at)
+                    self._rings[sender_id] = ring
+                for s in snaps:
+                    self._insert(ring, s)
+            self._warmed = True
+
+    def add_many(self, snaps: Iterable[SignalSnapshot]) -> None:
+        with self._lock:
+            for s in snaps:
+                self._see(s.id)
+                ring = self._ring_for(s.user_id)
+                if ring is not None:
+                    self._insert(ring, s)
+
+    def note_remote(self, pairs: Iterable[Tuple[int, int]]) -> None:
+        with self._lock:
+            for sender_id, signal_id in pairs:
+                self._see(signal_id)
+                ring = self._ring_for(sender_id)
+                if ring is None or signal_id <= ring.floor_id:
+                    continue
+                i = bisect.bisect_left(ring.ids, signal_id)
+                if i == len(ring.ids) or ring.ids[i] != signal_id:
+                    ring.missing.add(signal_id)
+
+    def missing_ids(self, sender_ids: Iterable[int]) -> List[int]:
+        with self._lock:
+            out: List[int] = []
+            for s in sender_ids:
+                ring = self._rings.get(s)
+                if ring is not None:
+                    out.extend(ring.missing)
+            return out
+
+    def fill(self, rows: Iterable[Any], requested_ids: Iterable[int]) -> None:
+        """Insert rows fetched for missing ids; ids that no longer exist stop being missing."""
+        with self._lock:
+            for r in rows:
+                s = r if isinstance(r, SignalSnapshot) else SignalSnapshot.from_row(r)
+                ring = self._rings.get(s.user_id)
+                if ring is not None:
+                    self._insert(ring, s)
+            requested = set(requested_ids)
+            for ring in self._rings.values():
+                ring.missing -= requested
+
+    def unsettled(self) -> Optional[Tuple[int, int]]:
+        """(settled, top) when ids in settled < id <= top haven't been checked against the DB."""
+        with self._lock:
+            if self._seen:
+                return self._settled_id, max(self._seen)
+            return None
+
+    def settle(self, upto: int) -> None:
+        """The caller noted every signal committed with id <= upto (note_remote)."""
+        with self._lock:
+            self._settle(upto)
+
+    def _see(self, signal_id: int) -> None:
+        if signal_id > self._settled_id:
+            self._seen.add(signal_id)
+            if signal_id == self._settled_id + 1:
+                self._settle(signal_id)
+
+    def _settle(self, upto: int) -> None:
+        # Caller holds the lock
+        self._settled_id = max(self._settled_id, upto)
+        while self._settled_id + 1 in self._seen:
+            self._settled_id += 1
+        self._seen = {i for i in self._seen if i > self._settled_id}
+
+    @property
+    def warmed(self) -> bool:
+        return self._warmed
+
+    def invalidate(self) -> None:
+        """Forget everything (e.g. the bus may have lost messages); SQL until re-warmed."""
+        with self._lock:
+            self._rings.clear()
+            self._warmed = False
+            self._settled_id = 0
+            self._seen.clear()
+
+    def _ring_for(self, sender_id: int) -> Optional[_SenderRing]:
+        ring = self._rings.get(sender_id)
+        if ring is None and self._warmed:
+            # A sender with no rows at warm-up: everything since then reaches us via add/note
+            ring = self._rings[sender_id] = _SenderRing()
+        return ring
+
+    def _insert(self, ring: _SenderRing, s: SignalSnapshot) -> None:
+        if s.id <= ring.floor_id:
+            return
+        i = bisect.bisect_left(ring.ids, s.id)
+        if i < len(ring.ids) and ring.ids[i] == s.id:
+            return
+        ring.ids.insert(i, s.id)
+        ring.items.insert(i, s)
+        ring.missing.discard(s.id)
+        while len(ring.items) > self.capacity:
+            evicted = ring.items.pop(0)
+            ring.ids.pop(0)
+            ring.floor_id = evicted.id
+            if ring.floor_created_at is None or evicted.created_at > ring.floor_created_at:
+                ring.floor_created_at = evicted.created_at
+
+    # ---- reading ----
+    def query(
+        self,
+        sender_ids: Iterable[int],
+        since_id: Optional[int],
+        min_created_at: Optional[datetime],
+        limit: int,
+    ) -> Optional[List[SignalSnapshot]]:
+        """Same contract as crud.get_signals_for_receiver_since (ascending ids), or None."""
+        with self._lock:
+            if self._seen:
+                self.misses += 1
+                return None
+            streams = []
+            for sender_id in set(sender_ids):
+                ring = self._rings.get(sender_id)
+                if ring is None or ring.missing or not ring.covers(since_id, min_created_at):
+                    self.misses += 1
+                    return None
+                start = bisect.bisect_right(ring.ids, since_id) if since_id else 0
+                streams.append(ring.items[start:])
+            self.hits += 1
+        out: List[SignalSnapshot] = []
+        for s in heapq.merge(*streams, key=lambda x: x.id):
+            if min_created_at is not None and s.created_at < min_created_at:
+                continue
+            out.append(s)
+            if len(out) >= limit:
+                break
+        return out
+
+    def latest(self, sender_ids: Iterable[int], limit: int) -> Optional[List[SignalSnapshot]]:
+        """Newest `limit` signals across senders, ascending; None if the ring might be short."""
+        with self._lock:
+            if self._seen:
+                self.misses += 1
+                return None
+            pool: List[SignalSnapshot] = []
+            for sender_id in set(sender_ids):
+                ring = self._rings.get(sender_id)
+                if ring is None or ring.missing or (ring.floor_id and len(ring.items) < limit):
+                    self.misses += 1
+                    return None
+                pool.extend(ring.items[-limit:])
+            self.hits += 1
+        return sorted(pool, key=lambda x: x.id)[-limit:] if limit else []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "senders": len(self._rings),
+                "capacity_per_sender": self.capacity,
+                "signals": sum(len(r.items) for r in self._rings.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+signal_buffer = SignalRingBuffer(int(os.getenv("SIGNAL_BUFFER_PER_SENDER", "256")))
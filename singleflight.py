@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Request coalescing for identical concurrent reads. At a poll tick thousands of
+# receivers that follow the same senders ask the same signal query; the first
+# caller (the leader) runs it and everyone else with the same key waits for and
+# shares that result, which stays reusable for `window` seconds after it lands.
+# Only the query is shared: quota checks and read accounting stay per receiver.
+#
+#   SIGNAL_SINGLEFLIGHT=1                  0 runs every query separately
+#   SIGNAL_SINGLEFLIGHT_WINDOW_MS=250      how long a finished result is reused
+#   SIGNAL_SINGLEFLIGHT_AGE_BUCKET_SEC=1   max_age_sec cut-offs are rounded down to this
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "finished_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.finished_at = 0.0
+
+
+class SingleFlight:
+    """
+    do(key, fn) runs fn() once per key among concurrent callers and returns
+    (result, shared). Errors propagate to every caller waiting on that run and are
+    not kept. Thread-safe; sync endpoints call it from the threadpool.
+    """
+
+    def __init__(self, window: float, maxsize: int = 4096):
+        self.window = float(window)
+        self.maxsize = max(1, int(maxsize))
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and (call.error is not None or now - call.finished_at >= self.window):
+                call = None
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+                if len(self._calls) > self.maxsize:
+                    self._prune(now)
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            call.done.set()
+            if self.window <= 0 or call.error is not None:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+        return call.result, False
+
+    def _prune(self, now: float) -> None:
+        # Caller holds the lock: drop finished results past the window
+        for k in [k for k, c in self._calls.items() if c.done.is_set() and now - c.finished_at >= self.window]:
+            del self._calls[k]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.leaders + self.shared
+            return {
+                "keys": len(self._calls),
+                "window_ms": round(self.window * 1000),
+                "queries": self.leaders,
+                "shared": self.shared,
+                "shared_ratio": round(self.shared / total, 4) if total else 0.0,
+            }
+
+
+ENABLED = os.getenv("SIGNAL_SINGLEFLIGHT", "1").strip().lower() in ("1", "true", "yes", "on")
+AGE_BUCKET_SEC = max(1, int(os.getenv("SIGNAL_SINGLEFLIGHT_AGE_BUCKET_SEC", "1")))
+
+signal_queries = SingleFlight(window=float(os.getenv("SIGNAL_SINGLEFLIGHT_WINDOW_MS", "250")) / 1000)
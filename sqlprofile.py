@@ -0,0 +1,130 @@
+import os
+import time
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+log = logging.getLogger("sqlprofile")
+
+# Opt-in per-request SQL profiling (SQL_PROFILE=1). Engine events time every
+# cursor execution and charge it to the request found in a context variable;
+# Starlette's threadpool copies context, so sync handlers and dependencies are
+# covered too. Background jobs run outside any request and are not profiled.
+#
+#   SQL_PROFILE=1              collect, log slow requests and likely N+1s
+#   SQL_PROFILE_HEADER=1       also send X-SQL-Profile on every response
+#   SQL_PROFILE_SLOW_MS=100    log requests whose DB time reaches this
+#   SQL_PROFILE_REPEAT=3       same statement this many times => likely N+1
+
+ENABLED = os.getenv("SQL_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+HEADER = os.getenv("SQL_PROFILE_HEADER", "").strip().lower() in ("1", "true", "yes", "on")
+SLOW_MS = float(os.getenv("SQL_PROFILE_SLOW_MS", "100"))
+REPEAT = int(os.getenv("SQL_PROFILE_REPEAT", "3"))
+TOP_N = 3
+
+HEADER_NAME = "X-SQL-Profile"
+
+
+class Profile:
+    __slots__ = ("statements",)
+
+    def __init__(self):
+        self.statements: List[Tuple[str, float]] = []  # (sql, seconds)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def db_time(self) -> float:
+        return sum(t for _, t in self.statements)
+
+    def slowest(self, n: int = TOP_N) -> List[Tuple[str, float]]:
+        return sorted(self.statements, key=lambda s: s[1], reverse=True)[:n]
+
+    def repeated(self, threshold: int = REPEAT) -> List[Tuple[str, int]]:
+        """Statements issued at least `threshold` times: likely N+1 loops."""
+        counts = Counter(sql for sql, _ in self.statements)
+        return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+    def header(self) -> str:
+        slowest = self.slowest(1)
+        return "count=%d; db_ms=%.2f; max_ms=%.2f; repeated=%d" % (
+            self.count,
+            self.db_time * 1000,
+            slowest[0][1] * 1000 if slowest else 0.0,
+            len(self.repeated()),
+        )
+
+
+_current: ContextVar[Optional[Profile]] = ContextVar("sql_profile", default=None)
+
+
+def current() -> Optional[Profile]:
+    return _current.get()
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None and context is not None:
+        context._sqlprofile_t0 = time.perf_counter()
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    prof = _current.get()
+    t0 = getattr(context, "_sqlprofile_t0", None)
+    if prof is not None and t0 is not None:
+        prof.statements.append((statement, time.perf_counter() - t0))
+
+
+def install(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
+
+
+def _short(sql: str, n: int = 200) -> str:
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= n else sql[:n] + "..."
+
+
+class SQLProfileMiddleware:
+    """Pure ASGI middleware: one Profile per HTTP request, reported when it finishes."""
+
+    def __init__(self, app, header: bool = HEADER):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        prof = Profile()
+        token = _current.set(prof)
+
+        async def send_wrapper(message):
+            if self.header and message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (HEADER_NAME.lower().encode("latin-1"), prof.header().encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._report(scope, prof)
+
+    @staticmethod
+    def _report(scope, prof: Profile) -> None:
+        path = scope.get("path", "")
+        for sql, n in prof.repeated():
+            log.warning("%s %s: statement ran %d times (N+1?): %s", scope.get("method"), path, n, _short(sql))
+        if prof.db_time * 1000 >= SLOW_MS:
+            log.warning(
+                "%s %s: %d statements, %.1f ms in SQL; slowest: %s",
+                scope.get("method"), path, prof.count, prof.db_time * 1000,
+                " | ".join("%.1f ms %s" % (t * 1000, _short(sql, 120)) for sql, t in prof.slowest()),
+            )
@@ -0,0 +1,119 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl  # POSIX only; other platforms fall back to the in-process lock
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+import metrics
+from database import SessionLocal
+
+log = logging.getLogger("sweeper")
+
+LOCK_DIR = os.getenv("SWEEPER_LOCK_DIR", tempfile.gettempdir())
+
+
+def _advisory_key(name: str) -> int:
+    # Stable signed 64-bit key for pg_try_advisory_xact_lock
+    return int.from_bytes(hashlib.sha1(name.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+@contextmanager
+def worker_lock(db: Session, name: str) -> Iterator[bool]:
+    """
+    Cross-worker mutex for periodic jobs. Yields True if this process won the lock.
+      * Postgres: transaction-scoped advisory lock (released on commit/rollback).
+      * Otherwise: non-blocking flock on a file in SWEEPER_LOCK_DIR (single host).
+    """
+    if db.bind.dialect.name == "postgresql":
+        got = db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _advisory_key(name)}).scalar()
+        yield bool(got)
+        return
+
+    if fcntl is None:
+        yield True
+        return
+    path = os.path.join(LOCK_DIR, f"trade_signal_server.{name}.lock")
+    with open(path, "a") as fh:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+class PeriodicJob:
+    """
+    Runs fn(db) every `interval` seconds on a daemon thread, in its own session and
+    transaction, under worker_lock(name) so only one uvicorn worker does it per tick.
+    interval <= 0 disables the thread; run_once() still works (used at startup).
+    kick() runs the next tick now instead of waiting out the interval.
+    """
+
+    def __init__(self, name: str, interval: float, fn: Callable[[Session], Optional[int]]):
+        self.name = name
+        self.interval = float(interval)
+        self.fn = fn
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            with worker_lock(db, self.name) as acquired:
+                if not acquired:
+                    db.rollback()
+                    return None
+                t0 = time.perf_counter()
+                result = self.fn(db)
+                db.commit()
+                metrics.job_duration.observe(time.perf_counter() - t0, self.name)
+            if result:
+                log.info("%s: %s rows in %.1f ms", self.name, result, (time.perf_counter() - t0) * 1000)
+            return result
+        except Exception:
+            db.rollback()
+            log.exception("%s failed", self.name)
+            return None
+        finally:
+            db.close()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self.run_once()
+
+    def kick(self) -> None:
+        self._wake.set()
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
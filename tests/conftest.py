@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+
+# Modules read their settings at import time: configure a throwaway SQLite
+# database (and small buffers, so deep cursors fall through to SQL) first
+_TMP = tempfile.mkdtemp(prefix="trade_signal_tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_TMP}/primary.db",
+    ADMIN_TOKEN="test-admin",
+    SWEEPER_LOCK_DIR=_TMP,
+    SIGNAL_BUFFER_PER_SENDER="4",
+    STREAM_KEEPALIVE_SEC="0.3",
+)
+for _name in ("READ_DATABASE_URL", "SIGNAL_BUS", "SIGNAL_DELIVERY_MODE", "TRADE_WRITE_BEHIND", "SQL_PROFILE",
+              "RATE_LIMIT", "ADMISSION_CONTROL", "WP_CALLBACK_URL", "WP_CALLBACK_KEY", "RETENTION_INTERVAL_SEC",
+              "RETENTION_ARCHIVE_DIR", "TRADE_SIGNALS_RETAIN_DAYS", "TRADE_BUFFER_DEAD_LETTER"):
+    os.environ.pop(_name, None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import caches
+import crud
+import fanout
+import main
+import models
+import singleflight
+from database import Base, SessionLocal, engine
+from notifier import signal_notifier
+from signal_buffer import signal_buffer
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Empty tables and forget every in-process cache, watermark and buffer."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    for cache in (caches.token_cache, caches.subscription_cache, caches.sender_id_cache):
+        cache.clear()
+    signal_buffer.invalidate()
+    signal_notifier._latest.clear()
+    monkeypatch.setattr(singleflight, "signal_queries", singleflight.SingleFlight(window=0.25))
+    monkeypatch.setattr(fanout.signal_bus, "cross_worker", False)
+    yield
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def db():
+    s = SessionLocal()
+    try:
+        yield s
+    finally:
+        s.close()
+
+
+@pytest.fixture
+def issue(client):
+    """issue(username, plan) -> Authorization headers for a fresh token."""
+    def _issue(username: str, plan: str = "gold") -> dict:
+        r = client.post("/admin/issue_token", json={"username": username, "plan": plan}, headers=ADMIN)
+        assert r.status_code == 200, r.text
+        return {"Authorization": f"Bearer {r.json()['api_key']}"}
+    return _issue
+
+
+@pytest.fixture
+def foreign_insert():
+    """Commit a signal the way another worker would: no hooks here, no bus message."""
+    def _insert(sender_id: int, symbol: str = "EURUSD", action: str = "buy") -> int:
+        with SessionLocal() as s:
+            sig = models.TradeSignal(user_id=sender_id, symbol=symbol, action=action, created_at=crud.utc_now())
+            s.add(sig)
+            s.commit()
+            return sig.id
+    return _insert
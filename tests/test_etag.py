@@ -0,0 +1,62 @@
+import crud
+import fanout
+
+
+def _get(client, headers, etag=None, **params):
+    if etag:
+        headers = {**headers, "If-None-Match": etag}
+    return client.get("/signals", headers=headers, params=params)
+
+
+def test_unchanged_poll_is_not_modified(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    bob = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    first = foreign_insert(sender_id)
+    r = _get(client, bob, since_id=0)
+    etag = r.headers["etag"]
+    assert r.headers["cache-control"] == "private, no-cache"
+    r = _get(client, bob, etag, since_id=0)
+    assert r.status_code == 304 and r.headers["etag"] == etag
+    assert _get(client, bob, "W/\"other\", " + etag, since_id=0).status_code == 304
+
+    # Another worker's insert changes the answer even though no bus message arrived
+    second = foreign_insert(sender_id)
+    r = _get(client, bob, etag, since_id=0)
+    assert r.status_code == 200
+    assert [s["id"] for s in r.json()] == [first, second]
+
+
+def test_next_page_is_never_not_modified(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    bob = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    ids = [foreign_insert(sender_id) for _ in range(3)]
+    r = _get(client, bob, since_id=0, limit=2)
+    assert [s["id"] for s in r.json()] == ids[:2]
+    r = _get(client, bob, r.headers["etag"], since_id=ids[1], limit=2)
+    assert r.status_code == 200
+    assert [s["id"] for s in r.json()] == ids[2:]
+
+
+def test_not_modified_consumes_no_quota(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    fred = issue("fred", plan="silver")  # three signals a day
+    sender_id = crud.resolve_sender_id(db)
+    foreign_insert(sender_id)
+    etag = _get(client, fred, since_id=0).headers["etag"]
+    for _ in range(5):
+        assert _get(client, fred, etag, since_id=0).status_code == 304
+    assert client.get("/auth/verify", headers=fred).json()["remaining_today"] == 2
+
+
+def test_quota_exhaustion_changes_the_etag(client, issue, db, foreign_insert, monkeypatch):
+    monkeypatch.setattr(fanout.signal_bus, "cross_worker", True)
+    issue("farm_robot")
+    fred = issue("fred", plan="free")
+    sender_id = crud.resolve_sender_id(db)
+    foreign_insert(sender_id)
+    etag = _get(client, fred, since_id=0).headers["etag"]  # delivers the day's one signal
+    r = _get(client, fred, etag, since_id=0)
+    assert r.status_code == 200 and r.json() == []
+    assert r.headers["etag"] != etag
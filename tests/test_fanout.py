@@ -0,0 +1,74 @@
+import json
+import time
+
+import crud
+import fanout
+from notifier import signal_notifier
+from signal_buffer import signal_buffer
+
+
+class _Inbox:
+    def __init__(self):
+        self.pairs = []
+        self.users = []
+
+    def start(self, bus):
+        bus.start(self.pairs.extend, on_invalidate=self.users.extend)
+        return bus
+
+
+def test_memory_bus_reaches_other_members_only():
+    a_in, b_in = _Inbox(), _Inbox()
+    a = a_in.start(fanout.MemoryBus())
+    b = b_in.start(fanout.MemoryBus())
+    try:
+        a.publish([(1, 10), (2, 11)])
+        a.invalidate_users([7])
+        assert b_in.pairs == [(1, 10), (2, 11)]
+        assert b_in.users == [7]
+        assert a_in.pairs == [] and a_in.users == []
+    finally:
+        a.stop()
+        b.stop()
+    assert not fanout.MemoryBus.cross_worker
+
+
+def test_unix_socket_bus_round_trip(tmp_path):
+    a_in, b_in = _Inbox(), _Inbox()
+    a = a_in.start(fanout.UnixSocketBus(str(tmp_path)))
+    b = b_in.start(fanout.UnixSocketBus(str(tmp_path)))
+    try:
+        a.publish([(1, 10)])
+        b.invalidate_users([3, 4])
+        deadline = time.monotonic() + 5
+        while (not b_in.pairs or not a_in.users) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert b_in.pairs == [(1, 10)]
+        assert a_in.users == [3, 4]
+        assert a_in.pairs == [] and b_in.users == []
+    finally:
+        a.stop()
+        b.stop()
+    assert list(tmp_path.iterdir()) == []  # sockets removed
+
+
+def test_postgres_bus_splits_large_publishes(monkeypatch):
+    bus = fanout.PostgresBus(engine=None)
+    sent = []
+    monkeypatch.setattr(bus, "_notify", sent.extend)
+    pairs = [(1, i) for i in range(1, 2001)]
+    bus.publish(pairs)
+    assert len(sent) > 1
+    assert all(len(p) <= fanout.PG_PAYLOAD_MAX for p in sent)
+    assert [tuple(x) for p in sent for x in json.loads(p)["s"]] == pairs
+
+
+def test_reset_rereads_watermarks(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    sender_id = crud.resolve_sender_id(db)
+    signal_buffer.warm({})
+    signal_id = foreign_insert(sender_id)  # its bus message was lost
+    assert signal_notifier.latest_id({sender_id}) < signal_id
+    fanout._on_reset()
+    assert signal_notifier.latest_id({sender_id}) == signal_id
+    assert not signal_buffer.warmed
@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy import func, select
+
+import crud
+import models
+from database import SessionLocal
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+@pytest.fixture
+def inbox_mode(monkeypatch):
+    monkeypatch.setattr(crud, "DELIVERY_MODE", "inbox")
+
+
+def _publish(client, headers, n=1):
+    return [
+        client.post("/signals/publish", json={"symbol": "EURUSD", "action": "buy"}, headers=headers).json()["id"]
+        for _ in range(n)
+    ]
+
+
+def _publish_as(username, n=1):
+    # Only farm_robot may publish over HTTP; other senders go through crud directly
+    with SessionLocal() as s:
+        sender = s.scalars(select(models.User).where(models.User.username == username)).one()
+        sigs = [crud.create_signal(s, sender, "GBPUSD", "sell") for _ in range(n)]
+        s.commit()
+        return [sig.id for sig in sigs]
+
+
+def _poll(client, headers, since_id, limit=50):
+    return [s["id"] for s in client.get("/signals", headers=headers, params={"since_id": since_id, "limit": limit}).json()]
+
+
+def _inbox(db, receiver_id=None):
+    q = select(models.SignalInbox.signal_id).order_by(models.SignalInbox.signal_id)
+    if receiver_id is not None:
+        q = q.where(models.SignalInbox.receiver_id == receiver_id)
+    return list(db.scalars(q))
+
+
+def _user_id(db, username):
+    return db.scalar(select(models.User.id).where(models.User.username == username))
+
+
+def test_publish_fans_out_to_subscribers(client, issue, db, inbox_mode):
+    robot = issue("farm_robot")
+    issue("alice")
+    bob = issue("bob")
+    issue("carol")
+    ids = _publish(client, robot, 3)
+    other = _publish_as("alice")  # bob doesn't follow alice
+    batch = client.post("/signals/publish/batch", json=[{"symbol": "X", "action": "sell"}] * 2, headers=robot)
+    ids += [s["id"] for s in batch.json()]
+    # alice, bob and carol follow farm_robot
+    assert db.scalar(select(func.count()).select_from(models.SignalInbox)) == 3 * len(ids)
+    assert _inbox(db, _user_id(db, "bob")) == ids
+    assert _poll(client, bob, ids[0]) == ids[1:]
+    assert _poll(client, bob, ids[0], limit=2) == ids[1:3]
+    assert other[0] not in _poll(client, bob, 0)
+
+
+def test_inbox_and_read_mode_agree(client, issue, db, monkeypatch):
+    robot = issue("farm_robot")
+    issue("alice")
+    bob = issue("bob")
+    client.post("/admin/subscribe", params={"receiver_id": _user_id(db, "bob"), "sender_id": _user_id(db, "alice")},
+                headers=ADMIN)
+    monkeypatch.setattr(crud, "DELIVERY_MODE", "inbox")
+    ids = []
+    for _ in range(4):
+        ids += _publish(client, robot, 2) + _publish_as("alice")
+    for since_id in [ids[0], ids[3], ids[-2]]:
+        monkeypatch.setattr(crud, "DELIVERY_MODE", "inbox")
+        from_inbox = _poll(client, bob, since_id, limit=5)
+        monkeypatch.setattr(crud, "DELIVERY_MODE", "read")
+        assert from_inbox == _poll(client, bob, since_id, limit=5)
+        assert from_inbox == [i for i in ids if i > since_id][:5]
+
+
+def test_new_subscriber_is_backfilled(client, issue, db, inbox_mode):
+    robot = issue("farm_robot")
+    issue("alice")
+    ids = _publish(client, robot, 5)
+    carol = issue("carol")  # subscribes to farm_robot after the fact
+    assert _inbox(db, _user_id(db, "carol")) == ids
+    assert _poll(client, carol, ids[1]) == ids[2:]
+
+
+def test_cursor_below_inbox_floor_reads_signals(client, issue, db, inbox_mode):
+    robot = issue("farm_robot")
+    bob = issue("bob")
+    ids = _publish(client, robot, 6)
+    # Retention pruned the oldest inbox rows; the signals themselves remain
+    with SessionLocal() as s:
+        s.execute(models.SignalInbox.__table__.delete().where(models.SignalInbox.signal_id <= ids[2]))
+        s.commit()
+    assert crud.inbox_floor(db) == ids[3]
+    assert _poll(client, bob, ids[0]) == ids[1:]  # below floor - 1: trade_signals
+    assert _poll(client, bob, ids[2]) == ids[3:]  # at floor - 1: inbox
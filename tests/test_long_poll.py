@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import crud
+import fanout
+import models
+from database import SessionLocal
+from notifier import SignalNotifier
+
+
+def _later(delay, fn, *args):
+    t = threading.Timer(delay, fn, args)
+    t.start()
+    return t
+
+
+def _publish_here(sender_id):
+    # Through crud, as this worker's publish endpoint would: the commit wakes waiters
+    with SessionLocal() as s:
+        crud.create_signal(s, s.get(models.User, sender_id), "EURUSD", "buy")
+        s.commit()
+
+
+def _ids(resp):
+    return [s["id"] for s in resp.json()["items"]]
+
+
+# ---------- notifier ----------
+def test_notifier_wait_times_out_and_wakes():
+    n = SignalNotifier()
+
+    async def scenario():
+        assert await n.wait({1}, 0, timeout=0.05) is False
+        asyncio.get_running_loop().call_later(0.05, n.publish, 2, 7)  # another sender: no wake
+        asyncio.get_running_loop().call_later(0.1, n.publish, 1, 8)
+        t = time.monotonic()
+        assert await n.wait({1}, 0, timeout=5) is True
+        assert time.monotonic() - t < 1
+        assert await n.wait({1}, 7, timeout=5) is True  # already newer than after_id
+        assert await n.wait(set(), 0, timeout=0.05) is False
+
+    asyncio.run(scenario())
+    assert n.stats() == {"senders": 2, "waiters": 0}
+
+
+# ---------- long-poll ----------
+def test_long_poll_wakes_on_local_publish(client, issue, db):
+    issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    timer = _later(0.3, _publish_here, sender_id)
+    t = time.monotonic()
+    r = client.get("/signals/latest", headers=recv, params={"since_id": 0, "wait_sec": 10})
+    timer.join()
+    assert r.status_code == 200
+    assert len(_ids(r)) == 1
+    assert time.monotonic() - t < 5
+
+
+def test_long_poll_timeout_requeries_without_cross_worker_bus(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    # Another worker commits while we're parked; nothing wakes us, the re-query finds it
+    timer = _later(0.2, foreign_insert, sender_id)
+    t = time.monotonic()
+    r = client.get("/signals/latest", headers=recv, params={"since_id": 0, "wait_sec": 1})
+    timer.join()
+    assert r.status_code == 200
+    assert len(_ids(r)) == 1
+    assert time.monotonic() - t >= 1
+
+
+def test_conditional_long_poll(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    first = foreign_insert(sender_id)
+    r = client.get("/signals/latest", headers=recv, params={"since_id": first})
+    assert _ids(r) == []
+    etag = r.headers["etag"]
+
+    # Nothing new before the timeout: re-checked, still 304
+    t = time.monotonic()
+    r = client.get("/signals/latest", headers={**recv, "If-None-Match": etag}, params={"since_id": first, "wait_sec": 1})
+    assert r.status_code == 304
+    assert time.monotonic() - t >= 1
+
+    # Another worker publishes while we wait: found on the timeout re-query
+    timer = _later(0.2, foreign_insert, sender_id)
+    r = client.get("/signals/latest", headers={**recv, "If-None-Match": etag}, params={"since_id": first, "wait_sec": 1})
+    timer.join()
+    assert r.status_code == 200
+    assert _ids(r) == [first + 1]
+    assert r.headers["etag"] != etag
+
+
+def test_cross_worker_bus_message_wakes_long_poll(client, issue, db, foreign_insert, monkeypatch):
+    monkeypatch.setattr(fanout.signal_bus, "cross_worker", True)
+    issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+
+    def other_worker():
+        signal_id = foreign_insert(sender_id)
+        fanout._on_remote([(sender_id, signal_id)])  # its bus message arrives
+
+    timer = _later(0.2, other_worker)
+    t = time.monotonic()
+    r = client.get("/signals/latest", headers=recv, params={"since_id": 0, "wait_sec": 10})
+    timer.join()
+    assert len(_ids(r)) == 1
+    assert time.monotonic() - t < 5
+
+
+def test_quota_exhausted_long_poll_waits_out(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    recv = issue("fred", plan="free")  # one signal a day
+    sender_id = crud.resolve_sender_id(db)
+    foreign_insert(sender_id)
+    assert len(_ids(client.get("/signals/latest", headers=recv, params={"since_id": 0}))) == 1
+    foreign_insert(sender_id)
+    t = time.monotonic()
+    r = client.get("/signals/latest", headers=recv, params={"since_id": 1, "wait_sec": 1})
+    assert _ids(r) == []
+    assert time.monotonic() - t >= 1  # parked, not a tight loop
@@ -0,0 +1,128 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import caches
+import crud
+import main
+import metrics
+from database import engine
+
+
+class _Replica:
+    """A second SQLite file standing in for a lagging read replica; sync() catches it up."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.statements = {"primary": 0, "replica": 0}
+        event.listen(engine, "before_cursor_execute", self._count_primary)
+        event.listen(self.engine, "before_cursor_execute", self._count_replica)
+
+    def _count_primary(self, *args):
+        self.statements["primary"] += 1
+
+    def _count_replica(self, *args):
+        self.statements["replica"] += 1
+
+    def sync(self):
+        self.engine.dispose()
+        src, dst = sqlite3.connect(engine.url.database), sqlite3.connect(self.path)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+
+    def reset_counts(self):
+        self.statements.update(primary=0, replica=0)
+
+    def close(self):
+        event.remove(engine, "before_cursor_execute", self._count_primary)
+        event.remove(self.engine, "before_cursor_execute", self._count_replica)
+        self.engine.dispose()
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    r = _Replica(tmp_path / "replica.db")
+    r.sync()
+    monkeypatch.setattr(main, "ReadSessionLocal", r.Session)
+    yield r
+    r.close()
+
+
+def _fallbacks(reason):
+    return metrics.replica_fallbacks._values.get((reason,), 0)
+
+
+def _publish(client, headers, n):
+    return [
+        client.post("/signals/publish", json={"symbol": "EURUSD", "action": "buy"}, headers=headers).json()["id"]
+        for _ in range(n)
+    ]
+
+
+def _poll(client, headers, since_id):
+    return [s["id"] for s in client.get("/signals", headers=headers, params={"since_id": since_id, "limit": 50}).json()]
+
+
+def test_replica_if_caught_up(db, replica, foreign_insert):
+    sender = crud.ensure_user(db, None, "farm_robot", None)
+    db.commit()
+    first = foreign_insert(sender.id)
+    replica.sync()
+    second = foreign_insert(sender.id)
+    with replica.Session() as read_db:
+        assert crud.replica_if_caught_up(db, read_db, first) is read_db
+        lag = _fallbacks("lag")
+        assert crud.replica_if_caught_up(db, read_db, second) is db
+        assert _fallbacks("lag") == lag + 1
+    assert crud.replica_if_caught_up(db, None, second) is db
+    assert crud.replica_if_caught_up(db, db, second) is db
+
+
+def test_deep_poll_reads_replica_when_caught_up(client, issue, replica):
+    robot = issue("farm_robot")
+    bob = issue("bob")
+    ids = _publish(client, robot, 8)
+    replica.sync()
+    replica.reset_counts()
+    assert _poll(client, bob, ids[0]) == ids[1:]
+    assert replica.statements["replica"] > 0
+
+    # Published after the last sync: the replica is behind this worker's watermark
+    ids += _publish(client, robot, 3)
+    lag = _fallbacks("lag")
+    assert _poll(client, bob, ids[0]) == ids[1:]
+    assert _fallbacks("lag") == lag + 1
+
+
+def test_token_missing_on_replica_is_found_on_primary(client, issue, replica):
+    issue("farm_robot")
+    bob = issue("bob")
+    replica.sync()
+    carol = issue("carol")  # not on the replica yet
+    caches.token_cache.clear()
+    replica.reset_counts()
+    assert client.get("/auth/verify", headers=bob).json()["username"] == "bob"
+    assert replica.statements["replica"] > 0
+
+    misses = _fallbacks("token_miss")
+    assert client.get("/auth/verify", headers=carol).json()["username"] == "carol"
+    api_key = carol["Authorization"].split()[1]
+    assert client.post("/validate", json={"api_key": api_key}).json()["ok"] is True
+    assert _fallbacks("token_miss") >= misses + 1
+    assert client.get("/auth/verify", headers={"Authorization": "Bearer nope"}).status_code == 401
+
+
+def test_replica_lookups_do_not_fill_the_token_cache(client, issue, replica):
+    issue("farm_robot")
+    bob = issue("bob")
+    replica.sync()
+    caches.token_cache.clear()
+    client.get("/auth/verify", headers=bob)
+    assert caches.token_cache.get(bob["Authorization"].split()[1]) is None
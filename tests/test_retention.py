@@ -0,0 +1,112 @@
+import gzip
+import json
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import models
+import retention
+from retention import RetentionPolicy
+
+DAYS = 12
+PER_DAY = 5
+
+
+def _count(db, model):
+    db.expire_all()
+    return db.scalar(select(func.count()).select_from(model))
+
+
+@pytest.fixture
+def history(db):
+    """PER_DAY signals (each read twice, and in two inboxes) at noon on each of the last DAYS UTC days."""
+    noon = retention._cutoff(1) + timedelta(hours=12)
+    db.execute(insert(models.User), [
+        {"id": i, "username": f"u{i}", "plan": "free", "is_active": True} for i in (1, 2, 3)
+    ])
+    signals, reads, inbox = [], [], []
+    for age in range(DAYS - 1, -1, -1):
+        for k in range(PER_DAY):
+            sid = len(signals) + 1
+            at = noon - timedelta(days=age, minutes=k)
+            signals.append({"id": sid, "user_id": 1, "symbol": "EURUSD", "action": "buy", "created_at": at})
+            for receiver in (2, 3):
+                reads.append({"signal_id": sid, "receiver_id": receiver, "token_hash": "t", "read_at": at})
+                inbox.append({"receiver_id": receiver, "signal_id": sid})
+    # A signal from the oldest day read today: its read goes with the signal
+    reads.append({"signal_id": 1, "receiver_id": 2, "token_hash": "late", "read_at": noon})
+    db.execute(insert(models.TradeSignal), signals)
+    db.execute(insert(models.SignalRead), reads)
+    db.execute(insert(models.SignalInbox), inbox)
+    db.execute(insert(models.SignalReadCounter), [
+        {"receiver_id": 2, "token_hash": "t", "day": (noon - timedelta(days=age)).date(), "reads": PER_DAY}
+        for age in range(DAYS)
+    ])
+    db.commit()
+    return noon
+
+
+def _run_to_completion(policy):
+    runs, total = 0, 0
+    while True:
+        runs += 1
+        total += policy.run(None)
+        if not policy.more:
+            return runs, total
+
+
+def test_defaults_keep_everything():
+    assert retention.job.interval == 0
+    assert retention.policy.signals_days == 0
+    assert not retention.policy.archiver.configured
+
+
+@pytest.mark.parametrize("archive_dir", ["", "archive", "./archive"])
+def test_refuses_without_absolute_archive_dir(db, history, archive_dir):
+    policy = RetentionPolicy(reads_days=2, signals_days=3, archive_dir=archive_dir, pause=0)
+    assert policy.run(None) == 0
+    assert _count(db, models.TradeSignal) == DAYS * PER_DAY
+
+
+def test_chunked_sweep_archives_then_deletes(db, history, tmp_path):
+    policy = RetentionPolicy(
+        reads_days=2, signals_days=5, inbox_days=3, archive_dir=str(tmp_path),
+        batch=4, max_batches=6, pause=0,
+    )
+    runs, total = _run_to_completion(policy)
+    assert runs > 1  # max_batches ran out and the next run carried on
+
+    kept_signals = 5 * PER_DAY
+    assert _count(db, models.TradeSignal) == kept_signals
+    assert db.scalar(select(func.min(models.TradeSignal.created_at))) >= retention._cutoff(5)
+    assert _count(db, models.SignalRead) == 2 * 2 * PER_DAY
+    assert _count(db, models.SignalInbox) == 3 * 2 * PER_DAY
+    assert _count(db, models.SignalReadCounter) == 2
+
+    archived = {}
+    for path in tmp_path.iterdir():
+        table = path.name.split("-")[0]
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            archived.setdefault(table, []).extend(json.loads(line) for line in fh)
+    assert len(archived["trade_signals"]) == (DAYS - 5) * PER_DAY
+    assert sorted(r["id"] for r in archived["trade_signals"]) == list(range(1, (DAYS - 5) * PER_DAY + 1))
+    assert len(archived["signal_reads"]) == (DAYS - 2) * 2 * PER_DAY + 1  # with the late read
+    assert len(list(tmp_path.glob("trade_signals-*.ndjson.gz"))) == DAYS - 5  # one file per UTC day
+
+    # Nothing left to do: a further run deletes nothing
+    assert policy.run(None) == 0
+
+
+def test_none_deletes_without_archiving(db, history, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    policy = RetentionPolicy(reads_days=2, signals_days=5, archive_dir="none", batch=100, pause=0)
+    _run_to_completion(policy)
+    assert _count(db, models.TradeSignal) == 5 * PER_DAY
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_first_signal_id_at(db, history):
+    assert retention._first_signal_id_at(db, retention._cutoff(DAYS + 1)) == 1
+    assert retention._first_signal_id_at(db, retention._cutoff(3)) == (DAYS - 3) * PER_DAY + 1
+    assert retention._first_signal_id_at(db, history + timedelta(days=1)) == DAYS * PER_DAY + 1
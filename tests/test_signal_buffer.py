@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import crud
+import fanout
+from signal_buffer import SignalRingBuffer, SignalSnapshot, signal_buffer
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def _snap(signal_id, sender_id=1):
+    return SignalSnapshot(
+        id=signal_id, user_id=sender_id, symbol="EURUSD", action="buy", sl_pips=None, tp_pips=None,
+        lot_size=None, details={}, created_at=T0 + timedelta(seconds=signal_id),
+    )
+
+
+def _ids(snaps):
+    return None if snaps is None else [s.id for s in snaps]
+
+
+def _warm_buffer(capacity=4):
+    buf = SignalRingBuffer(capacity)
+    buf.warm({1: [], 2: []})
+    return buf
+
+
+# ---------- SignalRingBuffer ----------
+def test_contiguous_ids_settle_without_a_check():
+    buf = _warm_buffer()
+    buf.add_many([_snap(1), _snap(2, sender_id=2), _snap(3)])
+    assert buf.unsettled() is None
+    assert _ids(buf.query({1, 2}, 0, None, 10)) == [1, 2, 3]
+    assert _ids(buf.query({1}, 1, None, 10)) == [3]
+    assert _ids(buf.latest({1, 2}, 2)) == [2, 3]
+
+
+def test_gap_blocks_answers_until_settled():
+    buf = _warm_buffer()
+    buf.add_many([_snap(1), _snap(3)])  # 2 may be another worker's, its message in flight
+    assert buf.unsettled() == (1, 3)
+    assert buf.query({1}, 0, None, 10) is None
+    assert buf.latest({1}, 10) is None
+    # The caller checked (1, 3] against the DB: id 2 is sender 2's, not buffered yet
+    buf.note_remote([(2, 2)])
+    buf.settle(3)
+    assert buf.unsettled() is None
+    assert _ids(buf.query({1}, 0, None, 10)) == [1, 3]
+    assert buf.query({1, 2}, 0, None, 10) is None  # sender 2's ring is missing id 2
+    buf.fill([_snap(2, sender_id=2)], [2])
+    assert _ids(buf.query({1, 2}, 0, None, 10)) == [1, 2, 3]
+
+
+def test_filled_id_that_no_longer_exists_stops_being_missing():
+    buf = _warm_buffer()
+    buf.note_remote([(1, 1)])
+    assert buf.missing_ids({1}) == [1]
+    buf.fill([], [1])  # deleted before we fetched it
+    assert buf.missing_ids({1}) == []
+    assert _ids(buf.query({1}, 0, None, 10)) == []
+
+
+def test_cursor_older_than_ring_falls_back():
+    buf = _warm_buffer(capacity=2)
+    buf.add_many([_snap(i) for i in range(1, 6)])  # 1..3 evicted
+    assert _ids(buf.query({1}, 3, None, 10)) == [4, 5]
+    assert buf.query({1}, 2, None, 10) is None
+    assert buf.latest({1}, 3) is None
+    # An age cut-off newer than the evicted rows is still covered
+    assert _ids(buf.query({1}, None, T0 + timedelta(seconds=3.5), 10)) == [4, 5]
+    assert buf.query({1}, None, T0 + timedelta(seconds=2.5), 10) is None
+
+
+def test_unknown_sender_before_warm_is_not_trusted():
+    buf = SignalRingBuffer(4)
+    buf.add_many([_snap(1)])
+    assert buf.query({1}, 0, None, 10) is None
+
+
+# ---------- crud with a cross-worker bus ----------
+def test_poll_with_unannounced_foreign_signal(client, issue, db, foreign_insert, monkeypatch):
+    monkeypatch.setattr(fanout.signal_bus, "cross_worker", True)
+    sender = issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+
+    def publish():
+        return client.post("/signals/publish", json={"symbol": "EURUSD", "action": "buy"}, headers=sender).json()["id"]
+
+    def poll(since_id):
+        return [s["id"] for s in client.get("/signals", headers=recv, params={"since_id": since_id}).json()]
+
+    first = publish()
+    assert poll(0) == [first]  # warms the buffer
+    # Another worker commits; its bus message hasn't arrived when our own publish lands
+    foreign = foreign_insert(sender_id)
+    mine = publish()
+    hits = signal_buffer.hits
+    assert poll(first) == [foreign, mine]
+    assert poll(first) == [foreign, mine]
+    assert signal_buffer.hits > hits  # answered from memory once the gap was checked
+
+    # The late bus message for the same id changes nothing
+    fanout._on_remote([(sender_id, foreign)])
+    assert poll(first) == [foreign, mine]
+
+
+def test_deep_cursor_reads_sql(client, issue, db, foreign_insert, monkeypatch):
+    monkeypatch.setattr(fanout.signal_bus, "cross_worker", True)
+    issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    ids = [foreign_insert(sender_id) for _ in range(8)]  # twice the buffer's capacity
+    got = [s["id"] for s in client.get("/signals", headers=recv, params={"since_id": ids[0], "limit": 50}).json()]
+    assert got == ids[1:]
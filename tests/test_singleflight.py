@@ -0,0 +1,125 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+
+import crud
+import models
+import singleflight
+from database import SessionLocal, engine
+from singleflight import SingleFlight
+
+
+def _run_concurrently(n, fn):
+    barrier = threading.Barrier(n)
+    results, errors = [None] * n, [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = fn(i)
+        except Exception as exc:
+            errors[i] = exc
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+# ---------- SingleFlight ----------
+def test_concurrent_callers_share_one_call():
+    sf = SingleFlight(window=0)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "rows"
+
+    results, _ = _run_concurrently(10, lambda i: sf.do("k", slow))
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 9
+    assert {r for r, _ in results} == {"rows"}
+    assert sf.stats()["keys"] == 0  # window 0: nothing kept once done
+
+
+def test_errors_reach_every_waiter_and_are_not_kept():
+    sf = SingleFlight(window=10)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("db down")
+
+    _, errors = _run_concurrently(5, lambda i: sf.do("k", failing))
+    assert len(calls) == 1
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert sf.do("k", lambda: "ok") == ("ok", False)
+
+
+def test_result_reused_within_window_only():
+    sf = SingleFlight(window=0.1)
+    assert sf.do("k", lambda: 1) == (1, False)
+    assert sf.do("k", lambda: 2) == (1, True)
+    assert sf.do("other", lambda: 3) == (3, False)
+    time.sleep(0.15)
+    assert sf.do("k", lambda: 4) == (4, False)
+
+
+# ---------- crud ----------
+@pytest.fixture
+def signal_queries():
+    """Counts SQL signal queries (ring buffer misses that reach trade_signals)."""
+    n = [0]
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().startswith("SELECT") and "trade_signals.user_id IN" in statement:
+            n[0] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield n
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def test_receivers_with_same_query_share_it(db, signal_queries):
+    now = crud.utc_now()
+    db.execute(insert(models.User), [{"username": f"u{i}", "plan": "free", "is_active": True} for i in range(1, 22)])
+    db.execute(insert(models.TradeSignal), [
+        {"user_id": 1, "symbol": "X", "action": "buy", "created_at": now - timedelta(seconds=60 - i)} for i in range(1, 40)
+    ])
+    db.commit()
+    senders = frozenset({1})
+
+    def poll(i):
+        with SessionLocal() as s:
+            receiver = s.get(models.User, i + 2)
+            return [x.id for x in crud.get_signals_for_receiver_since(
+                s, receiver, limit=10, since_id=5, min_created_at=now - timedelta(seconds=50), sender_ids=senders
+            )]
+
+    results, errors = _run_concurrently(20, poll)
+    assert errors == [None] * 20
+    assert results == [list(range(10, 20))] * 20
+    assert signal_queries[0] <= 2  # one per window, at most a straggler's
+    assert singleflight.signal_queries.stats()["shared"] == 20 - signal_queries[0]
+
+
+def test_rounded_age_cutoff_never_shortens_a_page(db):
+    sender = crud.ensure_user(db, None, "farm_robot", None)
+    receiver = crud.ensure_user(db, None, "bob", None)
+    db.commit()
+    base = datetime(2026, 1, 1, 12, 0, 0)
+    for i in range(6):  # three at .100, three at .900 of the same second
+        db.add(models.TradeSignal(user_id=sender.id, symbol="X", action="buy",
+                                  created_at=base + timedelta(milliseconds=100 if i < 3 else 900)))
+    db.commit()
+    got = crud.get_signals_for_receiver_since(
+        db, receiver, limit=3, min_created_at=base + timedelta(milliseconds=500), sender_ids=frozenset({sender.id})
+    )
+    assert [s.id for s in got] == [4, 5, 6]
@@ -0,0 +1,76 @@
+import logging
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+
+import main
+import sqlprofile
+from database import engine
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+HEADER_RE = re.compile(r"count=(\d+); db_ms=[\d.]+; max_ms=[\d.]+; repeated=(\d+)")
+
+
+@pytest.fixture
+def profiled():
+    sqlprofile.install(engine)
+    try:
+        with TestClient(sqlprofile.SQLProfileMiddleware(main.app, header=True)) as c:
+            yield c
+    finally:
+        event.remove(engine, "before_cursor_execute", sqlprofile._before)
+        event.remove(engine, "after_cursor_execute", sqlprofile._after)
+
+
+def _profile(resp):
+    m = HEADER_RE.fullmatch(resp.headers[sqlprofile.HEADER_NAME])
+    assert m, resp.headers[sqlprofile.HEADER_NAME]
+    return int(m.group(1)), int(m.group(2))
+
+
+def test_profile_counts_and_repeats():
+    p = sqlprofile.Profile()
+    p.statements = [("SELECT 1", 0.002), ("SELECT 2", 0.010), ("SELECT 1", 0.001), ("SELECT 1", 0.001)]
+    assert p.count == 4
+    assert p.slowest(1) == [("SELECT 2", 0.010)]
+    assert p.repeated() == [("SELECT 1", 3)]
+    assert p.header() == "count=4; db_ms=14.00; max_ms=10.00; repeated=1"
+
+
+def test_header_reports_each_requests_statements(profiled):
+    assert _profile(profiled.get("/health"))[0] == 0
+    r = profiled.post("/admin/issue_token", json={"username": "bob", "plan": "gold"}, headers=ADMIN)
+    headers = {"Authorization": f"Bearer {r.json()['api_key']}"}
+    assert _profile(r)[0] > 0
+    # Statements from the threadpool (sync handler and dependencies) are charged too
+    count, _ = _profile(profiled.get("/signals", headers=headers))
+    assert count > 0
+    assert sqlprofile.current() is None  # nothing leaks outside a request
+
+
+def test_slow_and_repeated_requests_are_logged(profiled, monkeypatch, caplog):
+    app = FastAPI()
+
+    @app.get("/n-plus-one")
+    def n_plus_one():
+        with engine.connect() as conn:
+            for i in range(sqlprofile.REPEAT):
+                conn.execute(text("SELECT :i"), {"i": i})
+        return {}
+
+    monkeypatch.setattr(sqlprofile, "SLOW_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="sqlprofile"):
+        resp = TestClient(sqlprofile.SQLProfileMiddleware(app, header=True)).get("/n-plus-one")
+    assert _profile(resp) == (sqlprofile.REPEAT, 1)
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(m.startswith("GET /n-plus-one: statement ran %d times (N+1?)" % sqlprofile.REPEAT) for m in messages)
+    assert any(m.startswith("GET /n-plus-one: %d statements" % sqlprofile.REPEAT) for m in messages)
+
+
+def test_websockets_pass_through(profiled):
+    r = profiled.post("/admin/issue_token", json={"username": "bob", "plan": "gold"}, headers=ADMIN)
+    with profiled.websocket_connect(f"/signals/ws?token={r.json()['api_key']}") as ws:
+        assert ws.receive_json() == {"items": []}
@@ -0,0 +1,81 @@
+import json
+import threading
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import crud
+import fanout
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+def _token(headers):
+    return headers["Authorization"].split()[1]
+
+
+def _next_items(ws, max_messages=20):
+    """Read messages until one carries signals; [] keepalives in between are skipped."""
+    for _ in range(max_messages):
+        items = json.loads(ws.receive_text())["items"]
+        if items:
+            return [s["id"] for s in items]
+    raise AssertionError("no signals within %d messages" % max_messages)
+
+
+def _rotate(client, username):
+    r = client.post("/admin/plan", json={"username": username, "plan": "gold", "rotate": True}, headers=ADMIN)
+    assert r.json()["rotated"] is True
+
+
+def _assert_closed(ws):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        for _ in range(20):
+            ws.receive_text()
+    assert exc.value.code == 1008
+
+
+def test_stream_idle_tick_requeries_without_cross_worker_bus(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    with client.websocket_connect(f"/signals/ws?token={_token(recv)}") as ws:
+        # Nothing wakes the notifier for another worker's insert; the keepalive tick's query finds it
+        timer = threading.Timer(0.2, foreign_insert, (sender_id,))
+        timer.start()
+        assert len(_next_items(ws)) == 1
+        timer.join()
+
+
+def test_stream_delivers_backlog_from_since_id(client, issue, db, foreign_insert):
+    issue("farm_robot")
+    recv = issue("bob")
+    sender_id = crud.resolve_sender_id(db)
+    ids = [foreign_insert(sender_id) for _ in range(3)]
+    with client.websocket_connect(f"/signals/ws?token={_token(recv)}&since_id={ids[0]}") as ws:
+        assert _next_items(ws) == ids[1:]
+
+
+def test_stream_ends_after_rotation(client, issue):
+    issue("farm_robot")
+    recv = issue("bob")
+    with client.websocket_connect(f"/signals/ws?token={_token(recv)}") as ws:
+        _rotate(client, "bob")
+        _assert_closed(ws)
+
+
+def test_stream_checks_token_on_ticks_with_cross_worker_bus(client, issue, monkeypatch):
+    monkeypatch.setattr(fanout.signal_bus, "cross_worker", True)
+    issue("farm_robot")
+    recv = issue("bob")
+    with client.websocket_connect(f"/signals/ws?token={_token(recv)}") as ws:
+        assert json.loads(ws.receive_text()) == {"items": []}  # keepalive while idle
+        _rotate(client, "bob")
+        _assert_closed(ws)
+
+
+def test_stream_rejects_bad_token(client):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/signals/ws?token=nope") as ws:
+            ws.receive_text()
+    assert exc.value.code == 1008
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import event, update
+
+import caches
+import crud
+import fanout
+import models
+from database import SessionLocal, engine
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+@pytest.fixture
+def token_queries():
+    n = [0]
+
+    def count(conn, cursor, statement, *args):
+        if "FROM api_tokens" in statement:
+            n[0] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield n
+    event.remove(engine, "before_cursor_execute", count)
+
+
+@pytest.fixture
+def peer():
+    """Another worker on the same bus: records the token invalidations it hears."""
+    heard = []
+    bus = fanout.MemoryBus()
+    bus.start(lambda pairs: None, on_invalidate=heard.extend)
+    bus.heard = heard
+    yield bus
+    bus.stop()
+
+
+def _token(headers):
+    return headers["Authorization"].split()[1]
+
+
+def test_verification_is_cached(client, issue, db, token_queries):
+    bob = _token(issue("bob"))
+    caches.token_cache.clear()
+    assert crud.verify_token(db, bob)[0]
+    before = token_queries[0]
+    assert crud.verify_token(db, bob)[0]
+    assert token_queries[0] == before
+    assert not crud.verify_token(db, "nope")[0]
+    assert crud.verify_token(db, "nope") == (False, None, {"reason": "invalid_or_expired_token"})
+
+
+def test_rotation_revokes_cached_token_here(client, issue):
+    bob = issue("bob")
+    assert client.get("/auth/verify", headers=bob).status_code == 200
+    r = client.post("/admin/plan", json={"username": "bob", "plan": "gold", "rotate": True}, headers=ADMIN)
+    assert client.get("/auth/verify", headers=bob).status_code == 401
+    assert client.get("/auth/verify", headers={"Authorization": f"Bearer {r.json()['api_key']}"}).status_code == 200
+
+
+def test_rotation_reaches_other_workers(client, issue, db, peer, monkeypatch):
+    monkeypatch.setattr(fanout.signal_bus, "cross_worker", True)
+    issue("bob")
+    client.post("/admin/plan", json={"username": "bob", "plan": "gold", "rotate": True}, headers=ADMIN)
+    assert set(peer.heard) == {crud.get_user_by_identity(db, None, "bob", None).id}
+
+
+def test_invalidation_from_another_worker_drops_cached_token(client, issue, db, peer):
+    bob = issue("bob")
+    assert client.get("/auth/verify", headers=bob).status_code == 200
+    user_id = crud.get_user_by_identity(db, None, "bob", None).id
+    # The other worker revoked it: the cached verification here is stale until it hears
+    with SessionLocal() as s:
+        s.execute(update(models.APIToken).where(models.APIToken.user_id == user_id).values(is_active=False))
+        s.commit()
+    assert client.get("/auth/verify", headers=bob).status_code == 200
+    peer.invalidate_users([user_id])
+    assert client.get("/auth/verify", headers=bob).status_code == 401
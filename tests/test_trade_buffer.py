@@ -0,0 +1,119 @@
+import json
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import crud
+import models
+from trade_buffer import TradeWriteBuffer
+
+
+@pytest.fixture
+def receiver(db):
+    user = crud.ensure_user(db, None, "bob", None)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def outage(monkeypatch):
+    """outage["n"] = k makes the next k inserts fail as if the database were unreachable."""
+    state = {"n": 0, "calls": 0}
+    real = crud.insert_trade_records
+
+    def insert(db, rows):
+        state["calls"] += 1
+        if state["n"] > 0:
+            state["n"] -= 1
+            raise OperationalError("INSERT INTO trade_records", {}, Exception("connection refused"))
+        real(db, rows)
+
+    monkeypatch.setattr(crud, "insert_trade_records", insert)
+    return state
+
+
+def _rows(receiver, n, bad=()):
+    # symbol is NOT NULL: a None symbol is a row the database rejects
+    return [crud.trade_record_row(receiver, None if i in bad else "EURUSD", "buy", {"i": i}) for i in range(n)]
+
+
+def _stored(db):
+    db.expire_all()
+    return sorted(r.details["i"] for r in db.query(models.TradeRecord))
+
+
+def _dead_letters(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_rejected_rows_are_isolated_and_dead_lettered(db, receiver, tmp_path):
+    path = tmp_path / "dead.ndjson"
+    buf = TradeWriteBuffer(maxsize=100, batch=40, interval=0.05, dead_letter_path=str(path))
+    for row in _rows(receiver, 40, bad={3, 27}):
+        assert buf.submit(row)
+    buf.stop()  # never started: drains synchronously
+    assert _stored(db) == [i for i in range(40) if i not in (3, 27)]
+    letters = _dead_letters(path)
+    assert sorted(d["row"]["details"]["i"] for d in letters) == [3, 27]
+    assert all("NOT NULL" in d["error"] for d in letters)
+    assert buf.stats()["dead_lettered"] == 2
+
+
+def test_outage_is_retried_in_the_background(db, receiver, outage):
+    buf = TradeWriteBuffer(maxsize=100, batch=10, interval=0.05, retry_sec=0.05)
+    buf.start()
+    try:
+        outage["n"] = 3
+        for row in _rows(receiver, 10):
+            buf.submit(row)
+        deadline = time.monotonic() + 5
+        while buf.stats()["written"] < 10 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        buf.stop()
+    assert _stored(db) == list(range(10))
+    assert outage["calls"] >= 4
+    assert buf.stats()["dead_lettered"] == 0
+
+
+def test_stop_gives_up_on_a_dead_database(db, receiver, outage, tmp_path):
+    path = tmp_path / "dead.ndjson"
+    buf = TradeWriteBuffer(maxsize=100, batch=10, interval=0.05, retry_sec=0.05,
+                           dead_letter_path=str(path), stop_retries=2, stop_timeout=5)
+    buf.start()
+    outage["n"] = 1000
+    for row in _rows(receiver, 5):
+        buf.submit(row)
+    t = time.monotonic()
+    buf.stop()
+    assert time.monotonic() - t < 5
+    assert _stored(db) == []
+    assert sorted(d["row"]["details"]["i"] for d in _dead_letters(path)) == list(range(5))
+    assert not buf.submit(_rows(receiver, 1)[0])  # stopped: refuses new rows
+
+
+def test_full_queue_pushes_back(receiver):
+    buf = TradeWriteBuffer(maxsize=2, batch=10, interval=1)
+    assert buf.submit(_rows(receiver, 1)[0])
+    assert buf.submit(_rows(receiver, 1)[0])
+    assert not buf.submit(_rows(receiver, 1)[0])
+    assert buf.stats()["rejected"] == 1
+    buf.stop()
+
+
+def test_without_dead_letter_path_rows_go_to_the_log(db, receiver, caplog, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    buf = TradeWriteBuffer(maxsize=10, batch=10, interval=0)
+    assert buf.dead_letter_path is None
+    buf.submit(_rows(receiver, 1, bad={0})[0])
+    buf.stop()
+    assert any("dropped 1 trade records" in r.getMessage() for r in caplog.records)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_relative_dead_letter_path_is_resolved_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    buf = TradeWriteBuffer(maxsize=1, batch=1, interval=0, dead_letter_path="dead.ndjson")
+    assert buf.dead_letter_path == str(tmp_path / "dead.ndjson")
@@ -0,0 +1,145 @@
+import json
+import socket
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import crud
+import models
+from wp_outbox import WPCallbackDispatcher
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+class _StubWordPress:
+    """Local HTTP endpoint recording callback POSTs; answers with `statuses` in turn, then 200."""
+
+    def __init__(self):
+        self.received = []
+        self.statuses = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.received.append((body, self.headers.get("X-Callback-Key")))
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                self.send_response(status)
+                self.end_headers()
+                self.wfile.write(b"ok" if status < 300 else b"boom")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/wp-json/callback"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def wordpress(monkeypatch):
+    stub = _StubWordPress()
+    monkeypatch.setenv("WP_CALLBACK_URL", stub.url)
+    monkeypatch.setenv("WP_CALLBACK_KEY", "secret")
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def dispatcher(wordpress):
+    d = WPCallbackDispatcher(url=wordpress.url, key="secret", backoff_base=0, max_attempts=2)
+    yield d
+    d.close()
+
+
+def _issue(client, username, rotate=False):
+    r = client.post("/admin/plan", json={"username": username, "plan": "silver", "rotate": rotate}, headers=ADMIN)
+    assert r.status_code == 200, r.text
+    return r.json()["api_key"]
+
+
+def _rows(db):
+    db.expire_all()
+    return db.query(models.WPCallback).order_by(models.WPCallback.id).all()
+
+
+def test_callback_delivered_after_commit(client, db, wordpress, dispatcher):
+    api_key = _issue(client, "bob")
+    assert [r.status for r in _rows(db)] == ["pending"]
+    assert dispatcher.deliver_due(db) == 1
+    db.commit()
+    (payload, key), = wordpress.received
+    assert key == "secret"
+    assert payload["username"] == "bob" and payload["plan"] == "silver" and payload["api_key"] == api_key
+    row, = _rows(db)
+    assert (row.status, row.attempts, row.last_status) == ("sent", 1, 200)
+    assert row.sent_at is not None
+    assert dispatcher.deliver_due(db) == 0  # nothing due twice
+
+
+def test_newer_change_supersedes_pending_callback(client, db, wordpress, dispatcher):
+    _issue(client, "bob")
+    api_key = _issue(client, "bob", rotate=True)
+    assert [r.status for r in _rows(db)] == ["superseded", "pending"]
+    dispatcher.deliver_due(db)
+    db.commit()
+    assert [body["api_key"] for body, _ in wordpress.received] == [api_key]
+
+
+def test_failures_retry_then_give_up(client, db, wordpress, dispatcher):
+    _issue(client, "bob")
+    wordpress.statuses = [500, 503]
+    assert dispatcher.deliver_due(db) == 0
+    db.commit()
+    row, = _rows(db)
+    assert (row.status, row.attempts, row.last_status, row.last_error) == ("pending", 1, 500, "boom")
+    assert dispatcher.deliver_due(db) == 0
+    db.commit()
+    row, = _rows(db)
+    assert (row.status, row.attempts, row.last_status) == ("failed", 2, 503)
+
+
+def test_unreachable_endpoint_is_recorded(client, db, wordpress):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]  # nothing listens here once closed
+    d = WPCallbackDispatcher(url=f"http://127.0.0.1:{port}/", key="secret", backoff_base=60, timeout=1)
+    try:
+        _issue(client, "bob")
+        assert d.deliver_due(db) == 0
+        db.commit()
+    finally:
+        d.close()
+    row, = _rows(db)
+    assert row.status == "pending" and row.last_status is None
+    assert row.last_error.startswith("ConnectionError")
+    assert row.next_attempt_at > crud.utc_now() + timedelta(seconds=20)  # backed off
+
+
+def test_finished_rows_expire(client, db, wordpress, dispatcher):
+    _issue(client, "bob")
+    dispatcher.deliver_due(db)
+    db.commit()
+    row, = _rows(db)
+    row.next_attempt_at = crud.utc_now() - timedelta(days=dispatcher.retain_days + 1)
+    db.commit()
+    dispatcher.deliver_due(db)
+    db.commit()
+    assert _rows(db) == []
+
+
+def test_unconfigured_dispatcher_does_nothing(client, db, wordpress):
+    _issue(client, "bob")
+    d = WPCallbackDispatcher(url="", key="")
+    try:
+        assert not d.enabled
+        assert d.deliver_due(db) == 0
+    finally:
+        d.close()
+    assert wordpress.received == []
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+from database import SessionLocal
+import crud
+
+log = logging.getLogger("trade_buffer")
+
+
+class TradeWriteBuffer:
+    """
+    Write-behind buffer for TradeRecord rows (TRADE_WRITE_BEHIND=1).
+
+    Handlers submit() a validated row and answer immediately; one background
+    thread group-commits rows in a single INSERT per batch, once `batch` rows
+    are waiting or `interval` seconds after the first one arrived. The queue is
+    bounded: submit() returns False when it is full (callers answer 503) and a
+    flush that can't reach the database keeps its rows and retries, so a slow
+    database turns into backpressure rather than memory growth. A batch the
+    database rejects is split until the offending rows are isolated; those are
+    logged (with the rows themselves unless `dead_letter_path` is set, then
+    appended there as NDJSON) so the rest still commit.
+    stop() drains everything queued, giving up on connection errors after
+    `stop_retries` attempts per batch (those rows are dead-lettered too).
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        batch: int,
+        interval: float,
+        retry_sec: float = 1.0,
+        dead_letter_path: Optional[str] = None,
+        stop_retries: int = 3,
+        stop_timeout: float = 30.0,
+    ):
+        self.batch = max(1, int(batch))
+        self.interval = max(0.0, float(interval))
+        self.retry_sec = retry_sec
+        # Resolved once, so the file doesn't move with the process's working directory
+        self.dead_letter_path = os.path.abspath(dead_letter_path) if dead_letter_path else None
+        self.stop_retries = max(1, int(stop_retries))
+        self.stop_timeout = stop_timeout
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.flushes = 0
+        self.dead_lettered = 0
+
+    def submit(self, row: Dict[str, Any]) -> bool:
+        if self._stop.is_set():
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        db = SessionLocal()
+        try:
+            crud.insert_trade_records(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.written += len(rows)
+        self.flushes += 1
+
+    def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Write rows in one transaction. Connection errors retry the same batch (at
+        most stop_retries times once stopping); any other error splits the batch in
+        halves, down to single rows, which are dead-lettered if still rejected.
+        """
+        attempts = 0
+        while True:
+            try:
+                self._write(rows)
+                return
+            except Exception as exc:
+                error = exc
+            if not _transient(error):
+                break
+            attempts += 1
+            if self._stop.is_set() and attempts >= self.stop_retries:
+                log.error("flush of %s trade records failed %s times while stopping: %s", len(rows), attempts, error)
+                self._dead_letter(rows, error)
+                return
+            log.warning("flush of %s trade records failed (%s); retrying in %.1fs", len(rows), error, self.retry_sec)
+            time.sleep(self.retry_sec)
+        if len(rows) == 1:
+            log.error("trade record rejected by the database: %s", error)
+            self._dead_letter(rows, error)
+            return
+        mid = len(rows) // 2
+        self._flush(rows[:mid])
+        self._flush(rows[mid:])
+
+    def _dead_letter(self, rows: List[Dict[str, Any]], error: BaseException) -> None:
+        self.dead_lettered += len(rows)
+        if not self.dead_letter_path:
+            log.error("dropped %s trade records: %s", len(rows), rows)
+            return
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as fh:
+                for r in rows:
+                    fh.write(json.dumps({"error": str(error).splitlines()[0][:500], "row": r}, default=str, ensure_ascii=False) + "\n")
+        except OSError:
+            log.exception("writing %s trade records to %s failed: %s", len(rows), self.dead_letter_path, rows)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        try:
+            rows = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.interval
+        while len(rows) < self.batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stop.is_set():
+                    rows.append(self._queue.get_nowait())
+                else:
+                    rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def _loop(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            rows = self._take_batch()
+            if rows:
+                self._flush(rows)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        log.info("trade write-behind: rejected records go to %s", self.dead_letter_path or "the log only")
+        self._thread = threading.Thread(target=self._loop, name="trade-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Refuse new rows, then block (up to stop_timeout) until everything queued is written."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.stop_timeout)
+            if self._thread.is_alive():
+                log.error("trade write-behind still flushing after %.0fs; %s records queued", self.stop_timeout, self._queue.qsize())
+                return
+            self._thread = None
+        if not self._queue.empty():  # never started: write synchronously
+            rows = []
+            while not self._queue.empty():
+                rows.append(self._queue.get_nowait())
+            self._flush(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "maxsize": self._queue.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "flushes": self.flushes,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+def _transient(exc: BaseException) -> bool:
+    # The database (or the pool) is unreachable right now; the same rows will go through later
+    if isinstance(exc, DBAPIError) and exc.connection_invalidated:
+        return True
+    return isinstance(exc, (OperationalError, InterfaceError, PoolTimeoutError))
+
+
+WRITE_BEHIND = os.getenv("TRADE_WRITE_BEHIND", "").strip().lower() in ("1", "true", "yes", "on")
+
+trade_buffer = TradeWriteBuffer(
+    maxsize=int(os.getenv("TRADE_BUFFER_MAXSIZE", "10000")),
+    batch=int(os.getenv("TRADE_BUFFER_BATCH", "500")),
+    interval=float(os.getenv("TRADE_BUFFER_FLUSH_SEC", "1.0")),
+    dead_letter_path=os.getenv("TRADE_BUFFER_DEAD_LETTER", ""),
+    stop_retries=int(os.getenv("TRADE_BUFFER_STOP_RETRIES", "3")),
+    stop_timeout=float(os.getenv("TRADE_BUFFER_STOP_TIMEOUT_SEC", "30")),
+)
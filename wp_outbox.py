@@ -0,0 +1,138 @@
+import os
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from models import WPCallback
+from sweeper import PeriodicJob
+
+log = logging.getLogger("wp_outbox")
+
+# Delivery of WordPress callbacks queued by crud.enqueue_wp_callback. Rows are only
+# marked sent after a 2xx, so delivery is at-least-once: a crash between the POST
+# and the commit re-sends the same payload (it carries the full current state).
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class WPCallbackDispatcher:
+    """
+    Claims due outbox rows in batches, POSTs them concurrently over one pooled
+    keep-alive session, and records each outcome. Failures are retried with
+    exponential backoff (plus jitter) until max_attempts, then marked failed.
+    deliver_due(db) is the PeriodicJob body; call it directly in tests.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        key: Optional[str] = None,
+        batch: int = int(os.getenv("WP_OUTBOX_BATCH", "50")),
+        concurrency: int = int(os.getenv("WP_OUTBOX_CONCURRENCY", "4")),
+        max_attempts: int = int(os.getenv("WP_OUTBOX_MAX_ATTEMPTS", "8")),
+        backoff_base: float = float(os.getenv("WP_OUTBOX_BACKOFF_SEC", "5")),
+        backoff_max: float = float(os.getenv("WP_OUTBOX_BACKOFF_MAX_SEC", "3600")),
+        timeout: float = 3.0,
+        retain_days: int = int(os.getenv("WP_OUTBOX_RETAIN_DAYS", "7")),
+    ):
+        self.url = url if url is not None else os.getenv("WP_CALLBACK_URL")
+        self.key = key if key is not None else os.getenv("WP_CALLBACK_KEY")
+        self.batch = max(1, batch)
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.retain_days = retain_days
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="wp-callback")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url and self.key)
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _post(self, payload: Dict[str, Any]) -> Tuple[bool, Optional[int], Optional[str]]:
+        try:
+            r = self.session.post(
+                self.url, json=payload, headers={"X-Callback-Key": self.key}, timeout=self.timeout
+            )
+        except Exception as e:
+            return False, None, f"{e.__class__.__name__}: {e}"[:255]
+        if 200 <= r.status_code < 300:
+            return True, r.status_code, None
+        return False, r.status_code, (r.text or "")[:255] or None
+
+    def deliver_due(self, db: Session) -> int:
+        """Deliver one batch of due callbacks; returns how many were sent."""
+        if not self.enabled:
+            return 0
+        now = _utc_now()
+        rows = (
+            db.query(WPCallback)
+            .filter(WPCallback.status == "pending", WPCallback.next_attempt_at <= now)
+            .order_by(WPCallback.id)
+            .limit(self.batch)
+            .all()
+        )
+        sent = 0
+        if rows:
+            results = list(self._pool.map(self._post, [r.payload for r in rows]))
+            now = _utc_now()
+            for row, (ok, status, error) in zip(rows, results):
+                row.attempts += 1
+                row.last_status = status
+                row.last_error = error
+                if ok:
+                    row.status = "sent"
+                    row.sent_at = now
+                    sent += 1
+                elif row.attempts >= self.max_attempts:
+                    row.status = "failed"
+                    log.warning("WP callback %s failed for good after %s attempts: %s", row.id, row.attempts, error or status)
+                else:
+                    row.next_attempt_at = now + timedelta(seconds=self.backoff(row.attempts))
+            if sent < len(rows):
+                log.warning("WP callbacks: %s of %s attempts failed", len(rows) - sent, len(rows))
+        if self.retain_days > 0:
+            # next_attempt_at of a finished row is when it was last due; uses ix_wp_callback_due
+            db.execute(
+                delete(WPCallback).where(
+                    WPCallback.status.in_(("sent", "failed", "superseded")),
+                    WPCallback.next_attempt_at < now - timedelta(days=self.retain_days),
+                )
+            )
+        return sent
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self.session.close()
+
+
+dispatcher = WPCallbackDispatcher()
+
+# Polls for due retries; crud.enqueue_wp_callback kicks it right after commit
+job = PeriodicJob(
+    "wp_callbacks",
+    interval=float(os.getenv("WP_OUTBOX_INTERVAL_SEC", "5")),
+    fn=dispatcher.deliver_due,
+)
+
+
+def kick() -> None:
+    job.kick()